@@ -29,15 +29,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'mailing.profiling.QueryProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.middleware.cache.UpdateCacheMiddleware',  # Кеширование
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'django.middleware.cache.FetchFromCacheMiddleware',  # Кеширование
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -98,19 +97,84 @@ LOGIN_URL = 'users:login'
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
-# Кеширование
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-    }
+# Рассылки
+MAILING_BATCH_SIZE = int(os.getenv('MAILING_BATCH_SIZE', 100))  # Писем в одной пачке
+MAILING_ATTEMPT_BUFFER_SIZE = int(os.getenv('MAILING_ATTEMPT_BUFFER_SIZE', 500))  # Попыток в одной вставке
+MAILING_ATTEMPT_FLUSH_INTERVAL = float(os.getenv('MAILING_ATTEMPT_FLUSH_INTERVAL', 2))  # Секунд между записями
+MAILING_LEASE_SECONDS = int(os.getenv('MAILING_LEASE_SECONDS', 300))  # Время аренды пачки очереди
+MAILING_SCHEDULER_POLL_INTERVAL = float(os.getenv('MAILING_SCHEDULER_POLL_INTERVAL', 5))  # Секунд
+# Сколько секунд перед отметкой updated_at планировщик перечитывает: дольше самой долгой транзакции
+MAILING_SCHEDULER_OVERLAP_SECONDS = float(os.getenv('MAILING_SCHEDULER_OVERLAP_SECONDS', 60))
+MAILING_CONCURRENCY = int(os.getenv('MAILING_CONCURRENCY', 16))  # SMTP-сессий для движка async
+# Ограничение скорости на почтовый домен: писем в секунду (0 — без ограничения) и писем подряд.
+# Отдельные домены задаются строкой вида "gmail.com=5,mail.ru=20"
+MAILING_DOMAIN_RATE = float(os.getenv('MAILING_DOMAIN_RATE', 10))
+MAILING_DOMAIN_BURST = int(os.getenv('MAILING_DOMAIN_BURST', 10))
+MAILING_DOMAIN_RATES = {
+    domain.strip().lower(): float(rate)
+    for domain, rate in (
+        item.split('=') for item in os.getenv('MAILING_DOMAIN_RATES', '').split(',') if item.strip()
+    )
 }
+# Повторы после временных ошибок: задержка растет от BASE до MAX секунд, не больше MAX_ATTEMPTS
+# попыток и только до окончания рассылки; повторы занимают до RETRY_SHARE пачки
+MAILING_RETRY_BASE_SECONDS = float(os.getenv('MAILING_RETRY_BASE_SECONDS', 60))
+MAILING_RETRY_MAX_SECONDS = float(os.getenv('MAILING_RETRY_MAX_SECONDS', 3600))
+MAILING_RETRY_MAX_ATTEMPTS = int(os.getenv('MAILING_RETRY_MAX_ATTEMPTS', 5))
+MAILING_RETRY_SHARE = float(os.getenv('MAILING_RETRY_SHARE', 0.1))
+# Приемник метрик отправки: путь к классу, например mailing.metrics.MemorySink; пусто — метрики выключены
+MAILING_METRICS_SINK = os.getenv('MAILING_METRICS_SINK', '')
+# Адрес HTTP-сервера метрик run_scheduler: метрики без авторизации, поэтому по умолчанию только localhost
+MAILING_METRICS_HOST = os.getenv('MAILING_METRICS_HOST', '127.0.0.1')
+
+# Кеширование: общий для всех процессов кеш, иначе сброс версий в одном
+# процессе не виден другим. Redis, если задан REDIS_URL, иначе файловый кеш
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': BASE_DIR / 'cache',
+            # По умолчанию 300 записей: фрагменты и версии пользователей вытеснялись бы
+            # постоянно. Каждая запись перебирает каталог, поэтому предел не безграничный
+            'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 20_000))},
+        }
+    }
 
-# Кеширование страниц на 15 минут
-CACHE_MIDDLEWARE_ALIAS = 'default'
-CACHE_MIDDLEWARE_SECONDS = 900  # 15 минут
-CACHE_MIDDLEWARE_KEY_PREFIX = 'mailing_service'
-
+# Профилирование запросов к базе: заголовки X-Query-Count и X-Query-Time, журнал последних
+# QUERY_PROFILE_LOG_SIZE ответов с QUERY_PROFILE_SLOWEST самыми медленными запросами каждого
+QUERY_PROFILING = os.getenv('QUERY_PROFILING', str(DEBUG)) == 'True'
+QUERY_PROFILE_LOG_SIZE = int(os.getenv('QUERY_PROFILE_LOG_SIZE', 200))
+QUERY_PROFILE_SLOWEST = int(os.getenv('QUERY_PROFILE_SLOWEST', 5))
+
+# Главная: кеш показателей пользователя, ключ включает версии его рассылок и клиентов
+DASHBOARD_CACHE_SECONDS = 300
+DASHBOARD_RECENT_MAILINGS = 10
+
+# Фрагменты списков и карточек, ключ включает пользователя и версии его данных
+FRAGMENT_CACHE_SECONDS = 900
+
+# Списки клиентов, сообщений и рассылок: строк на странице
+LIST_PAGE_SIZE = 50
+# Подсказки получателей в форме рассылки: клиентов на странице
+AUTOCOMPLETE_PAGE_SIZE = 20
+# Полнотекстовый поиск по клиентам и сообщениям: результатов каждого вида на странице
+SEARCH_PAGE_SIZE = 20
+
+# Статистика попыток по сводкам: сколько последних часов и суток показывать
+ATTEMPT_STATS_HOURS = 48
+ATTEMPT_STATS_DAYS = 30
+
+# Архив журнала попыток: попытки старше ATTEMPT_RETENTION_DAYS суток переносятся командой
+# archive_attempts в сжатые файлы JSONL по суткам в ATTEMPT_ARCHIVE_DIR
+ATTEMPT_RETENTION_DAYS = int(os.getenv('ATTEMPT_RETENTION_DAYS', 90))
+ATTEMPT_ARCHIVE_DIR = Path(os.getenv('ATTEMPT_ARCHIVE_DIR', BASE_DIR / 'archive'))
 
 # Static files (CSS, JavaScript, Images)
 STATIC_URL = 'static/'
@@ -0,0 +1,101 @@
+import gzip
+import json
+import os
+from collections import Counter
+from datetime import datetime
+from itertools import groupby
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import AttemptArchive, MailingAttempt
+from .rollups import bucket_start
+
+CHUNK_SIZE = 10_000
+# id в одном DELETE: меньше предела параметров запроса у старых SQLite
+DELETE_BATCH_SIZE = 900
+# Поля строки архива: владелец, тема и email сохраняются на момент переноса,
+# поэтому архив читается без рассылок и клиентов, которых уже может не быть
+COLUMNS = ('id', 'owner_id', 'mailing_id', 'subject', 'client_id', 'email', 'attempt_time', 'status', 'server_response')
+FIELDS = (
+    'id', 'mailing__owner_id', 'mailing_id', 'mailing__message__subject', 'client_id', 'client__email',
+    'attempt_time', 'status', 'server_response',
+)
+ATTEMPT_TIME = COLUMNS.index('attempt_time')
+
+
+def _write_segment(directory, day, rows):
+    """Запись попыток одних суток в сжатый файл JSONL, возвращает путь относительно directory"""
+    relative = Path(f'{day:%Y}', f'{day:%m}', f'attempts-{day:%Y-%m-%d}-{min(row[0] for row in rows)}.jsonl.gz')
+    path = directory / relative
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Файл появляется под своим именем только записанным целиком и сброшенным на диск
+    temporary = path.with_name(path.name + '.tmp')
+    with open(temporary, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as compressed:
+            for row in rows:
+                line = json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False, default=datetime.isoformat)
+                compressed.write(line.encode() + b'\n')
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(temporary, path)
+    return str(relative)
+
+
+def archive(before, chunk_size=CHUNK_SIZE, directory=None):
+    """Перенос попыток раньше суток, в которые попадает before, в архив; возвращает число
+    перенесенных попыток по владельцам"""
+    # Граница — начало суток: сводки за часы и сутки до нее целиком относятся к архиву,
+    # и rollups.rebuild их не пересчитывает. Каждая пачка — одна транзакция: файлы
+    # записываются и сбрасываются на диск до удаления попыток. При сбое файлы без строки
+    # в AttemptArchive не читаются, а пачка переносится заново при следующем запуске
+    cutoff = bucket_start(before, 'day')
+    directory = Path(directory or settings.ATTEMPT_ARCHIVE_DIR)
+    moved = Counter()
+    while True:
+        with transaction.atomic():
+            rows = list(
+                MailingAttempt.objects.filter(attempt_time__lt=cutoff).order_by('attempt_time', 'id')
+                .values_list(*FIELDS)[:chunk_size]
+            )
+            if not rows:
+                return moved
+            for day, day_rows in groupby(rows, key=lambda row: timezone.localdate(row[ATTEMPT_TIME])):
+                day_rows = list(day_rows)
+                AttemptArchive.objects.create(
+                    day=day,
+                    path=_write_segment(directory, day, day_rows),
+                    first_id=min(row[0] for row in day_rows),
+                    last_id=max(row[0] for row in day_rows),
+                    rows=len(day_rows),
+                )
+            # Удаляются ровно записанные строки: попытка с более ранним временем, зафиксированная
+            # после чтения пачки, в файлы не попала и уйдет со следующей пачкой
+            ids = [row[0] for row in rows]
+            for start in range(0, len(ids), DELETE_BATCH_SIZE):
+                MailingAttempt.objects.filter(id__in=ids[start:start + DELETE_BATCH_SIZE]).delete()
+        moved.update(row[1] for row in rows)
+
+
+def read_archive(owner=None, mailing=None, start=None, end=None, directory=None):
+    """Поток попыток из архива по порядку времени: словари с полями COLUMNS, attempt_time — datetime"""
+    directory = Path(directory or settings.ATTEMPT_ARCHIVE_DIR)
+    segments = AttemptArchive.objects.all()
+    if start is not None:
+        segments = segments.filter(day__gte=timezone.localdate(start))
+    if end is not None:
+        segments = segments.filter(day__lte=timezone.localdate(end))
+    for path in segments.values_list('path', flat=True).iterator():
+        with gzip.open(directory / path, 'rt', encoding='utf-8') as lines:
+            for line in lines:
+                row = json.loads(line)
+                if owner is not None and row['owner_id'] != owner.pk:
+                    continue
+                if mailing is not None and row['mailing_id'] != mailing.pk:
+                    continue
+                row['attempt_time'] = datetime.fromisoformat(row['attempt_time'])
+                if (start is not None and row['attempt_time'] < start) or (end is not None and row['attempt_time'] >= end):
+                    continue
+                yield row
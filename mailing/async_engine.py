@@ -0,0 +1,92 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+from .sending import BatchSender, batched
+
+# Как часто пачка прерывается, чтобы продлить аренду своих строк очереди
+HEARTBEAT_SECONDS = 1
+
+
+class AsyncDeliveryEngine:
+    """Параллельная отправка: asyncio держит до concurrency SMTP-сессий одновременно"""
+
+    # Каждая сессия — отдельный BatchSender со своим соединением. Обмен с сервером
+    # идет в пуле потоков, цикл событий раздает письма свободным сессиям.
+
+    def __init__(self, concurrency=None, batch_size=None, connection_factory=None, throttle=None):
+        self.concurrency = concurrency or settings.MAILING_CONCURRENCY
+        # Пачка меньше числа сессий оставила бы часть сессий без работы
+        self.batch_size = max(batch_size or settings.MAILING_BATCH_SIZE, self.concurrency)
+        self.connection_factory = connection_factory or (lambda: get_connection(fail_silently=False))
+        self.throttle = throttle
+        self.sessions = []
+        self._loop = None
+        self._executor = None
+        self._pool = None
+
+    @property
+    def latencies(self):
+        return [latency for session in self.sessions for latency in session.latencies]
+
+    @property
+    def reconnects(self):
+        return sum(session.reconnects for session in self.sessions)
+
+    def __enter__(self):
+        self._loop = asyncio.new_event_loop()
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='mailing-send')
+        self._pool = asyncio.Queue()
+        self.sessions = [
+            BatchSender(batch_size=self.batch_size, connection=self.connection_factory())
+            for _ in range(self.concurrency)
+        ]
+        for session in self.sessions:
+            self._pool.put_nowait(session)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for session in self.sessions:
+            session.close()
+        self._executor.shutdown()
+        self._loop.close()
+
+    @staticmethod
+    def _deliver(session, message):
+        # Соединение открывается при первом использовании сессии
+        return session.open().send_message(message)
+
+    async def _send_one(self, message):
+        if self.throttle is not None:
+            # Письмо ждет очереди своего домена, не занимая сессию
+            delay = self.throttle.reserve(message.to[0]) - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        session = await self._pool.get()
+        try:
+            return await self._loop.run_in_executor(self._executor, self._deliver, session, message)
+        finally:
+            self._pool.put_nowait(session)
+
+    async def _send_batch(self, messages):
+        return await asyncio.gather(*(self._send_one(message) for message in messages))
+
+    def send_batch(self, messages, heartbeat=None):
+        """Параллельная отправка пачки, результаты возвращаются в порядке писем"""
+        if heartbeat is None:
+            return self._loop.run_until_complete(self._send_batch(messages))
+        # Цикл событий отпускается каждые HEARTBEAT_SECONDS: heartbeat обращается к базе
+        # и вызывается вне цикла, где синхронный ORM разрешен
+        batch = self._loop.create_task(self._send_batch(messages))
+        while not batch.done():
+            heartbeat()
+            self._loop.run_until_complete(asyncio.wait([batch], timeout=HEARTBEAT_SECONDS))
+        return batch.result()
+
+    def send(self, messages):
+        """Разбивает поток писем на пачки по batch_size и отдает результаты каждой пачки"""
+        for batch in batched(messages, self.batch_size):
+            yield self.send_batch(batch)
@@ -0,0 +1,46 @@
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from .cache import bump_mailing_owners
+from .models import MailingAttempt
+from .rollups import add_attempts
+
+
+class AttemptWriter:
+    """Буферизованная запись попыток рассылки через bulk_create"""
+
+    def __init__(self, buffer_size=None, flush_interval=None):
+        self.buffer_size = buffer_size or settings.MAILING_ATTEMPT_BUFFER_SIZE
+        if flush_interval is None:
+            flush_interval = settings.MAILING_ATTEMPT_FLUSH_INTERVAL
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.written = 0
+        self._last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Сбрасываем буфер и при ошибке, чтобы не потерять уже сделанные попытки
+        self.flush()
+
+    def add(self, **fields):
+        """Добавление попытки в буфер, при переполнении или по таймеру буфер сбрасывается"""
+        self.buffer.append(MailingAttempt(**fields))
+        overdue = time.monotonic() - self._last_flush >= self.flush_interval
+        if len(self.buffer) >= self.buffer_size or overdue:
+            self.flush()
+
+    def flush(self):
+        """Запись накопленных попыток и их сводок одной транзакцией"""
+        if self.buffer:
+            with transaction.atomic():
+                MailingAttempt.objects.bulk_create(self.buffer)
+                add_attempts((attempt.mailing_id, attempt.attempt_time, attempt.status) for attempt in self.buffer)
+            bump_mailing_owners({attempt.mailing_id for attempt in self.buffer}, 'attempt')
+            self.written += len(self.buffer)
+            self.buffer = []
+        self._last_flush = time.monotonic()
@@ -0,0 +1,11 @@
+"""Бенчмарки сервиса рассылок, запускаются командой `manage.py benchmark`"""
+from . import attempts, mime, personalization, send, statuses, web
+
+BENCHMARKS = {
+    'attempts': attempts.run,
+    'mime': mime.run,
+    'personalization': personalization.run,
+    'send': send.run,
+    'statuses': statuses.run,
+    'web': web.run,
+}
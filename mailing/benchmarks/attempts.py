@@ -0,0 +1,27 @@
+import time
+
+from mailing.attempts import AttemptWriter
+from mailing.models import MailingAttempt
+
+from .fixtures import bench_mailing
+
+
+def run(count=100_000):
+    """Сравнение построчной и буферизованной записи попыток"""
+    results = {}
+    with bench_mailing() as mailing:
+        started = time.perf_counter()
+        for _ in range(count):
+            MailingAttempt.objects.create(mailing=mailing, status='success', server_response='OK')
+        elapsed = time.perf_counter() - started
+        results['per_row_per_sec'] = count / elapsed
+
+        started = time.perf_counter()
+        with AttemptWriter() as writer:
+            for _ in range(count):
+                writer.add(mailing=mailing, status='success', server_response='OK')
+        elapsed = time.perf_counter() - started
+        results['buffered_per_sec'] = count / elapsed
+
+    results['speedup'] = results['buffered_per_sec'] / results['per_row_per_sec']
+    return results
@@ -0,0 +1,177 @@
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from mailing.models import Client, Mailing, MailingAttempt, Message
+from mailing.rollups import add_attempts
+from mailing.sending import batched
+from users.models import User
+
+
+def create_owner():
+    """Пользователь бенчмарка; адрес уникален, чтобы не столкнуться с оставшимся от прерванного запуска"""
+    # Бенчмарк записи попыток меряет фиксацию каждой строки и не может идти в откатываемой
+    # транзакции, поэтому его пользователь живет в базе до конца запуска
+    name = f'benchmark-{uuid.uuid4().hex[:12]}'
+    return User.objects.create(email=f'{name}@example.com', username=name)
+
+
+@contextmanager
+def bench_owner():
+    """Временный пользователь для бенчмарка, удаляется вместе со своими данными"""
+    owner = create_owner()
+    try:
+        yield owner
+    finally:
+        owner.delete()
+
+
+@contextmanager
+def bench_mailing():
+    """Временная рассылка для бенчмарка"""
+    with bench_owner() as owner:
+        message = Message.objects.create(subject='Бенчмарк', body='Бенчмарк', owner=owner)
+        now = timezone.now()
+        yield Mailing.objects.create(
+            start_time=now,
+            end_time=now + timedelta(hours=1),
+            message=message,
+            owner=owner,
+        )
+
+
+@contextmanager
+def isolated():
+    """Отдельный кеш в памяти и почта в памяти: бенчмарк не трогает кеш сайта и не шлет письма"""
+    with override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'}},
+        EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+        MAILING_DOMAIN_RATE=0,
+        MAILING_DOMAIN_RATES={},
+        ALLOWED_HOSTS=['testserver'],
+    ):
+        yield
+
+
+@contextmanager
+def rolled_back():
+    """Данные бенчмарка живут в транзакции, которая откатывается в конце"""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def generate_mailings(owners, messages, count, now=None, with_statuses=True):
+    """Рассылки поровну в будущем, идущие сейчас и завершенные, по кругу между владельцами"""
+    # with_statuses=False: все со статусом 'created', как сразу после сохранения формы
+    now = now or timezone.now()
+    hour = timedelta(hours=1)
+    windows = [
+        (now + hour, now + 2 * hour, 'created'),
+        (now - hour, now + hour, 'started'),
+        (now - 2 * hour, now - hour, 'completed'),
+    ]
+    mailings = (
+        Mailing(
+            start_time=windows[i % 3][0],
+            end_time=windows[i % 3][1],
+            status=windows[i % 3][2] if with_statuses else 'created',
+            message=messages[i % len(messages)],
+            owner=owners[i % len(owners)],
+        )
+        for i in range(count)
+    )
+    for chunk in batched(mailings, 10_000):
+        Mailing.objects.bulk_create(chunk)
+
+
+def populate(count, per_owner=10_000):
+    """Набор данных объемом count строк в каждой таблице: пользователи, клиенты, рассылки, попытки"""
+    owners = User.objects.bulk_create(
+        User(email=f'bench{i}@example.com', username=f'bench{i}')
+        for i in range(max(count // per_owner, 1))
+    )
+    messages = Message.objects.bulk_create(
+        Message(subject=f'Бенчмарк {i}', body='Бенчмарк', owner=owner) for i, owner in enumerate(owners)
+    )
+    clients = (
+        Client(email=f'client{i}@example.com', full_name=f'Клиент {i}', owner=owners[i % len(owners)])
+        for i in range(count)
+    )
+    for chunk in batched(clients, 10_000):
+        Client.objects.bulk_create(chunk)
+
+    generate_mailings(owners, messages, count)
+    mailing_ids = list(Mailing.objects.filter(owner__in=owners).values_list('id', flat=True))
+    now = timezone.now()
+    attempts = (
+        MailingAttempt(
+            mailing_id=mailing_ids[i % len(mailing_ids)],
+            attempt_time=now - timedelta(seconds=i),
+            status='success' if i % 10 else 'failure',
+            server_response='OK',
+        )
+        for i in range(count)
+    )
+    for chunk in batched(attempts, 10_000):
+        MailingAttempt.objects.bulk_create(chunk)
+    return owners
+
+
+def generate_dataset(users, clients_per_user=1000, messages_per_user=5, mailings_per_user=20,
+                     recipients_per_mailing=100, now=None):
+    """Данные с соотношениями рабочей базы: у каждого пользователя свои клиенты, сообщения,
+    рассылки с получателями и попытки по прошедшим и идущим рассылкам"""
+    now = now or timezone.now()
+    owners = User.objects.bulk_create(
+        User(email=f'load{i}@example.com', username=f'load{i}') for i in range(users)
+    )
+    # Сообщение k принадлежит владельцу k % users, как и рассылка с тем же остатком
+    Message.objects.bulk_create(
+        Message(subject=f'Новости {j}, {{{{ full_name }}}}', body='Здравствуйте, {{ full_name }}!\n' * 20, owner=owner)
+        for j in range(messages_per_user)
+        for owner in owners
+    )
+    messages = list(Message.objects.filter(owner__in=owners).order_by('id'))
+    clients = (
+        Client(email=f'client{i}.{n}@domain{n % 50}.example', full_name=f'Клиент {n}', owner=owner)
+        for i, owner in enumerate(owners)
+        for n in range(clients_per_user)
+    )
+    for chunk in batched(clients, 10_000):
+        Client.objects.bulk_create(chunk)
+    generate_mailings(owners, messages, users * mailings_per_user, now=now)
+
+    client_ids = {}
+    for owner_id, client_id in Client.objects.filter(owner__in=owners).order_by('id').values_list('owner_id', 'id'):
+        client_ids.setdefault(owner_id, []).append(client_id)
+    mailings = list(Mailing.objects.filter(owner__in=owners).order_by('id').values_list('id', 'owner_id', 'status'))
+    through = Mailing.recipients.through
+    recipients = []
+    attempts = []
+    for n, (mailing_id, owner_id, status) in enumerate(mailings):
+        own = client_ids[owner_id]
+        start = n * recipients_per_mailing % len(own)
+        chosen = (own[start:] + own[:start])[:recipients_per_mailing]
+        recipients.extend(through(mailing_id=mailing_id, client_id=client_id) for client_id in chosen)
+        if status != 'created':
+            attempts.extend(
+                MailingAttempt(
+                    mailing_id=mailing_id,
+                    client_id=client_id,
+                    attempt_time=now - timedelta(minutes=n * 7 + i % 60),
+                    status='failure' if i % 10 == 0 else 'success',
+                    server_response='OK',
+                )
+                for i, client_id in enumerate(chosen)
+            )
+    for chunk in batched(recipients, 10_000):
+        through.objects.bulk_create(chunk)
+    for chunk in batched(attempts, 10_000):
+        MailingAttempt.objects.bulk_create(chunk)
+        add_attempts((attempt.mailing_id, attempt.attempt_time, attempt.status) for attempt in chunk)
+    return owners
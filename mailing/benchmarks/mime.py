@@ -0,0 +1,41 @@
+import time
+import tracemalloc
+
+from django.core.mail import EmailMessage
+
+from mailing.mime import PreparedMessage
+
+SUBJECT = 'Новости сервиса рассылок за неделю'
+PARAGRAPH = 'Текст рассылки с кириллицей, который одинаков для всех получателей. ' * 10 + '\n'
+
+
+def _measure(build, count):
+    """Время на письмо в микросекундах и пик памяти при сборке одного письма в килобайтах"""
+    started = time.perf_counter()
+    for i in range(count):
+        build(f'client{i}@example.com')
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    build('client@example.com')
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed / count * 1_000_000, peak / 1024
+
+
+def run(count=2000, body_kb=64):
+    """Сборка байтов письма: EmailMessage на каждого получателя и письмо, закодированное один раз"""
+    body = PARAGRAPH * (body_kb * 1024 // len(PARAGRAPH.encode()) + 1)
+
+    def legacy(email):
+        return EmailMessage(subject=SUBJECT, body=body, to=[email]).message().as_bytes(linesep='\r\n')
+
+    prepared = PreparedMessage(SUBJECT, body)
+
+    def reused(email):
+        return prepared.for_recipient(email).message().as_bytes(linesep='\r\n')
+
+    results = {'recipients': count, 'body_kb': body_kb}
+    results['legacy_us'], results['legacy_peak_kb'] = _measure(legacy, count)
+    results['prepared_us'], results['prepared_peak_kb'] = _measure(reused, count)
+    results['speedup'] = results['legacy_us'] / results['prepared_us']
+    return results
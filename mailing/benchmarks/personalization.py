@@ -0,0 +1,31 @@
+import time
+
+from django.template import Context, Template
+
+from mailing.models import Client
+from mailing.personalization import CompiledMessage
+
+SUBJECT = 'Здравствуйте, {{ full_name }}!'
+BODY = 'Уважаемый(ая) {{ full_name }},\n\nписьмо отправлено на {{ email }}.\n' + 'Текст рассылки. ' * 50
+
+
+def run(count=100_000):
+    """Скорость подстановки данных получателя: шаблон Django на каждое письмо и разобранное один раз сообщение"""
+    clients = [Client(email=f'client{i}@example.com', full_name=f'Клиент {i}') for i in range(count)]
+    results = {'recipients': count}
+
+    started = time.perf_counter()
+    for client in clients:
+        context = Context({'full_name': client.full_name, 'email': client.email}, autoescape=False)
+        Template(SUBJECT).render(context)
+        Template(BODY).render(context)
+    results['template_per_sec'] = count / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    compiled = CompiledMessage(SUBJECT, BODY)
+    for client in clients:
+        compiled.render(client)
+    results['compiled_per_sec'] = count / (time.perf_counter() - started)
+
+    results['speedup'] = results['compiled_per_sec'] / results['template_per_sec']
+    return results
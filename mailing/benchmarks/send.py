@@ -0,0 +1,48 @@
+import io
+import time
+from datetime import timedelta
+
+from django.core import mail
+from django.core.management import call_command
+from django.utils import timezone
+
+from mailing.models import Client, Mailing, Message
+
+from .fixtures import create_owner, isolated, rolled_back
+
+
+def _send(count, engine):
+    """Писем в секунду у send_mailings на одной рассылке из count получателей"""
+    with rolled_back():
+        owner = create_owner()
+        message = Message.objects.create(subject='Новости, {{ full_name }}', body='Текст рассылки\n' * 20, owner=owner)
+        Client.objects.bulk_create(
+            Client(email=f'client{i}@domain{i % 50}.example', full_name=f'Клиент {i}', owner=owner)
+            for i in range(count)
+        )
+        now = timezone.now()
+        mailing = Mailing.objects.create(
+            start_time=now - timedelta(minutes=1),
+            end_time=now + timedelta(hours=1),
+            status='started',
+            message=message,
+            owner=owner,
+        )
+        mailing.recipients.set(Client.objects.filter(owner=owner))
+
+        mail.outbox = []
+        started = time.perf_counter()
+        call_command('send_mailings', engine=engine, stdout=io.StringIO())
+        elapsed = time.perf_counter() - started
+        sent = len(mail.outbox)
+        mail.outbox = []
+    return sent, sent / elapsed
+
+
+def run(count=10_000):
+    """Пропускная способность send_mailings с почтой в памяти, движки sync и async"""
+    results = {'recipients': count}
+    with isolated():
+        for engine in ('sync', 'async'):
+            results[f'{engine}_sent'], results[f'{engine}_per_sec'] = _send(count, engine)
+    return results
@@ -0,0 +1,31 @@
+import time
+
+from django.utils import timezone
+
+from mailing.models import Mailing, Message
+
+from .fixtures import create_owner, generate_mailings, rolled_back
+
+
+def run(count=1_000_000):
+    """Время обновления статусов count рассылок: первый проход и повторный без изменений"""
+    now = timezone.now()
+    with rolled_back():
+        owner = create_owner()
+        message = Message.objects.create(subject='Бенчмарк', body='Бенчмарк', owner=owner)
+        generate_mailings([owner], [message], count, now=now, with_statuses=False)
+
+        started = time.perf_counter()
+        changed = Mailing.sweep_statuses(now)
+        first_pass = time.perf_counter() - started
+
+        started = time.perf_counter()
+        Mailing.sweep_statuses(now)
+        idle_pass = time.perf_counter() - started
+
+    return {
+        'mailings': count,
+        'changed': sum(len(ids) for ids in changed.values()),
+        'first_pass_sec': first_pass,
+        'idle_pass_sec': idle_pass,
+    }
@@ -0,0 +1,65 @@
+import time
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client as TestClient
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from mailing.metrics import percentile
+from mailing.models import Client, Mailing, Message
+
+from .fixtures import generate_dataset, isolated, rolled_back
+
+
+def _pages(owner):
+    """Главная, списки и карточки, которые видит владелец"""
+    client = Client.objects.filter(owner=owner).order_by('id').first()
+    message = Message.objects.filter(owner=owner).order_by('id').first()
+    mailing = Mailing.objects.filter(owner=owner).order_by('id').first()
+    return {
+        'home': reverse('mailing:home'),
+        'client_list': reverse('mailing:client_list'),
+        'message_list': reverse('mailing:message_list'),
+        'mailing_list': reverse('mailing:mailing_list'),
+        'attempt_list': reverse('mailing:attempt_list'),
+        'attempt_stats': reverse('mailing:attempt_stats'),
+        'client_detail': reverse('mailing:client_detail', args=[client.pk]),
+        'message_detail': reverse('mailing:message_detail', args=[message.pk]),
+        'mailing_detail': reverse('mailing:mailing_detail', args=[mailing.pk]),
+    }
+
+
+def _measure(browser, url, repeat, cold):
+    """Медиана времени ответа в миллисекундах и число запросов к базе за один ответ"""
+    timings = []
+    for _ in range(repeat):
+        if cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = browser.get(url)
+            timings.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            raise RuntimeError(f'{url}: ответ {response.status_code}')
+    return percentile(sorted(timings), 50) * 1000, len(queries.captured_queries)
+
+
+def run(count=10_000, repeat=20):
+    """Время ответа и число запросов страниц при пустом (cold) и заполненном (warm) кеше"""
+    users = 5
+    results = {}
+    with isolated(), rolled_back():
+        owners = generate_dataset(users, clients_per_user=count // users)
+        browser = TestClient()
+        browser.force_login(owners[0])
+        for name, url in _pages(owners[0]).items():
+            cold_ms, cold_queries = _measure(browser, url, repeat, cold=True)
+            warm_ms, warm_queries = _measure(browser, url, repeat, cold=False)
+            results[name] = {
+                'cold_ms': cold_ms,
+                'cold_queries': cold_queries,
+                'warm_ms': warm_ms,
+                'warm_queries': warm_queries,
+            }
+    return results
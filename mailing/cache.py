@@ -0,0 +1,57 @@
+import secrets
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Mailing
+
+# Версии данных пользователя: изменение строки меняет версию ее ресурса,
+# и все ключи кеша со старой версией просто перестают запрашиваться
+RESOURCES = ('client', 'message', 'mailing', 'attempt', 'segment')
+
+
+def _key(owner_id, resource):
+    return f'version:{owner_id}:{resource}'
+
+
+def _new_version():
+    # Версия — время и случайный хвост, а не счетчик: incr файлового кеша не атомарен
+    # между процессами, и два одновременных сброса дали бы одну и ту же версию. Новая
+    # версия не совпадет ни с одной из использованных, даже если старую вытеснят из кеша
+    return f'{time.time_ns():x}{secrets.token_hex(4)}'
+
+
+def get_versions(owner_id, *resources):
+    """Строка с текущими версиями ресурсов пользователя для ключей кеша"""
+    keys = [_key(owner_id, resource) for resource in resources]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), timeout=None)
+            versions[key] = cache.get(key)
+    return '-'.join(f'{resource}.{versions[key]}' for resource, key in zip(resources, keys))
+
+
+def bump(owner_id, *resources):
+    """Новая версия ресурсов пользователя: O(1), без перебора ключей кеша"""
+    # Версия меняется после фиксации транзакции: иначе параллельный запрос успел бы
+    # закешировать еще старые данные уже под новой версией
+    def apply():
+        cache.set_many({_key(owner_id, resource): _new_version() for resource in resources}, timeout=None)
+
+    transaction.on_commit(apply)
+
+
+def bump_mailing_owners(mailing_ids, *resources, chunk_size=500):
+    """Новая версия ресурсов владельцев рассылок, измененных в обход сигналов"""
+    mailing_ids = list(mailing_ids)
+    for start in range(0, len(mailing_ids), chunk_size):
+        owner_ids = (
+            Mailing.objects.filter(id__in=mailing_ids[start:start + chunk_size])
+            .order_by()
+            .values_list('owner_id', flat=True)
+            .distinct()
+        )
+        for owner_id in owner_ids:
+            bump(owner_id, *resources)
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from users.models import User
+
+from .cache import get_versions
+from .models import AttemptRollup, Client, Mailing
+
+
+def _count(queryset):
+    """Подзапрос с числом строк владельца для аннотации пользователя"""
+    counts = queryset.filter(owner=OuterRef('pk')).order_by().values('owner').annotate(count=Count('pk'))
+    return Coalesce(Subquery(counts.values('count'), output_field=IntegerField()), 0)
+
+
+def _sum(queryset, field):
+    """Подзапрос с суммой поля по строкам владельца для аннотации пользователя"""
+    sums = queryset.filter(owner=OuterRef('pk')).order_by().values('owner').annotate(total=Sum(field))
+    return Coalesce(Subquery(sums.values('total'), output_field=IntegerField()), 0)
+
+
+def build_dashboard(user):
+    """Показатели главной одним запросом и ограниченный список последних рассылок"""
+    counters = User.objects.filter(pk=user.pk).annotate(
+        total_mailings=_count(Mailing.objects.all()),
+        active_mailings=_count(Mailing.objects.filter(status='started')),
+        total_clients=_count(Client.objects.all()),
+        success_attempts=_sum(AttemptRollup.objects.filter(period='day'), 'success_count'),
+        failure_attempts=_sum(AttemptRollup.objects.filter(period='day'), 'failure_count'),
+    ).values('total_mailings', 'active_mailings', 'total_clients', 'success_attempts', 'failure_attempts').get()
+    counters['total_attempts'] = counters['success_attempts'] + counters['failure_attempts']
+    counters['user_mailings'] = list(
+        Mailing.objects.filter(owner=user).select_related('message').order_by('-id')[:settings.DASHBOARD_RECENT_MAILINGS]
+    )
+    return counters
+
+
+def get_dashboard(user):
+    """Данные главной из кеша; ключ включает версии рассылок, сообщений, клиентов и попыток пользователя"""
+    # Сообщения — из-за тем последних рассылок в списке
+    key = f'dashboard:{user.pk}:{get_versions(user.pk, "mailing", "message", "client", "attempt")}'
+    data = cache.get(key)
+    if data is None:
+        data = build_dashboard(user)
+        cache.set(key, data, settings.DASHBOARD_CACHE_SECONDS)
+    return data
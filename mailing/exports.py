@@ -0,0 +1,102 @@
+import csv
+import json
+import zlib
+
+from .archive import read_archive
+from .models import Client, MailingAttempt
+
+FORMATS = ('csv', 'jsonl')
+CHUNK_SIZE = 2000
+# Размер куска ответа: строки копятся до него, чтобы не отдавать их по одной
+BUFFER_BYTES = 64 * 1024
+
+
+def _client_rows(owner):
+    return Client.objects.filter(owner=owner).order_by('id').values_list(
+        'email', 'full_name', 'comment', 'created_at'
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+
+def _attempt_rows(owner):
+    return MailingAttempt.objects.filter(mailing__owner=owner).order_by('id').values_list(
+        'id', 'mailing_id', 'mailing__message__subject', 'client__email', 'attempt_time', 'status', 'server_response'
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+
+ATTEMPT_COLUMNS = ('id', 'mailing_id', 'subject', 'email', 'attempt_time', 'status', 'server_response')
+
+
+def _archived_attempt_rows(owner):
+    for row in read_archive(owner=owner):
+        yield tuple(row[column] for column in ATTEMPT_COLUMNS)
+
+
+# Название выгрузки: колонки и строки владельца
+EXPORTS = {
+    'clients': (('email', 'full_name', 'comment', 'created_at'), _client_rows),
+    'attempts': (ATTEMPT_COLUMNS, _attempt_rows),
+    # Попытки, перенесенные командой archive_attempts, из файлов архива
+    'archived_attempts': (ATTEMPT_COLUMNS, _archived_attempt_rows),
+}
+
+
+def _value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+class _Line:
+    """Буфер для csv.writer, который возвращает записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(columns, rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([_value(value) for value in row])
+
+
+def _jsonl_lines(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, map(_value, row))), ensure_ascii=False) + '\n'
+
+
+def _chunks(lines):
+    """Склейка строк в куски около BUFFER_BYTES байт"""
+    buffer = []
+    size = 0
+    for line in lines:
+        data = line.encode()
+        buffer.append(data)
+        size += len(data)
+        if size >= BUFFER_BYTES:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _gzip(chunks):
+    """Сжатие потока в формат gzip по мере генерации"""
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export(name, owner, fmt='csv', compress=False):
+    """Поток байтов выгрузки владельца; строки читаются из базы кусками по CHUNK_SIZE"""
+    columns, get_rows = EXPORTS[name]
+    rows = get_rows(owner)
+    lines = _csv_lines(columns, rows) if fmt == 'csv' else _jsonl_lines(columns, rows)
+    chunks = _chunks(lines)
+    return _gzip(chunks) if compress else chunks
+
+
+def filename(name, fmt, compress=False):
+    return f'{name}.{fmt}' + ('.gz' if compress else '')
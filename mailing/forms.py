@@ -1,6 +1,27 @@
 from django import forms
+from django.urls import reverse_lazy
 from django.utils import timezone
-from .models import Client, Message, Mailing
+from .models import Client, Message, Mailing, Segment
+
+
+class ClientAutocomplete(forms.SelectMultiple):
+    """Выбор клиентов с подгрузкой вариантов по мере ввода; в разметке только выбранные клиенты"""
+    template_name = 'mailing/widgets/client_autocomplete.html'
+
+    class Media:
+        js = ('mailing/autocomplete.js',)
+
+    def __init__(self, attrs=None):
+        super().__init__({'data-autocomplete-url': reverse_lazy('mailing:client_autocomplete'), **(attrs or {})})
+
+    def optgroups(self, name, value, attrs=None):
+        # Варианты не перебираются: размер страницы не зависит от числа клиентов
+        selected = [pk for pk in value if str(pk).isdigit()]
+        clients = self.choices.queryset.filter(pk__in=selected) if selected else []
+        return [
+            (None, [self.create_option(name, client.pk, str(client), True, index)], index)
+            for index, client in enumerate(clients)
+        ]
 
 
 class ClientForm(forms.ModelForm):
@@ -11,6 +32,14 @@ class ClientForm(forms.ModelForm):
             'comment': forms.Textarea(attrs={'rows': 3}),
         }
 
+    def clean_email(self):
+        # Как при импорте: адреса хранятся в нижнем регистре
+        return self.cleaned_data['email'].lower()
+
+
+class ClientImportForm(forms.Form):
+    file = forms.FileField(label='Файл', help_text='CSV с колонками email, full_name, comment или JSONL')
+
 
 class MessageForm(forms.ModelForm):
     class Meta:
@@ -21,6 +50,33 @@ class MessageForm(forms.ModelForm):
         }
 
 
+class SegmentForm(forms.ModelForm):
+    def __init__(self, *args, **kwargs):
+        user = kwargs.pop('user', None)
+        super().__init__(*args, **kwargs)
+        if user:
+            self.fields['clients'].queryset = Client.objects.filter(owner=user)
+
+    class Meta:
+        model = Segment
+        fields = [
+            'name', 'kind', 'clients',
+            'email_domain', 'full_name_contains', 'comment_contains', 'created_after', 'created_before',
+        ]
+        widgets = {
+            'clients': ClientAutocomplete,
+            'created_after': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
+            'created_before': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
+        }
+
+    def clean(self):
+        cleaned_data = super().clean()
+        # Список хранит только клиентов, условия — только фильтры
+        if cleaned_data.get('kind') == 'dynamic':
+            cleaned_data['clients'] = Client.objects.none()
+        return cleaned_data
+
+
 class MailingForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         user = kwargs.pop('user', None)
@@ -28,14 +84,15 @@ class MailingForm(forms.ModelForm):
         if user:
             self.fields['message'].queryset = Message.objects.filter(owner=user)
             self.fields['recipients'].queryset = Client.objects.filter(owner=user)
+            self.fields['segment'].queryset = Segment.objects.filter(owner=user)
 
     class Meta:
         model = Mailing
-        fields = ['start_time', 'end_time', 'message', 'recipients', 'is_active']
+        fields = ['start_time', 'end_time', 'message', 'segment', 'recipients', 'is_active']
         widgets = {
             'start_time': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
             'end_time': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
-            'recipients': forms.SelectMultiple(attrs={'class': 'select2'}),
+            'recipients': ClientAutocomplete,
         }
 
     def clean(self):
@@ -50,5 +107,8 @@ class MailingForm(forms.ModelForm):
             if start_time < timezone.now():
                 raise forms.ValidationError('Время начала не может быть в прошлом')
 
+        if not cleaned_data.get('segment') and not cleaned_data.get('recipients'):
+            raise forms.ValidationError('Выберите сегмент или получателей')
+
         return cleaned_data
 
@@ -0,0 +1,137 @@
+import csv
+import json
+import re
+from dataclasses import dataclass
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import connection, transaction
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+
+from .cache import bump
+from .models import Client
+from .sending import batched
+
+FORMATS = ('csv', 'jsonl')
+# Управляющие символы C0 и C1, в том числе переводы строк и табуляция
+CONTROL = re.compile(r'[\x00-\x1f\x7f-\x9f]')
+
+
+@dataclass
+class ImportResult:
+    """Итог импорта клиентов"""
+    inserted: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    # Адреса, которые уже есть у другого пользователя: email клиента уникален во всем сервисе
+    taken: int = 0
+
+
+def detect_format(filename):
+    """Формат файла по расширению, по умолчанию csv"""
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_rows(stream, fmt):
+    """Построчное чтение файла; для испорченной строки JSONL отдается None"""
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield row if isinstance(row, dict) else None
+
+
+def normalize_email(value):
+    """Email в нижнем регистре без пробелов, для некорректного адреса None"""
+    email = str(value or '').strip().lower()
+    try:
+        validate_email(email)
+    except ValidationError:
+        return None
+    return email
+
+
+def clean_text(value, multiline=False):
+    """Текст без управляющих символов: они заменяются пробелом, в многострочном тексте
+    сохраняются только переводы строк"""
+    # Ф.И.О. подставляется в тему письма, где перевод строки запрещен
+    text = str(value or '')
+    if multiline:
+        return '\n'.join(' '.join(CONTROL.sub(' ', line).split()) for line in text.splitlines()).strip()
+    return ' '.join(CONTROL.sub(' ', text).split())
+
+
+def _taken(owner, emails):
+    """Сколько адресов из emails принадлежит клиентам других пользователей"""
+    return sum(
+        Client.objects.filter(email__in=chunk).exclude(owner=owner).count()
+        for chunk in batched(emails, 500)
+    )
+
+
+def _insert_ignore(rows):
+    """Вставка строк клиентов, уже существующие email пропускаются; возвращает число вставленных"""
+    # Прямой INSERT вместо bulk_create: подготовка значений в ORM занимает большую часть
+    # времени импорта, а rowcount сразу дает число новых строк. Много строк в одном INSERT:
+    # триггеры поиска пишут в FTS5, а он сбрасывает накопленное на диск после каждого
+    # оператора, и по строке на оператор импорт медленнее в несколько раз
+    ops = connection.ops
+    columns = ['email', 'full_name', 'comment', 'owner_id', 'created_at']
+    fields = [Client._meta.get_field(column.removesuffix('_id')) for column in columns]
+    sql = '{} {} ({}) VALUES {{}} {}'.format(
+        ops.insert_statement(on_conflict=OnConflict.IGNORE),
+        ops.quote_name(Client._meta.db_table),
+        ', '.join(ops.quote_name(column) for column in columns),
+        ops.on_conflict_suffix_sql(fields, OnConflict.IGNORE, None, None),
+    )
+    row_sql = '({})'.format(', '.join(['%s'] * len(columns)))
+    size = ops.bulk_batch_size(fields, rows)
+    full = sql.format(', '.join([row_sql] * size))
+    inserted = 0
+    with connection.cursor() as cursor:
+        for chunk in batched(rows, size):
+            chunk_sql = full if len(chunk) == size else sql.format(', '.join([row_sql] * len(chunk)))
+            cursor.execute(chunk_sql, [value for row in chunk for value in row])
+            inserted += cursor.rowcount
+    return inserted
+
+
+def import_clients(owner, rows, batch_size=5000):
+    """Вставка клиентов пачками; повторы в файле и уже существующие адреса пропускаются"""
+    result = ImportResult()
+    seen = set()
+    created_at = connection.ops.adapt_datetimefield_value(timezone.now())
+
+    def clients():
+        for row in rows:
+            email = normalize_email(row.get('email')) if row else None
+            if email is None:
+                result.invalid += 1
+            elif email in seen:
+                result.duplicates += 1
+            else:
+                seen.add(email)
+                full_name = clean_text(row.get('full_name'))[:255]
+                comment = clean_text(row.get('comment'), multiline=True)
+                yield email, full_name, comment, owner.pk, created_at
+
+    for batch in batched(clients(), batch_size):
+        with transaction.atomic():
+            inserted = _insert_ignore(batch)
+            # Пропущенные адреса: уже есть у этого пользователя или заняты другим
+            taken = _taken(owner, [row[0] for row in batch]) if inserted < len(batch) else 0
+        result.inserted += inserted
+        result.taken += taken
+        result.duplicates += len(batch) - inserted - taken
+
+    # Вставка идет мимо post_save, поэтому версия кеша сбрасывается вручную
+    if result.inserted:
+        bump(owner.pk, 'client')
+    return result
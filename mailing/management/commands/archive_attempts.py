@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from mailing.archive import CHUNK_SIZE, archive
+from mailing.cache import bump
+
+
+class Command(BaseCommand):
+    help = 'Перенос попыток старше срока хранения в сжатые файлы архива по суткам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.ATTEMPT_RETENTION_DAYS,
+            help='Сколько последних суток попыток остается в базе',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help='Количество попыток, переносимых за одну транзакцию',
+        )
+        parser.add_argument('--directory', help='Каталог архива, по умолчанию ATTEMPT_ARCHIVE_DIR')
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError('Срок хранения — не меньше одних суток')
+        before = timezone.now() - timedelta(days=options['days'])
+        moved = archive(before, chunk_size=options['chunk_size'], directory=options['directory'])
+        # Перенос идет мимо сигналов, поэтому версии кеша журнала сбрасываются вручную
+        for owner_id in moved:
+            bump(owner_id, 'attempt')
+        self.stdout.write(self.style.SUCCESS(f'Попыток перенесено в архив: {sum(moved.values())}'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from mailing.cache import bump
+from mailing.models import AttemptRollup
+from mailing.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Пересчет сводок попыток по часам и суткам из журнала попыток'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10_000,
+            help='Количество попыток, читаемых за один запрос',
+        )
+
+    def handle(self, *args, **options):
+        owner_ids = rebuild(chunk_size=options['chunk_size'])
+        for owner_id in owner_ids:
+            bump(owner_id, 'attempt')
+        self.stdout.write(self.style.SUCCESS(f'Сводок построено: {AttemptRollup.objects.count()}'))
@@ -0,0 +1,49 @@
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from mailing.benchmarks import BENCHMARKS
+
+
+def _flatten(results, prefix=''):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f'{prefix}{key}.')
+        else:
+            yield f'{prefix}{key}', value
+
+
+class Command(BaseCommand):
+    help = 'Запуск бенчмарков сервиса рассылок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='+', choices=sorted(BENCHMARKS), help='Названия бенчмарков')
+        parser.add_argument('--count', type=int, help='Объем данных, по умолчанию свой у каждого бенчмарка')
+        parser.add_argument('--json', action='store_true', help='Вывести результаты в JSON')
+        parser.add_argument('--output', help='Записать результаты в JSON-файл для сравнения между коммитами')
+
+    def handle(self, *args, **options):
+        kwargs = {'count': options['count']} if options['count'] else {}
+        report = {
+            'started_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'results': {},
+        }
+        for name in options['names']:
+            results = report['results'][name] = BENCHMARKS[name](**kwargs)
+            if options['json']:
+                continue
+            for key, value in _flatten(results, f'{name}.' if len(options['names']) > 1 else ''):
+                if isinstance(value, float):
+                    value = f'{value:.3f}'
+                self.stdout.write(f'{key}: {value}')
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2, ensure_ascii=False)
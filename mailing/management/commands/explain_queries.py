@@ -0,0 +1,86 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from mailing.benchmarks.fixtures import populate, rolled_back
+from mailing.models import Client, Mailing, MailingAttempt, Message
+from mailing.pagination import KeysetPage, encode_cursor
+
+# Модели, индексы которых подобраны под запросы ниже
+TUNED_MODELS = [Mailing, Client, Message, MailingAttempt]
+
+
+def hot_queries(owner, mailing):
+    """Основные запросы сервиса в том виде, в каком их строят представления и команды"""
+    now = timezone.now()
+    return {
+        'Список рассылок': KeysetPage(Mailing.objects.filter(owner=owner), 50).page_queryset(),
+        'Список рассылок, следующая страница': KeysetPage(
+            Mailing.objects.filter(owner=owner), 50, after=encode_cursor(mailing)
+        ).page_queryset(),
+        'Список клиентов': KeysetPage(Client.objects.filter(owner=owner), 50).page_queryset(),
+        'Список сообщений': KeysetPage(Message.objects.filter(owner=owner), 50).page_queryset(),
+        'Главная: активные рассылки': Mailing.objects.filter(owner=owner, status='started').values('id'),
+        'send_mailings: активные рассылки': Mailing.objects.filter(
+            start_time__lte=now, end_time__gte=now, is_active=True, status='started'
+        ),
+        'Статусы: -> created': Mailing.objects.filter(start_time__gt=now, status__in=['started', 'completed']),
+        'Статусы: -> started': Mailing.objects.filter(
+            start_time__lte=now, end_time__gte=now, status__in=['created', 'completed']
+        ),
+        'Статусы: -> completed': Mailing.objects.filter(end_time__lt=now, status__in=['created', 'started']),
+        'Последние попытки рассылки': MailingAttempt.objects.filter(mailing=mailing)[:5],
+        'Журнал попыток': MailingAttempt.objects.all()[:50],
+    }
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN основных запросов без подобранных индексов и с ними'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=1_000_000,
+            help='Сколько строк сгенерировать в каждой таблице (0 — только текущие данные)',
+        )
+
+    def handle(self, *args, **options):
+        # Данные и удаление индексов живут в транзакции, которая откатывается в конце
+        with rolled_back():
+            if options['count']:
+                self.stdout.write(f'Генерация {options["count"]} строк...')
+                populate(options['count'])
+            mailing = Mailing.objects.select_related('owner').order_by('id').first()
+            if mailing is None:
+                self.stderr.write('Нет рассылок: запустите с --count')
+                return
+            queries = hot_queries(mailing.owner, mailing)
+
+            self.analyze()
+            after = {name: queryset.explain() for name, queryset in queries.items()}
+            self.drop_tuned_indexes()
+            self.analyze()
+            before = {name: queryset.explain() for name, queryset in queries.items()}
+
+        for name in queries:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(f'  до:    {before[name]}'.replace('\n', '\n         '))
+            self.stdout.write(f'  после: {after[name]}'.replace('\n', '\n         '))
+
+    def analyze(self):
+        """Статистика для планировщика запросов"""
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def drop_tuned_indexes(self):
+        """Возврат к схеме до подбора индексов: без Meta.indexes, с обычными индексами внешних ключей"""
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            for model in TUNED_MODELS:
+                for index in model._meta.indexes:
+                    cursor.execute(f'DROP INDEX {qn(index.name)}')
+                for field in model._meta.fields:
+                    if field.many_to_one and not field.db_index:
+                        name = f'{model._meta.db_table}_{field.column}_before'
+                        cursor.execute(f'CREATE INDEX {qn(name)} ON {qn(model._meta.db_table)} ({qn(field.column)})')
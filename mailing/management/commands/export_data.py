@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mailing.exports import EXPORTS, FORMATS, export
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка клиентов или попыток пользователя в CSV или JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(EXPORTS), help='Что выгружать')
+        parser.add_argument('--owner', required=True, help='Email владельца')
+        parser.add_argument('--format', choices=FORMATS, default='csv', help='Формат файла')
+        parser.add_argument('--gzip', action='store_true', help='Сжимать выгрузку')
+        parser.add_argument('--output', help='Путь к файлу, по умолчанию стандартный вывод')
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(email=options['owner'])
+        except User.DoesNotExist:
+            raise CommandError(f'Пользователь {options["owner"]} не найден')
+
+        chunks = export(options['name'], owner, options['format'], options['gzip'])
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                output.writelines(chunks)
+        else:
+            # Байты идут в поток под self.stdout, а не в sys.stdout: так вывод перехватывает
+            # call_command(..., stdout=...); у текстового потока байты пишутся в его buffer
+            output = self.stdout._out
+            getattr(output, 'buffer', output).writelines(chunks)
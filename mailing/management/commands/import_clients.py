@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mailing.imports import FORMATS, detect_format, import_clients, read_rows
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Импорт клиентов из CSV (колонки email, full_name, comment) или JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу')
+        parser.add_argument('--owner', required=True, help='Email владельца клиентов')
+        parser.add_argument('--format', choices=FORMATS, help='Формат файла, по умолчанию по расширению')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Количество клиентов в одной вставке')
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(email=options['owner'])
+        except User.DoesNotExist:
+            raise CommandError(f'Пользователь {options["owner"]} не найден')
+        fmt = options['format'] or detect_format(options['path'])
+
+        started = time.monotonic()
+        with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+            result = import_clients(owner, read_rows(stream, fmt), batch_size=options['batch_size'])
+        elapsed = time.monotonic() - started
+
+        total = result.inserted + result.duplicates + result.taken + result.invalid
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено {result.inserted}, повторов {result.duplicates}, '
+            f'занято другими пользователями {result.taken}, некорректных {result.invalid}'
+        ))
+        self.stdout.write(f'{total} строк за {elapsed:.2f} с ({total / elapsed if elapsed else 0:.0f} строк/с)')
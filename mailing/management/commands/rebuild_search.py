@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from mailing.search import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Пересборка таблиц полнотекстового поиска по клиентам и сообщениям'
+
+    def handle(self, *args, **options):
+        for table, count in rebuild().items():
+            self.stdout.write(f'{table}: {count}')
+        self.stdout.write(self.style.SUCCESS('Поисковые таблицы пересобраны'))
@@ -0,0 +1,124 @@
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from mailing import metrics, outbox
+from mailing.attempts import AttemptWriter
+from mailing.cache import bump_mailing_owners
+from mailing.models import Mailing
+from mailing.scheduler import MailingScheduler
+from mailing.sending import BatchSender, deliver_mailing
+from mailing.throttle import DomainThrottle
+
+
+class Command(BaseCommand):
+    help = 'Резидентный планировщик: запускает и завершает рассылки по расписанию'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=settings.MAILING_SCHEDULER_POLL_INTERVAL,
+            help='Как часто проверять новые и измененные рассылки, в секундах',
+        )
+        parser.add_argument('--workers', type=int, default=2, help='Число рассылок, отправляемых одновременно')
+        parser.add_argument(
+            '--metrics-port',
+            type=int,
+            help='Порт HTTP-сервера метрик: /metrics в формате Prometheus и /metrics.json',
+        )
+        parser.add_argument(
+            '--metrics-host',
+            default=settings.MAILING_METRICS_HOST,
+            help='Адрес HTTP-сервера метрик, 0.0.0.0 — все интерфейсы',
+        )
+
+    def handle(self, *args, **options):
+        self.stop = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: self.stop.set())
+
+        self.running = set()
+        # Рассылки, измененные во время отправки: после текущего запуска они запускаются снова
+        self.rerun = set()
+        self.lock = threading.Lock()
+        # Общий для всех рассылок: ограничение домена действует на весь процесс
+        self.throttle = DomainThrottle()
+        scheduler = MailingScheduler()
+        server = None
+        if options['metrics_port']:
+            metrics.enable()
+            server = metrics.serve(options['metrics_port'], options['metrics_host'])
+            self.stdout.write(f'Метрики доступны на {options["metrics_host"]}:{options["metrics_port"]}')
+        self.stdout.write('Планировщик запущен')
+
+        with ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='mailing') as executor:
+            self.executor = executor
+            while not self.stop.is_set():
+                now = timezone.now()
+                scheduler.refresh(now)
+                for event in scheduler.pop_due(now):
+                    if event.kind == 'start':
+                        self.submit(executor, event.mailing_id)
+                    else:
+                        self.finish_mailing(event.mailing_id)
+                # Повторы после временных ошибок отправляются отдельным запуском рассылки
+                for mailing_id in outbox.due_retry_mailings(now):
+                    self.submit(executor, mailing_id)
+                self.stop.wait(scheduler.seconds_until_next(timezone.now(), options['poll_interval']))
+
+        if server is not None:
+            server.shutdown()
+        self.stdout.write('Планировщик остановлен')
+
+    def submit(self, executor, mailing_id):
+        with self.lock:
+            if mailing_id in self.running:
+                # Новые получатели или сегмент ставятся в очередь только при запуске
+                self.rerun.add(mailing_id)
+                return
+            self.running.add(mailing_id)
+        executor.submit(self.start_mailing, mailing_id)
+
+    def start_mailing(self, mailing_id):
+        """Запуск рассылки в отдельном потоке"""
+        try:
+            now = timezone.now()
+            if Mailing.objects.filter(pk=mailing_id, is_active=True, status='created').update(status='started'):
+                bump_mailing_owners([mailing_id], 'mailing')
+            mailing = Mailing.objects.select_related('message').filter(
+                pk=mailing_id, is_active=True, status='started', end_time__gte=now
+            ).first()
+            if mailing is None:
+                return
+            with BatchSender(throttle=self.throttle) as sender, AttemptWriter() as writer:
+                sent_count, error_count = deliver_mailing(mailing, sender, writer, stop=self.stop)
+            self.stdout.write(
+                self.style.SUCCESS(f'Рассылка #{mailing.id}: отправлено {sent_count}, ошибок {error_count}')
+            )
+        except Exception as e:
+            self.stderr.write(f'Рассылка #{mailing_id}: {e}')
+        finally:
+            with self.lock:
+                self.running.discard(mailing_id)
+                again = mailing_id in self.rerun
+                self.rerun.discard(mailing_id)
+            # Запуск мог закончиться уже после завершения рассылки и снова записать ее метрики
+            if not Mailing.objects.filter(pk=mailing_id).exclude(status='completed').exists():
+                metrics.get_sink().forget(mailing=mailing_id)
+            connection.close()
+            if again and not self.stop.is_set():
+                self.submit(self.executor, mailing_id)
+
+    def finish_mailing(self, mailing_id):
+        """Завершение рассылки по окончании ее времени"""
+        if Mailing.objects.filter(pk=mailing_id).exclude(status='completed').update(status='completed'):
+            bump_mailing_owners([mailing_id], 'mailing')
+            self.stdout.write(f'Рассылка #{mailing_id} завершена')
+        # Метки завершенной рассылки больше не нужны: иначе их число растет без предела
+        metrics.get_sink().forget(mailing=mailing_id)
@@ -1,57 +1,117 @@
+import json
+import signal
+import threading
+import time
+
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from django.core.mail import send_mail
 from django.conf import settings
-from mailing.models import Mailing, MailingAttempt
+from mailing.async_engine import AsyncDeliveryEngine
+from mailing.attempts import AttemptWriter
+from mailing.cache import bump_mailing_owners
+from mailing import metrics
+from mailing.metrics import latency_summary
+from mailing.models import Mailing
+from mailing.sending import BatchSender, deliver_mailing
+from mailing.throttle import DomainThrottle
 
 
 class Command(BaseCommand):
     help = 'Отправка активных рассылок'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.MAILING_BATCH_SIZE,
+            help='Количество писем в одной пачке',
+        )
+        parser.add_argument(
+            '--engine',
+            choices=['sync', 'async'],
+            default='sync',
+            help='Движок отправки: sync — последовательно, async — параллельные SMTP-сессии',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=settings.MAILING_CONCURRENCY,
+            help='Число одновременных SMTP-сессий для движка async',
+        )
+        parser.add_argument(
+            '--metrics-json',
+            metavar='FILE',
+            help='Записать метрики отправки в JSON-файл, "-" — вывести в консоль',
+        )
+
+    def handle(self, *args, **options):
         now = timezone.now()
+        changed = Mailing.sweep_statuses(now)
+        bump_mailing_owners([mailing_id for ids in changed.values() for mailing_id in ids], 'mailing')
         active_mailings = Mailing.objects.filter(
             start_time__lte=now,
             end_time__gte=now,
             is_active=True,
             status='started'
+        ).select_related('message')
+
+        # SIGTERM останавливает отправку после текущей пачки: ее результаты успевают
+        # записаться, и следующий запуск продолжит с того же места без повторов
+        self.stop = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *_: self.stop.set())
+        if options['metrics_json']:
+            metrics.enable()
+        throttle = DomainThrottle()
+        if options['engine'] == 'async':
+            sender = AsyncDeliveryEngine(
+                concurrency=options['concurrency'], batch_size=options['batch_size'], throttle=throttle
+            )
+        else:
+            sender = BatchSender(batch_size=options['batch_size'], throttle=throttle)
+
+        started = time.monotonic()
+        total = 0
+        with sender, AttemptWriter() as writer:
+            for mailing in active_mailings:
+                if self.stop.is_set():
+                    self.stdout.write('Отправка остановлена')
+                    break
+                self.stdout.write(f'Отправка рассылки #{mailing.id}')
+                total += self.send_mailing(mailing, sender, writer)
+
+        elapsed = time.monotonic() - started
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(f'Пропускная способность: {rate:.1f} писем/с ({total} писем за {elapsed:.2f} с)')
+        latency = latency_summary(sender.latencies)
+        self.stdout.write(
+            'Задержка отправки, мс: p50 {p50:.1f}, p90 {p90:.1f}, p99 {p99:.1f}, max {max:.1f}'.format(**latency)
         )
+        for domain, count, average, longest in throttle.report()[:10]:
+            self.stdout.write(
+                f'Домен {domain}: {count} писем, ожидание в очереди: среднее {average:.2f} с, наибольшее {longest:.2f} с'
+            )
+        sink = metrics.get_sink()
+        for histogram in sink.as_dict()['histograms']:
+            average = histogram['sum'] / histogram['count'] * 1000
+            self.stdout.write(f'{histogram["name"]}: {histogram["count"]} замеров, среднее {average:.2f} мс')
+        if options['metrics_json']:
+            self.write_metrics(options['metrics_json'])
 
-        for mailing in active_mailings:
-            self.stdout.write(f'Отправка рассылки #{mailing.id}')
-            self.send_mailing(mailing)
+    def write_metrics(self, path):
+        """Выгрузка метрик процесса в JSON"""
+        data = json.dumps(metrics.get_sink().as_dict(), ensure_ascii=False, indent=2)
+        if path == '-':
+            self.stdout.write(data)
+            return
+        with open(path, 'w', encoding='utf-8') as output:
+            output.write(data)
+        self.stdout.write(f'Метрики записаны в {path}')
 
-    def send_mailing(self, mailing):
+    def send_mailing(self, mailing, sender, writer):
         """Отправка одной рассылки"""
-        recipients = mailing.recipients.all()
-        sent_count = 0
-        error_count = 0
-
-        for client in recipients:
-            try:
-                send_mail(
-                    subject=mailing.message.subject,
-                    message=mailing.message.body,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[client.email],
-                    fail_silently=False,
-                )
-
-                MailingAttempt.objects.create(
-                    mailing=mailing,
-                    status='success',
-                    server_response='Письмо успешно отправлено'
-                )
-                sent_count += 1
-
-            except Exception as e:
-                MailingAttempt.objects.create(
-                    mailing=mailing,
-                    status='failure',
-                    server_response=str(e)
-                )
-                error_count += 1
-
+        sent_count, error_count = deliver_mailing(mailing, sender, writer, stop=self.stop)
         self.stdout.write(
             self.style.SUCCESS(f'Рассылка #{mailing.id}: отправлено {sent_count}, ошибок {error_count}')
         )
+        return sent_count + error_count
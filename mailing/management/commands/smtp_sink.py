@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from mailing.smtp_sink import SMTPSink
+
+
+class Command(BaseCommand):
+    help = 'Локальный SMTP-сервер, принимающий письма без доставки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Адрес для прослушивания')
+        parser.add_argument('--port', type=int, default=1025, help='Порт для прослушивания')
+        parser.add_argument('--delay', type=float, default=0, help='Задержка ответа в секундах')
+        parser.add_argument(
+            '--drop-every', type=int, default=0, help='Разрывать соединение после каждых N писем в нем'
+        )
+
+    def handle(self, *args, **options):
+        sink = SMTPSink(
+            host=options['host'], port=options['port'], delay=options['delay'], drop_every=options['drop_every']
+        )
+        self.stdout.write(f'SMTP-сервер слушает {options["host"]}:{options["port"]}')
+        try:
+            sink.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write(f'Принято писем: {len(sink.messages)}')
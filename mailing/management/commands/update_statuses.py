@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from mailing.cache import bump_mailing_owners
+from mailing.models import Mailing
+
+
+class Command(BaseCommand):
+    help = 'Обновление статусов всех рассылок по времени начала и окончания'
+
+    def handle(self, *args, **kwargs):
+        changed = Mailing.sweep_statuses()
+        bump_mailing_owners([mailing_id for ids in changed.values() for mailing_id in ids], 'mailing')
+        for status, ids in changed.items():
+            self.stdout.write(f'{status}: {len(ids)}')
@@ -0,0 +1,259 @@
+import bisect
+import json
+import math
+import threading
+import time
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+def percentile(samples, p):
+    """Перцентиль методом ближайшего ранга, samples должны быть отсортированы"""
+    if not samples:
+        return 0.0
+    rank = max(math.ceil(p / 100 * len(samples)), 1)
+    return samples[rank - 1]
+
+
+def latency_summary(latencies, points=(50, 90, 99)):
+    """Сводка задержек в миллисекундах: перцентили и максимум"""
+    samples = sorted(latencies)
+    summary = {f'p{p}': percentile(samples, p) * 1000 for p in points}
+    summary['max'] = samples[-1] * 1000 if samples else 0.0
+    return summary
+
+
+# Метрики отправки: тип и описание для формата Prometheus
+METRICS = {
+    'mailing_enqueue_seconds': ('histogram', 'Постановка получателей рассылки в очередь'),
+    'mailing_recipients_load_seconds': ('histogram', 'Захват пачки получателей из очереди'),
+    'mailing_render_seconds': ('histogram', 'Подстановка данных и сборка писем пачки'),
+    'mailing_smtp_seconds': ('histogram', 'Отправка одного письма SMTP-серверу'),
+    'mailing_db_write_seconds': ('histogram', 'Запись попыток и отметок очереди пачки'),
+    'mailing_messages_total': ('counter', 'Отправленные письма по рассылкам и результату'),
+    'mailing_messages_per_second': ('gauge', 'Скорость отправки рассылки за последний запуск'),
+}
+# Границы корзин гистограмм в секундах, как у клиентов Prometheus по умолчанию
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Timer:
+    """Замер длительности блока with, результат уходит в гистограмму"""
+
+    def __init__(self, sink, name, labels):
+        self.sink = sink
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.sink.observe(self.name, time.perf_counter() - self.started, **self.labels)
+
+
+class NullSink:
+    """Метрики выключены: вызовы ничего не делают и почти ничего не стоят"""
+    # Свой приемник (StatsD, OpenTelemetry) наследуется отсюда и задается в MAILING_METRICS_SINK
+
+    enabled = False
+    _timer = nullcontext()
+
+    def increment(self, name, value=1, **labels):
+        pass
+
+    def set(self, name, value, **labels):
+        pass
+
+    def observe(self, name, seconds, **labels):
+        pass
+
+    def timer(self, name, **labels):
+        return self._timer
+
+    def forget(self, **labels):
+        pass
+
+    def as_dict(self):
+        return {'counters': [], 'gauges': [], 'histograms': []}
+
+    def to_prometheus(self):
+        return ''
+
+
+class MemorySink(NullSink):
+    """Счетчики, значения и гистограммы в памяти процесса"""
+
+    enabled = True
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        self.gauges = {}
+        # (имя, метки) -> [число попаданий в каждую корзину, сумма, количество]
+        self.histograms = {}
+        # Гистограммы пополняются из потоков движка async и планировщика
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def increment(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.gauges[key] = value
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def timer(self, name, **labels):
+        return Timer(self, name, labels)
+
+    def forget(self, **labels):
+        """Удаление всех метрик с такими метками, например завершенной рассылки"""
+        pairs = set(self._key('', labels)[1])
+        with self._lock:
+            for values in (self.counters, self.gauges, self.histograms):
+                for key in [key for key in values if pairs <= set(key[1])]:
+                    del values[key]
+
+    def snapshot(self):
+        """Копия всех метрик, согласованная на один момент"""
+        with self._lock:
+            return (
+                dict(self.counters),
+                dict(self.gauges),
+                {key: (list(counts), total, count) for key, (counts, total, count) in self.histograms.items()},
+            )
+
+    def as_dict(self):
+        """Метрики для выгрузки в JSON"""
+        counters, gauges, histograms = self.snapshot()
+        result = {'counters': [], 'gauges': [], 'histograms': []}
+        for kind, values in (('counters', counters), ('gauges', gauges)):
+            for (name, labels), value in sorted(values.items()):
+                result[kind].append({'name': name, 'labels': dict(labels), 'value': value})
+        for (name, labels), (counts, total, count) in sorted(histograms.items()):
+            result['histograms'].append({
+                'name': name,
+                'labels': dict(labels),
+                'count': count,
+                'sum': total,
+                'buckets': dict(zip([*map(str, self.buckets), '+Inf'], _cumulative(counts))),
+            })
+        return result
+
+    def to_prometheus(self):
+        """Метрики в текстовом формате Prometheus"""
+        counters, gauges, histograms = self.snapshot()
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                lines.append(f'# HELP {name} {METRICS.get(name, (kind, name))[1]}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        for kind, values in (('counter', counters), ('gauge', gauges)):
+            for (name, labels), value in sorted(values.items()):
+                describe(name, kind)
+                lines.append(f'{name}{_labels(labels)} {value}')
+        for (name, labels), (counts, total, count) in sorted(histograms.items()):
+            describe(name, 'histogram')
+            for bound, cumulative in zip([*map(str, self.buckets), '+Inf'], _cumulative(counts)):
+                lines.append(f'{name}_bucket{_labels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {total}')
+            lines.append(f'{name}_count{_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _cumulative(counts):
+    total = 0
+    for count in counts:
+        total += count
+        yield total
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+_sink = None
+
+
+def get_sink():
+    """Приемник метрик процесса из настройки MAILING_METRICS_SINK, без настройки — NullSink"""
+    global _sink
+    if _sink is None:
+        path = settings.MAILING_METRICS_SINK
+        _sink = import_string(path)() if path else NullSink()
+    return _sink
+
+
+def use_sink(sink):
+    """Замена приемника метрик процесса, возвращает прежний"""
+    global _sink
+    previous, _sink = _sink, sink
+    return previous
+
+
+def enable():
+    """Включение метрик процесса, если приемник не задан в настройках"""
+    sink = get_sink()
+    if not sink.enabled:
+        sink = MemorySink()
+        use_sink(sink)
+    return sink
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        sink = get_sink()
+        if self.path.split('?')[0] == '/metrics':
+            body = sink.to_prometheus().encode()
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        elif self.path.split('?')[0] == '/metrics.json':
+            body = json.dumps(sink.as_dict(), ensure_ascii=False).encode()
+            content_type = 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host='127.0.0.1'):
+    """HTTP-сервер метрик процесса в фоновом потоке: /metrics для Prometheus и /metrics.json"""
+    # Метрики отдаются без авторизации, поэтому по умолчанию сервер слушает только localhost
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='mailing-metrics', daemon=True).start()
+    return server
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.2 on 2026-10-18 03:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mailingattempt',
+            name='attempt_time',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время попытки'),
+        ),
+    ]
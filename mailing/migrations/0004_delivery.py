@@ -0,0 +1,35 @@
+# Generated by Django 5.0.2 on 2026-10-18 03:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0003_attempt_time_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Delivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает отправки'), ('leased', 'Отправляется'), ('sent', 'Отправлено'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('lease_token', models.CharField(blank=True, max_length=32, verbose_name='Метка захвата')),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True, verbose_name='Захват истекает')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='mailing.client', verbose_name='Получатель')),
+                ('mailing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='mailing.mailing', verbose_name='Рассылка')),
+            ],
+            options={
+                'verbose_name': 'Доставка',
+                'verbose_name_plural': 'Доставки',
+                'indexes': [models.Index(fields=['mailing', 'status'], name='delivery_mailing_status_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='delivery',
+            constraint=models.UniqueConstraint(fields=('mailing', 'client'), name='unique_delivery_recipient'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.0.2 on 2026-10-18 03:31
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0004_delivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailing',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now, verbose_name='Дата изменения'),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.0.2 on 2026-10-18 03:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0005_mailing_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mailing',
+            name='owner',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='mailings', to=settings.AUTH_USER_MODEL, verbose_name='Владелец'),
+        ),
+        migrations.AlterField(
+            model_name='mailingattempt',
+            name='mailing',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='attempts', to='mailing.mailing', verbose_name='Рассылка'),
+        ),
+        migrations.AddIndex(
+            model_name='mailing',
+            index=models.Index(fields=['owner', 'status'], name='mailing_owner_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mailing',
+            index=models.Index(fields=['status', 'start_time'], name='mailing_status_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mailing',
+            index=models.Index(fields=['status', 'end_time'], name='mailing_status_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mailingattempt',
+            index=models.Index(fields=['mailing', '-attempt_time'], name='attempt_mailing_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mailingattempt',
+            index=models.Index(fields=['-attempt_time'], name='attempt_time_idx'),
+        ),
+    ]
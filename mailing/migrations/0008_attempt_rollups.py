@@ -0,0 +1,37 @@
+# Generated by Django 5.0.2 on 2026-10-18 03:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0007_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttemptRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Час'), ('day', 'Сутки')], max_length=4, verbose_name='Период')),
+                ('bucket', models.DateTimeField(verbose_name='Начало периода')),
+                ('success_count', models.PositiveIntegerField(default=0, verbose_name='Успешных')),
+                ('failure_count', models.PositiveIntegerField(default=0, verbose_name='Неуспешных')),
+                ('mailing', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='mailing.mailing', verbose_name='Рассылка')),
+                ('owner', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='attempt_rollups', to=settings.AUTH_USER_MODEL, verbose_name='Владелец')),
+            ],
+            options={
+                'verbose_name': 'Сводка попыток',
+                'verbose_name_plural': 'Сводки попыток',
+                'indexes': [models.Index(fields=['owner', 'period', 'bucket'], name='rollup_owner_period_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='attemptrollup',
+            constraint=models.UniqueConstraint(fields=('mailing', 'period', 'bucket'), name='unique_attempt_rollup'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.2 on 2026-10-18 03:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0008_attempt_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата изменения'),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='body',
+            field=models.TextField(help_text='Можно использовать {{ full_name }}, {{ email }} и {{ comment }}', verbose_name='Тело письма'),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='subject',
+            field=models.CharField(help_text='Можно использовать {{ full_name }}, {{ email }} и {{ comment }}', max_length=255, verbose_name='Тема письма'),
+        ),
+    ]
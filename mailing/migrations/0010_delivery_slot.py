@@ -0,0 +1,26 @@
+# Generated by Django 5.0.2 on 2026-10-18 03:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0009_message_updated_at'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='delivery',
+            name='delivery_mailing_status_idx',
+        ),
+        migrations.AddField(
+            model_name='delivery',
+            name='slot',
+            field=models.PositiveIntegerField(default=0, verbose_name='Место в очереди домена'),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['mailing', 'status', 'slot'], name='delivery_mailing_slot_idx'),
+        ),
+    ]
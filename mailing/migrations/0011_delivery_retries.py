@@ -0,0 +1,32 @@
+# Generated by Django 5.0.2 on 2026-10-18 03:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0010_delivery_slot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='delivery',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0, verbose_name='Попыток отправки'),
+        ),
+        migrations.AddField(
+            model_name='delivery',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Следующая попытка'),
+        ),
+        migrations.AlterField(
+            model_name='delivery',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Ожидает отправки'), ('leased', 'Отправляется'), ('sent', 'Отправлено'), ('retry', 'Ожидает повтора'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус'),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='delivery_retry_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.2 on 2026-10-18 03:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0011_delivery_retries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailing',
+            name='enqueued_until',
+            field=models.PositiveIntegerField(default=0, verbose_name='Очередь заполнена до'),
+        ),
+        migrations.AddField(
+            model_name='mailingattempt',
+            name='client',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='attempts', to='mailing.client', verbose_name='Получатель'),
+        ),
+    ]
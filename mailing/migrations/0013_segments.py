@@ -0,0 +1,68 @@
+# Generated by Django 5.0.2 on 2026-10-18 04:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0012_delivery_ledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Segment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Название')),
+                ('kind', models.CharField(choices=[('static', 'Список клиентов'), ('dynamic', 'Условия отбора')], default='dynamic', max_length=10, verbose_name='Вид')),
+                ('email_domain', models.CharField(blank=True, help_text='Например, gmail.com', max_length=255, verbose_name='Домен email')),
+                ('full_name_contains', models.CharField(blank=True, max_length=255, verbose_name='Ф.И.О. содержит')),
+                ('comment_contains', models.CharField(blank=True, max_length=255, verbose_name='Комментарий содержит')),
+                ('created_after', models.DateTimeField(blank=True, null=True, verbose_name='Клиент добавлен после')),
+                ('created_before', models.DateTimeField(blank=True, null=True, verbose_name='Клиент добавлен до')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Сегмент',
+                'verbose_name_plural': 'Сегменты',
+            },
+        ),
+        migrations.AddField(
+            model_name='mailing',
+            name='segment_enqueued_until',
+            field=models.PositiveIntegerField(default=0, verbose_name='Сегмент в очереди до'),
+        ),
+        migrations.AlterField(
+            model_name='mailing',
+            name='recipients',
+            field=models.ManyToManyField(blank=True, related_name='mailings', to='mailing.client', verbose_name='Получатели'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['owner', 'id'], name='client_owner_id_idx'),
+        ),
+        migrations.AddField(
+            model_name='segment',
+            name='clients',
+            field=models.ManyToManyField(blank=True, related_name='segments', to='mailing.client', verbose_name='Клиенты'),
+        ),
+        migrations.AddField(
+            model_name='segment',
+            name='owner',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='segments', to=settings.AUTH_USER_MODEL, verbose_name='Владелец'),
+        ),
+        migrations.AddField(
+            model_name='mailing',
+            name='segment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='mailings', to='mailing.segment', verbose_name='Сегмент'),
+        ),
+        migrations.AddIndex(
+            model_name='segment',
+            index=models.Index(fields=['owner', 'created_at', 'id'], name='segment_owner_created_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+# Поисковые таблицы FTS5 с копией текста клиентов и сообщений: по всем колонкам и
+# отдельно по Ф.И.О. и теме, по которым выдача идет первой. rowid строки — id владельца
+# в старших 32 битах и id записи в младших: строки владельца идут подряд, и поиск читает
+# только их диапазон. Таблицы обновляют триггеры, а не сигналы: импорт клиентов
+# и bulk_create пишут в базу мимо сигналов
+TABLES = {
+    'mailing_client_search': ('mailing_client', ('full_name', 'email', 'comment')),
+    'mailing_client_name_search': ('mailing_client', ('full_name',)),
+    'mailing_message_search': ('mailing_message', ('subject', 'body')),
+    'mailing_message_subject_search': ('mailing_message', ('subject',)),
+}
+
+
+def _create(table, source, columns):
+    names = ', '.join(columns)
+    values = ', '.join(f'new.{column}' for column in columns)
+    insert = f'INSERT INTO {table}(rowid, {names}) VALUES ((new.owner_id << 32) + new.id, {values});'
+    delete = f'DELETE FROM {table} WHERE rowid = (old.owner_id << 32) + old.id;'
+    return [
+        f"CREATE VIRTUAL TABLE {table} USING fts5({names}, tokenize='unicode61 remove_diacritics 2', "
+        f"prefix='2 3 4 5 6')",
+        f'CREATE TRIGGER {table}_insert AFTER INSERT ON {source} BEGIN {insert} END',
+        f'CREATE TRIGGER {table}_delete AFTER DELETE ON {source} BEGIN {delete} END',
+        f'CREATE TRIGGER {table}_update AFTER UPDATE OF owner_id, {names} ON {source} BEGIN {delete} {insert} END',
+        f'INSERT INTO {table}(rowid, {names}) SELECT (owner_id << 32) + id, {names} FROM {source}',
+    ]
+
+
+def _drop(table):
+    return [f'DROP TRIGGER {table}_{event}' for event in ('insert', 'delete', 'update')] + [f'DROP TABLE {table}']
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0014_client_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(_create(table, source, columns), reverse_sql=_drop(table))
+        for table, (source, columns) in TABLES.items()
+    ]
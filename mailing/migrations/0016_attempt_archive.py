@@ -0,0 +1,31 @@
+# Generated by Django 5.0.2 on 2026-10-18 05:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0015_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttemptArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Сутки')),
+                ('path', models.CharField(max_length=255, unique=True, verbose_name='Файл')),
+                ('first_id', models.PositiveIntegerField(verbose_name='Первая попытка')),
+                ('last_id', models.PositiveIntegerField(verbose_name='Последняя попытка')),
+                ('rows', models.PositiveIntegerField(verbose_name='Попыток')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата архивации')),
+            ],
+            options={
+                'verbose_name': 'Архив попыток',
+                'verbose_name_plural': 'Архивы попыток',
+                'ordering': ['day', 'id'],
+                'indexes': [models.Index(fields=['day'], name='attempt_archive_day_idx')],
+            },
+        ),
+    ]
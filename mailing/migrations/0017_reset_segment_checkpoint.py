@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def reset_checkpoint(apps, schema_editor):
+    # Отметка постоянного сегмента теперь — id строки его списка, а не id клиента.
+    # Сброс безопасен: уже поставленных в очередь клиентов enqueue пропускает
+    Mailing = apps.get_model('mailing', 'Mailing')
+    Mailing.objects.exclude(segment_enqueued_until=0).update(segment_enqueued_until=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0016_attempt_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(reset_checkpoint, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.2 on 2026-10-18 05:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0017_reset_segment_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mailing',
+            name='segment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='mailings', to='mailing.segment', verbose_name='Сегмент'),
+        ),
+    ]
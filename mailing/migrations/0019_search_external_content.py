@@ -0,0 +1,84 @@
+from django.db import migrations
+
+# Поисковые таблицы без своей копии текста (external content): FTS5 хранит только индекс,
+# а текст при пересборке читает из представления над таблицей клиентов или сообщений.
+# rowid по-прежнему (id владельца << 32) + id записи, представление отдает его колонкой
+# search_rowid. Индексы начал слов — 2-5 букв, а не 2-6: каждый индекс начал повторяет
+# строки основного, и импорт клиентов с ним заметно медленнее
+PREFIX = '2 3 4 5'
+SOURCES = {
+    'mailing_client': ('full_name', 'email', 'comment'),
+    'mailing_message': ('subject', 'body'),
+}
+TABLES = {
+    'mailing_client_search': ('mailing_client', ('full_name', 'email', 'comment')),
+    'mailing_client_name_search': ('mailing_client', ('full_name',)),
+    'mailing_message_search': ('mailing_message', ('subject', 'body')),
+    'mailing_message_subject_search': ('mailing_message', ('subject',)),
+}
+
+
+def _view(source, columns):
+    return [
+        f'CREATE VIEW {source}_search_content AS '
+        f'SELECT (owner_id << 32) + id AS search_rowid, {", ".join(columns)} FROM {source}'
+    ]
+
+
+def _create(table, source, columns):
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{column}' for column in columns)
+    old = ', '.join(f'old.{column}' for column in columns)
+    insert = f'INSERT INTO {table}(rowid, {names}) VALUES ((new.owner_id << 32) + new.id, {new});'
+    # Из таблицы без копии текста строка удаляется командой 'delete' с прежними значениями
+    delete = f"INSERT INTO {table}({table}, rowid, {names}) VALUES ('delete', (old.owner_id << 32) + old.id, {old});"
+    return [
+        f"CREATE VIRTUAL TABLE {table} USING fts5({names}, tokenize='unicode61 remove_diacritics 2', "
+        f"prefix='{PREFIX}', content='{source}_search_content', content_rowid='search_rowid')",
+        f'CREATE TRIGGER {table}_insert AFTER INSERT ON {source} BEGIN {insert} END',
+        f'CREATE TRIGGER {table}_delete AFTER DELETE ON {source} BEGIN {delete} END',
+        f'CREATE TRIGGER {table}_update AFTER UPDATE OF owner_id, {names} ON {source} BEGIN {delete} {insert} END',
+        f"INSERT INTO {table}({table}) VALUES ('rebuild')",
+    ]
+
+
+def _create_copy(table, source, columns):
+    """Таблица с копией текста из 0015_search, для отката"""
+    names = ', '.join(columns)
+    values = ', '.join(f'new.{column}' for column in columns)
+    insert = f'INSERT INTO {table}(rowid, {names}) VALUES ((new.owner_id << 32) + new.id, {values});'
+    delete = f'DELETE FROM {table} WHERE rowid = (old.owner_id << 32) + old.id;'
+    return [
+        f"CREATE VIRTUAL TABLE {table} USING fts5({names}, tokenize='unicode61 remove_diacritics 2', "
+        f"prefix='2 3 4 5 6')",
+        f'CREATE TRIGGER {table}_insert AFTER INSERT ON {source} BEGIN {insert} END',
+        f'CREATE TRIGGER {table}_delete AFTER DELETE ON {source} BEGIN {delete} END',
+        f'CREATE TRIGGER {table}_update AFTER UPDATE OF owner_id, {names} ON {source} BEGIN {delete} {insert} END',
+        f'INSERT INTO {table}(rowid, {names}) SELECT (owner_id << 32) + id, {names} FROM {source}',
+    ]
+
+
+def _drop(table):
+    return [f'DROP TRIGGER {table}_{event}' for event in ('insert', 'delete', 'update')] + [f'DROP TABLE {table}']
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0018_mailing_segment_restrict'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            [sql for table in TABLES for sql in _drop(table)],
+            reverse_sql=[sql for table, (source, columns) in TABLES.items() for sql in _create_copy(table, source, columns)],
+        ),
+        migrations.RunSQL(
+            [sql for source, columns in SOURCES.items() for sql in _view(source, columns)],
+            reverse_sql=[f'DROP VIEW {source}_search_content' for source in SOURCES],
+        ),
+        *(
+            migrations.RunSQL(_create(table, source, columns), reverse_sql=_drop(table))
+            for table, (source, columns) in TABLES.items()
+        ),
+    ]
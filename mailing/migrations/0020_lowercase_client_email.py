@@ -0,0 +1,37 @@
+from django.db import migrations
+
+CHUNK_SIZE = 500
+
+
+def lowercase_emails(apps, schema_editor):
+    # Формы и импорт приводят email к нижнему регистру, и подсказки получателей ищут его
+    # началом в нижнем регистре. Адрес, чья строчная форма уже занята другим клиентом,
+    # остается как есть: уникальность email важнее
+    Client = apps.get_model('mailing', 'Client')
+    changed = [
+        (pk, email.lower())
+        for pk, email in Client.objects.order_by('id').values_list('id', 'email').iterator()
+        if email != email.lower()
+    ]
+    taken = set()
+    for start in range(0, len(changed), CHUNK_SIZE):
+        lowered = [email for _, email in changed[start:start + CHUNK_SIZE]]
+        taken.update(Client.objects.filter(email__in=lowered).values_list('email', flat=True))
+    updates = []
+    for pk, email in changed:
+        if email in taken:
+            continue
+        taken.add(email)
+        updates.append(Client(pk=pk, email=email))
+    Client.objects.bulk_update(updates, ['email'], batch_size=CHUNK_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0019_search_external_content'),
+    ]
+
+    operations = [
+        migrations.RunPython(lowercase_emails, migrations.RunPython.noop),
+    ]
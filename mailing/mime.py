@@ -0,0 +1,103 @@
+from email import policy
+from email.utils import formatdate, make_msgid
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.core.mail.message import DNS_NAME, forbid_multi_line_headers, sanitize_address
+
+CRLF = b'\r\n'
+# Сворачивание заголовков, как в as_bytes(linesep='\r\n') письма Django
+HEADER_POLICY = policy.compat32.clone(linesep='\r\n')
+
+
+def subject_header(subject, encoding):
+    """Заголовок Subject в байтах, закодированный и свернутый так же, как в EmailMessage"""
+    # BadHeaderError на перевод строки, как и при сборке письма Django
+    name, value = forbid_multi_line_headers('Subject', subject, encoding)
+    return HEADER_POLICY.fold_binary(name, value)
+
+
+class EncodedMessage:
+    """Готовые байты письма вместо email.message.Message для backend'ов Django"""
+    # Backend'ы вызывают только as_bytes() и get_charset()
+
+    def __init__(self, data):
+        self.data = data
+
+    def as_bytes(self, linesep='\n'):
+        if linesep == '\r\n':
+            return self.data
+        return self.data.replace(CRLF, linesep.encode())
+
+    def get_charset(self):
+        return None
+
+
+class PreEncodedEmail(EmailMessage):
+    """Письмо, чьи байты уже собраны; message() не кодирует его заново"""
+
+    def __init__(self, data, subject, body, from_email, to):
+        super().__init__(subject=subject, body=body, from_email=from_email, to=to)
+        self.data = data
+
+    def message(self):
+        return EncodedMessage(self.data)
+
+
+class PreparedMessage:
+    """Письмо, закодированное в MIME один раз; для получателя добавляются только его заголовки"""
+
+    def __init__(self, subject, body, from_email=None):
+        self.subject = subject
+        self.body = body
+        self.from_email = from_email or settings.DEFAULT_FROM_EMAIL
+        self.encoding = settings.DEFAULT_CHARSET
+        mime = EmailMessage(subject=subject, body=body, from_email=self.from_email).message()
+        # Заголовки, которые у каждого получателя свои, собираются в for_recipient
+        for header in ('To', 'Date', 'Message-ID'):
+            del mime[header]
+        headers, self.payload = mime.as_bytes(linesep='\r\n').split(CRLF + CRLF, 1)
+        # Тема вырезается из общих заголовков: письмо с другой темой собирается без кодирования тела
+        self.head, self.subject_header, self.tail = (headers + CRLF).partition(
+            subject_header(subject, self.encoding)
+        )
+
+    def for_recipient(self, email, subject=None):
+        """Письмо одному получателю из общих заголовков и тела без повторного кодирования;
+        subject — своя тема получателя"""
+        recipient = sanitize_address(email, self.encoding).encode()
+        date = formatdate(localtime=settings.EMAIL_USE_LOCALTIME).encode()
+        message_id = make_msgid(domain=DNS_NAME).encode()
+        if subject is None:
+            subject, header = self.subject, self.subject_header
+        else:
+            header = subject_header(subject, self.encoding)
+        data = b''.join([
+            self.head, header, self.tail,
+            b'To: ', recipient, CRLF,
+            b'Date: ', date, CRLF,
+            b'Message-ID: ', message_id, CRLF,
+            CRLF, self.payload,
+        ])
+        return PreEncodedEmail(data, subject, self.body, self.from_email, [email])
+
+
+class MessageEncoder:
+    """Письма рассылки: тело без подстановок кодируется в MIME один раз на всю рассылку"""
+
+    def __init__(self, compiled, from_email=None):
+        self.compiled = compiled
+        self.from_email = from_email
+        self.shared = None
+        if compiled.body.is_static:
+            # С подстановками только в теме получателю собирается лишь заголовок Subject
+            self.shared = PreparedMessage(compiled.subject.text, compiled.body.text, from_email)
+
+    def for_client(self, client):
+        if self.shared is not None:
+            if self.compiled.is_static:
+                return self.shared.for_recipient(client.email)
+            subject, _ = self.compiled.render(client)
+            return self.shared.for_recipient(client.email, subject)
+        subject, body = self.compiled.render(client)
+        return PreparedMessage(subject, body, self.from_email).for_recipient(client.email)
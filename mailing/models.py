@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -9,7 +10,10 @@ class Client(models.Model):
     email = models.EmailField(unique=True, verbose_name='Email')
     full_name = models.CharField(max_length=255, verbose_name='Ф.И.О.')
     comment = models.TextField(blank=True, verbose_name='Комментарий')
-    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='clients', verbose_name='Владелец')
+    # Отдельный индекс не нужен: owner — первое поле индекса (owner, created_at, id)
+    owner = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='clients', verbose_name='Владелец', db_index=False
+    )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
 
     class Meta:
@@ -18,6 +22,15 @@ class Client(models.Model):
         permissions = [
             ('view_all_clients', 'Может просматривать всех клиентов'),
         ]
+        indexes = [
+            # Постраничный список клиентов по ключу (created_at, id)
+            models.Index(fields=['owner', 'created_at', 'id'], name='client_owner_created_idx'),
+            # Чтение клиентов сегмента при отправке: по возрастанию id без сортировки
+            models.Index(fields=['owner', 'id'], name='client_owner_id_idx'),
+            # Подсказки получателей: поиск по началу email и Ф.И.О.
+            models.Index(fields=['owner', 'email'], name='client_owner_email_idx'),
+            models.Index(fields=['owner', 'full_name'], name='client_owner_name_idx'),
+        ]
 
     def __str__(self):
         return f"{self.full_name} ({self.email})"
@@ -25,10 +38,19 @@ class Client(models.Model):
 
 class Message(models.Model):
     """Модель сообщения"""
-    subject = models.CharField(max_length=255, verbose_name='Тема письма')
-    body = models.TextField(verbose_name='Тело письма')
-    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='messages', verbose_name='Владелец')
+    subject = models.CharField(
+        max_length=255, verbose_name='Тема письма', help_text='Можно использовать {{ full_name }}, {{ email }} и {{ comment }}'
+    )
+    body = models.TextField(
+        verbose_name='Тело письма', help_text='Можно использовать {{ full_name }}, {{ email }} и {{ comment }}'
+    )
+    # Отдельный индекс не нужен: owner — первое поле индекса (owner, created_at, id)
+    owner = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='messages', verbose_name='Владелец', db_index=False
+    )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    # Версия текста для кеша разобранных шаблонов при отправке
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
 
     class Meta:
         verbose_name = 'Сообщение'
@@ -36,11 +58,68 @@ class Message(models.Model):
         permissions = [
             ('view_all_messages', 'Может просматривать все сообщения'),
         ]
+        indexes = [
+            # Постраничный список сообщений по ключу (created_at, id)
+            models.Index(fields=['owner', 'created_at', 'id'], name='message_owner_created_idx'),
+        ]
 
     def __str__(self):
         return self.subject
 
 
+class Segment(models.Model):
+    """Сегмент получателей: постоянный список клиентов или условия отбора"""
+    KIND_CHOICES = [
+        ('static', 'Список клиентов'),
+        ('dynamic', 'Условия отбора'),
+    ]
+
+    name = models.CharField(max_length=255, verbose_name='Название')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default='dynamic', verbose_name='Вид')
+    # Список хранится один раз и используется всеми рассылками на этот сегмент
+    clients = models.ManyToManyField(Client, blank=True, related_name='segments', verbose_name='Клиенты')
+    # Условия отбора проверяются при отправке; пустые условия — все клиенты владельца
+    email_domain = models.CharField(max_length=255, blank=True, verbose_name='Домен email', help_text='Например, gmail.com')
+    full_name_contains = models.CharField(max_length=255, blank=True, verbose_name='Ф.И.О. содержит')
+    comment_contains = models.CharField(max_length=255, blank=True, verbose_name='Комментарий содержит')
+    created_after = models.DateTimeField(null=True, blank=True, verbose_name='Клиент добавлен после')
+    created_before = models.DateTimeField(null=True, blank=True, verbose_name='Клиент добавлен до')
+    # Отдельный индекс не нужен: owner — первое поле индекса (owner, created_at, id)
+    owner = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='segments', verbose_name='Владелец', db_index=False
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
+
+    class Meta:
+        verbose_name = 'Сегмент'
+        verbose_name_plural = 'Сегменты'
+        indexes = [
+            # Постраничный список сегментов по ключу (created_at, id)
+            models.Index(fields=['owner', 'created_at', 'id'], name='segment_owner_created_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    def get_clients(self):
+        """Клиенты сегмента: ленивый queryset, условия проверяются при каждом чтении"""
+        if self.kind == 'static':
+            return Client.objects.filter(segments=self)
+        clients = Client.objects.filter(owner_id=self.owner_id)
+        if self.email_domain:
+            clients = clients.filter(email__iendswith='@' + self.email_domain.lstrip('@'))
+        if self.full_name_contains:
+            clients = clients.filter(full_name__icontains=self.full_name_contains)
+        if self.comment_contains:
+            clients = clients.filter(comment__icontains=self.comment_contains)
+        if self.created_after:
+            clients = clients.filter(created_at__gte=self.created_after)
+        if self.created_before:
+            clients = clients.filter(created_at__lt=self.created_before)
+        return clients
+
+
 class Mailing(models.Model):
     """Модель рассылки"""
     STATUS_CHOICES = [
@@ -53,10 +132,25 @@ class Mailing(models.Model):
     end_time = models.DateTimeField(verbose_name='Время окончания')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='created', verbose_name='Статус')
     message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='mailings', verbose_name='Сообщение')
-    recipients = models.ManyToManyField(Client, related_name='mailings', verbose_name='Получатели')
-    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='mailings', verbose_name='Владелец')
+    recipients = models.ManyToManyField(Client, blank=True, related_name='mailings', verbose_name='Получатели')
+    # Сегмент читается при отправке, строки получателей для рассылки не копируются
+    segment = models.ForeignKey(
+        Segment, on_delete=models.RESTRICT, null=True, blank=True, related_name='mailings', verbose_name='Сегмент'
+    )
+    # Отдельный индекс не нужен: owner — первое поле индекса (owner, status)
+    owner = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='mailings', verbose_name='Владелец', db_index=False
+    )
     is_active = models.BooleanField(default=True, verbose_name='Активна')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    # По этому полю планировщик догружает новые и измененные рассылки
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name='Дата изменения')
+    # id последней строки получателей, уже поставленной в очередь доставки: повторный
+    # запуск дочитывает только новых получателей
+    enqueued_until = models.PositiveIntegerField(default=0, verbose_name='Очередь заполнена до')
+    # То же для постоянного сегмента: id последней строки его списка, поставленной в очередь.
+    # Сбрасывается при смене сегмента; условия отбора проверяются при каждом запуске заново
+    segment_enqueued_until = models.PositiveIntegerField(default=0, verbose_name='Сегмент в очереди до')
 
     class Meta:
         verbose_name = 'Рассылка'
@@ -65,6 +159,15 @@ class Mailing(models.Model):
             ('view_all_mailings', 'Может просматривать все рассылки'),
             ('deactivate_mailing', 'Может отключать рассылки'),
         ]
+        indexes = [
+            # Главная: рассылки пользователя и активные среди них
+            models.Index(fields=['owner', 'status'], name='mailing_owner_status_idx'),
+            # Постраничный список рассылок по ключу (created_at, id)
+            models.Index(fields=['owner', 'created_at', 'id'], name='mailing_owner_created_idx'),
+            # Пересчет статусов и выбор активных рассылок в send_mailings
+            models.Index(fields=['status', 'start_time'], name='mailing_status_start_idx'),
+            models.Index(fields=['status', 'end_time'], name='mailing_status_end_idx'),
+        ]
 
     def __str__(self):
         return f"Рассылка #{self.id} - {self.message.subject}"
@@ -85,11 +188,37 @@ class Mailing(models.Model):
             self.status = new_status
             self.save(update_fields=['status'])
 
+    @classmethod
+    def sweep_statuses(cls, now=None):
+        """Обновление статусов всех рассылок фиксированным числом запросов"""
+        # Правила те же, что в update_status. Возвращает {новый статус: id измененных рассылок}
+        now = now or timezone.now()
+
+        rules = {
+            'created': models.Q(start_time__gt=now),
+            'started': models.Q(start_time__lte=now, end_time__gte=now),
+            'completed': models.Q(end_time__lt=now),
+        }
+        changed = {}
+        with transaction.atomic():
+            for status, condition in rules.items():
+                # status IN (...), а не exclude: так условие идет по индексам (status, время)
+                others = [other for other in rules if other != status]
+                due = cls.objects.filter(condition, status__in=others)
+                changed[status] = list(due.values_list('id', flat=True))
+                if changed[status]:
+                    due.update(status=status)
+        return changed
+
     def clean(self):
         """Валидация времени рассылки"""
         from django.core.exceptions import ValidationError
         from django.utils import timezone
 
+        # Незаполненное время уже отмечено ошибкой поля формы
+        if self.start_time is None or self.end_time is None:
+            return
+
         if self.start_time >= self.end_time:
             raise ValidationError('Время начала должно быть раньше времени окончания')
 
@@ -104,8 +233,15 @@ class MailingAttempt(models.Model):
         ('failure', 'Не успешно'),
     ]
 
-    mailing = models.ForeignKey(Mailing, on_delete=models.CASCADE, related_name='attempts', verbose_name='Рассылка')
-    attempt_time = models.DateTimeField(auto_now_add=True, verbose_name='Время попытки')
+    # Отдельный индекс не нужен: mailing — первое поле индекса (mailing, -attempt_time)
+    mailing = models.ForeignKey(
+        Mailing, on_delete=models.CASCADE, related_name='attempts', verbose_name='Рассылка', db_index=False
+    )
+    client = models.ForeignKey(
+        Client, on_delete=models.SET_NULL, null=True, blank=True, related_name='attempts', verbose_name='Получатель'
+    )
+    # Время задается при создании объекта, а не при записи: попытки пишутся пачками
+    attempt_time = models.DateTimeField(default=timezone.now, verbose_name='Время попытки')
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, verbose_name='Статус')
     server_response = models.TextField(verbose_name='Ответ сервера')
 
@@ -113,7 +249,107 @@ class MailingAttempt(models.Model):
         verbose_name = 'Попытка рассылки'
         verbose_name_plural = 'Попытки рассылок'
         ordering = ['-attempt_time']
+        indexes = [
+            # Последние попытки рассылки и общий журнал попыток
+            models.Index(fields=['mailing', '-attempt_time'], name='attempt_mailing_time_idx'),
+            models.Index(fields=['-attempt_time'], name='attempt_time_idx'),
+        ]
 
     def __str__(self):
         return f"Попытка #{self.id} - {self.get_status_display()}"
 
+
+class Delivery(models.Model):
+    """Очередь доставки: одна строка на получателя рассылки"""
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает отправки'),
+        ('leased', 'Отправляется'),
+        ('sent', 'Отправлено'),
+        ('retry', 'Ожидает повтора'),
+        ('failed', 'Ошибка'),
+    ]
+
+    mailing = models.ForeignKey(Mailing, on_delete=models.CASCADE, related_name='deliveries', verbose_name='Рассылка')
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='deliveries', verbose_name='Получатель')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name='Статус')
+    lease_token = models.CharField(max_length=32, blank=True, verbose_name='Метка захвата')
+    lease_expires_at = models.DateTimeField(null=True, blank=True, verbose_name='Захват истекает')
+    # Номер получателя среди получателей того же домена: очередь выбирается по нему,
+    # поэтому в каждой пачке домены чередуются
+    slot = models.PositiveIntegerField(default=0, verbose_name='Место в очереди домена')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Попыток отправки')
+    next_attempt_at = models.DateTimeField(null=True, blank=True, verbose_name='Следующая попытка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+
+    class Meta:
+        verbose_name = 'Доставка'
+        verbose_name_plural = 'Доставки'
+        constraints = [
+            models.UniqueConstraint(fields=['mailing', 'client'], name='unique_delivery_recipient'),
+        ]
+        indexes = [
+            models.Index(fields=['mailing', 'status', 'slot'], name='delivery_mailing_slot_idx'),
+            # Поиск рассылок, у которых подошло время повторов
+            models.Index(fields=['status', 'next_attempt_at'], name='delivery_retry_idx'),
+        ]
+
+    def __str__(self):
+        return f"Доставка #{self.id} - {self.get_status_display()}"
+
+
+class AttemptRollup(models.Model):
+    """Сводка попыток рассылки за час или сутки"""
+    PERIOD_CHOICES = [
+        ('hour', 'Час'),
+        ('day', 'Сутки'),
+    ]
+
+    # Владелец хранится в сводке, чтобы статистика пользователя не требовала соединения с рассылками
+    owner = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='attempt_rollups', verbose_name='Владелец', db_index=False
+    )
+    # Отдельный индекс не нужен: mailing — первое поле уникального ограничения
+    mailing = models.ForeignKey(
+        Mailing, on_delete=models.CASCADE, related_name='rollups', verbose_name='Рассылка', db_index=False
+    )
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES, verbose_name='Период')
+    bucket = models.DateTimeField(verbose_name='Начало периода')
+    success_count = models.PositiveIntegerField(default=0, verbose_name='Успешных')
+    failure_count = models.PositiveIntegerField(default=0, verbose_name='Неуспешных')
+
+    class Meta:
+        verbose_name = 'Сводка попыток'
+        verbose_name_plural = 'Сводки попыток'
+        constraints = [
+            models.UniqueConstraint(fields=['mailing', 'period', 'bucket'], name='unique_attempt_rollup'),
+        ]
+        indexes = [
+            # Статистика пользователя за последние часы или сутки
+            models.Index(fields=['owner', 'period', 'bucket'], name='rollup_owner_period_idx'),
+        ]
+
+    def __str__(self):
+        return f"Сводка #{self.mailing_id} - {self.bucket:%d.%m.%Y %H:%M}"
+
+
+class AttemptArchive(models.Model):
+    """Файл архива попыток: попытки одних суток, перенесенные из журнала"""
+    # Строки архива не ссылаются на рассылки: рассылку можно удалить, архив остается
+    day = models.DateField(verbose_name='Сутки')
+    path = models.CharField(max_length=255, unique=True, verbose_name='Файл')
+    first_id = models.PositiveIntegerField(verbose_name='Первая попытка')
+    last_id = models.PositiveIntegerField(verbose_name='Последняя попытка')
+    rows = models.PositiveIntegerField(verbose_name='Попыток')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата архивации')
+
+    class Meta:
+        verbose_name = 'Архив попыток'
+        verbose_name_plural = 'Архивы попыток'
+        # Файлы одних суток идут в порядке записи, а попытки в файле — по времени
+        ordering = ['day', 'id']
+        indexes = [
+            models.Index(fields=['day'], name='attempt_archive_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"Архив {self.day:%d.%m.%Y} - {self.rows}"
@@ -0,0 +1,91 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+def encode_cursor(obj, field='created_at'):
+    """Курсор страницы: (field, id) строки в безопасном для URL виде"""
+    raw = f'{getattr(obj, field).isoformat()}|{obj.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Разбор курсора, для испорченного курсора возвращает None"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    """Страница списка по ключу (field, id), от новых к старым"""
+    # Запрос выполняется при первом обращении к строкам, поэтому при попадании
+    # в кеш фрагмента шаблона база не читается
+
+    def __init__(self, queryset, per_page, after=None, before=None, field='created_at'):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.field = field
+        self.after = decode_cursor(after) if after else None
+        self.before = decode_cursor(before) if before else None
+
+    def page_queryset(self):
+        """Запрос строк страницы с одной лишней строкой для проверки соседней страницы"""
+        field = self.field
+        if self.before:
+            value, pk = self.before
+            return (
+                self.queryset
+                .filter(**{f'{field}__gte': value})
+                .exclude(Q(**{field: value}, id__lte=pk))
+                .order_by(field, 'id')[:self.per_page + 1]
+            )
+        queryset = self.queryset
+        if self.after:
+            value, pk = self.after
+            queryset = queryset.filter(**{f'{field}__lte': value}).exclude(Q(**{field: value}, id__gte=pk))
+        return queryset.order_by(f'-{field}', '-id')[:self.per_page + 1]
+
+    @cached_property
+    def _rows(self):
+        rows = list(self.page_queryset())
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if self.before:
+            rows.reverse()
+        return rows, has_more
+
+    @property
+    def object_list(self):
+        return self._rows[0]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        # При переходе назад следующая страница есть всегда
+        return bool(self.before) or self._rows[1]
+
+    @property
+    def has_previous(self):
+        if self.before:
+            return self._rows[1]
+        return bool(self.after)
+
+    @property
+    def next_cursor(self):
+        if self.has_next and self.object_list:
+            return encode_cursor(self.object_list[-1], self.field)
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous and self.object_list:
+            return encode_cursor(self.object_list[0], self.field)
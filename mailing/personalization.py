@@ -0,0 +1,77 @@
+import re
+import threading
+from collections import OrderedDict
+
+# Подстановки вида {{ full_name }}; неизвестные имена остаются в тексте как есть
+PLACEHOLDER = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+FIELDS = ('full_name', 'email', 'comment')
+# Перевод строки в заголовке письма запрещен: тема и значения в ней пишутся одной строкой
+LINE_BREAKS = re.compile(r'\s*[\r\n]+\s*')
+CACHE_SIZE = 256
+
+
+class CompiledTemplate:
+    """Текст, разобранный один раз в строку формата для str.format_map"""
+
+    def __init__(self, text):
+        parts = []
+        position = 0
+        self.fields = set()
+        for match in PLACEHOLDER.finditer(text):
+            if match.group(1) not in FIELDS:
+                continue
+            parts.append(text[position:match.start()].replace('{', '{{').replace('}', '}}'))
+            parts.append('{%s}' % match.group(1))
+            self.fields.add(match.group(1))
+            position = match.end()
+        parts.append(text[position:].replace('{', '{{').replace('}', '}}'))
+        self.text = text
+        self.format = ''.join(parts)
+
+    @property
+    def is_static(self):
+        return not self.fields
+
+    def render(self, values):
+        if not self.fields:
+            return self.text
+        return self.format.format_map(values)
+
+
+class CompiledMessage:
+    """Тема и тело сообщения, готовые к подстановке данных получателя"""
+
+    def __init__(self, subject, body):
+        self.subject = CompiledTemplate(LINE_BREAKS.sub(' ', subject))
+        self.body = CompiledTemplate(body)
+        self.fields = self.subject.fields | self.body.fields
+
+    @property
+    def is_static(self):
+        return not self.fields
+
+    def render(self, client):
+        """Тема и тело для одного получателя"""
+        values = {field: getattr(client, field) for field in self.fields}
+        inline = {field: LINE_BREAKS.sub(' ', value) for field, value in values.items()}
+        return self.subject.render(inline), self.body.render(values)
+
+
+_compiled = OrderedDict()
+# Кеш общий для потоков планировщика: без блокировки move_to_end падает на ключе,
+# который другой поток только что вытеснил
+_compiled_lock = threading.Lock()
+
+
+def compile_message(message):
+    """Разобранное сообщение из кеша процесса по id и времени изменения сообщения"""
+    key = (message.pk, message.updated_at)
+    with _compiled_lock:
+        compiled = _compiled.get(key)
+        if compiled is None:
+            compiled = _compiled[key] = CompiledMessage(message.subject, message.body)
+            if len(_compiled) > CACHE_SIZE:
+                _compiled.popitem(last=False)
+        else:
+            _compiled.move_to_end(key)
+        return compiled
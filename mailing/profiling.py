@@ -0,0 +1,108 @@
+import heapq
+import logging
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_log = None
+
+
+def query_budget(count):
+    """Декоратор функции-представления: не больше count запросов к базе на GET-запрос"""
+    # У классов-представлений то же задается атрибутом query_budget
+    def decorator(view):
+        view.query_budget = count
+        return view
+    return decorator
+
+
+def get_budget(view):
+    return getattr(getattr(view, 'view_class', view), 'query_budget', None)
+
+
+def recent():
+    """Кольцевой журнал последних ответов, новые в конце"""
+    global _log
+    if _log is None:
+        _log = deque(maxlen=settings.QUERY_PROFILE_LOG_SIZE)
+    return _log
+
+
+class QueryProfile:
+    """Число запросов, общее время SQL и самые медленные запросы одного ответа"""
+
+    def __init__(self, slowest=None):
+        self.count = 0
+        self.seconds = 0.0
+        self.size = slowest or settings.QUERY_PROFILE_SLOWEST
+        # Куча (время, номер, sql) из size самых медленных запросов
+        self._slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.seconds += duration
+            item = (duration, self.count, sql)
+            if len(self._slowest) < self.size:
+                heapq.heappush(self._slowest, item)
+            else:
+                heapq.heappushpop(self._slowest, item)
+
+    @property
+    def slowest(self):
+        """Самые медленные запросы: (миллисекунды, sql) по убыванию времени"""
+        return [(duration * 1000, sql) for duration, _, sql in sorted(self._slowest, reverse=True)]
+
+
+class QueryProfilingMiddleware:
+    """Число и время запросов к базе каждого ответа в заголовках X-Query-* и в журнале recent()"""
+
+    # Потоковые ответы (выгрузки) читают базу уже после middleware, их запросы не учитываются
+
+    def __init__(self, get_response):
+        if not settings.QUERY_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = QueryProfile()
+        with connection.execute_wrapper(profile):
+            response = self.get_response(request)
+
+        budget = getattr(request, 'query_budget', None)
+        response['X-Query-Count'] = str(profile.count)
+        response['X-Query-Time'] = f'{profile.seconds * 1000:.1f}'
+        response['Server-Timing'] = f'db;dur={profile.seconds * 1000:.1f}'
+        if budget is not None:
+            response['X-Query-Budget'] = str(budget)
+        view = getattr(request, 'resolver_match', None)
+        recent().append({
+            'time': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'view': view.view_name if view else None,
+            'status': response.status_code,
+            'queries': profile.count,
+            'sql_ms': round(profile.seconds * 1000, 1),
+            'budget': budget,
+            'slowest': profile.slowest,
+        })
+        # Бюджет задан для чтения: сохранение формы делает больше запросов
+        if budget is not None and request.method in ('GET', 'HEAD') and profile.count > budget:
+            logger.warning(
+                '%s %s: %d запросов к базе при бюджете %d', request.method, request.path, profile.count, budget
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = get_budget(view_func)
@@ -0,0 +1,32 @@
+import random
+import smtplib
+from datetime import timedelta
+
+from django.conf import settings
+
+
+def is_permanent(error):
+    """Ошибка, после которой повтор не поможет: ответ 5xx о самом письме или некорректный адрес"""
+    # Окончательны только ответы на RCPT TO и DATA: они о конкретном получателе и письме.
+    # 5xx при подключении, HELO, входе (535 при переподключении) и MAIL FROM касаются
+    # соединения и всех писем пачки, поэтому, как разрывы связи, таймауты и 4xx, временные
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(500 <= code < 600 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPDataError):
+        return 500 <= error.smtp_code < 600
+    return isinstance(error, ValueError)
+
+
+def backoff(attempts):
+    """Задержка перед повтором номер attempts: экспонента со случайным разбросом"""
+    delay = min(settings.MAILING_RETRY_MAX_SECONDS, settings.MAILING_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    # Половина задержки случайна, чтобы повторы многих писем не пришлись на один момент
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def next_attempt_at(attempts, now, end_time):
+    """Время следующей попытки или None, если попытки кончились или рассылка закончится раньше"""
+    if attempts >= settings.MAILING_RETRY_MAX_ATTEMPTS:
+        return None
+    when = now + timedelta(seconds=backoff(attempts))
+    return when if when <= end_time else None
@@ -0,0 +1,102 @@
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import F, Max, Sum
+from django.utils import timezone
+
+from .models import AttemptArchive, AttemptRollup, Mailing, MailingAttempt
+
+PERIODS = ('hour', 'day')
+
+
+def bucket_start(moment, period):
+    """Начало часа или суток, в которые попадает момент, в текущем часовом поясе"""
+    local = timezone.localtime(moment).replace(minute=0, second=0, microsecond=0)
+    if period == 'day':
+        local = local.replace(hour=0)
+    return local
+
+
+def add_attempts(rows):
+    """Прибавление попыток к сводкам; rows — кортежи (mailing_id, attempt_time, status)"""
+    counts = Counter()
+    for mailing_id, attempt_time, status in rows:
+        for period in PERIODS:
+            counts[mailing_id, period, bucket_start(attempt_time, period), status] += 1
+    if not counts:
+        return
+
+    keys = {key[:3] for key in counts}
+    owners = dict(
+        Mailing.objects.filter(id__in={mailing_id for mailing_id, _, _ in keys}).values_list('id', 'owner_id')
+    )
+    with transaction.atomic():
+        # Пустые строки создаются заранее, дальше только приращения счетчиков,
+        # поэтому параллельные процессы не теряют и не дублируют попытки
+        AttemptRollup.objects.bulk_create(
+            [
+                AttemptRollup(owner_id=owners[mailing_id], mailing_id=mailing_id, period=period, bucket=bucket)
+                for mailing_id, period, bucket in keys
+            ],
+            ignore_conflicts=True,
+        )
+        for mailing_id, period, bucket in keys:
+            AttemptRollup.objects.filter(mailing_id=mailing_id, period=period, bucket=bucket).update(
+                success_count=F('success_count') + counts[mailing_id, period, bucket, 'success'],
+                failure_count=F('failure_count') + counts[mailing_id, period, bucket, 'failure'],
+            )
+
+
+def archived_until():
+    """Начало суток после последних суток архива попыток, без архива None"""
+    day = AttemptArchive.objects.aggregate(day=Max('day'))['day']
+    if day is None:
+        return None
+    return timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def rebuild(chunk_size=10_000):
+    """Пересчет сводок по журналу попыток, возвращает владельцев, чья статистика могла измениться"""
+    # Попыток из архива в журнале нет, поэтому их сводки остаются как есть.
+    # Одна транзакция: до ее завершения страницы статистики видят прежние сводки
+    since = archived_until()
+    with transaction.atomic():
+        rollups = AttemptRollup.objects.all()
+        attempts = MailingAttempt.objects.all()
+        if since is not None:
+            rollups = rollups.filter(bucket__gte=since)
+            attempts = attempts.filter(attempt_time__gte=since)
+        owner_ids = set(rollups.values_list('owner_id', flat=True).distinct())
+        rollups.delete()
+        last_id = 0
+        while True:
+            rows = list(
+                attempts.filter(id__gt=last_id).order_by('id')
+                .values_list('id', 'mailing_id', 'attempt_time', 'status')[:chunk_size]
+            )
+            if not rows:
+                break
+            add_attempts(row[1:] for row in rows)
+            last_id = rows[-1][0]
+        owner_ids.update(AttemptRollup.objects.values_list('owner_id', flat=True).distinct())
+    return owner_ids
+
+
+def _totals(queryset):
+    return queryset.annotate(success=Sum('success_count'), failure=Sum('failure_count'))
+
+
+def owner_timeline(owner, period, count):
+    """Успешные и неуспешные попытки владельца по последним count часам или суткам"""
+    since = bucket_start(timezone.now(), period) - timedelta(**{f'{period}s': count - 1})
+    rollups = AttemptRollup.objects.filter(owner=owner, period=period, bucket__gte=since)
+    return list(_totals(rollups.values('bucket')).order_by('-bucket'))
+
+
+def mailing_totals(owner):
+    """Итоги попыток по каждой рассылке владельца"""
+    rollups = AttemptRollup.objects.filter(owner=owner, period='day')
+    return list(
+        _totals(rollups.values('mailing', 'mailing__message__subject')).order_by('-mailing')
+    )
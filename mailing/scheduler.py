@@ -0,0 +1,82 @@
+import heapq
+import itertools
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from django.conf import settings
+
+from .models import Mailing
+
+
+@dataclass(order=True)
+class Event:
+    """Событие рассылки: начало (start) или окончание (end)"""
+    when: datetime
+    seq: int
+    kind: str = field(compare=False)
+    mailing_id: int = field(compare=False)
+    version: datetime = field(compare=False)
+
+
+class MailingScheduler:
+    """Очередь с приоритетом событий начала и окончания рассылок"""
+
+    def __init__(self):
+        self.queue = []
+        self.versions = {}  # Текущая версия (updated_at) каждой рассылки с событиями в очереди
+        self.watermark = None
+        self._seq = itertools.count()
+
+    def refresh(self, now):
+        """Догрузка новых и измененных рассылок без повторного чтения всей таблицы"""
+        if self.watermark is None:
+            mailings = Mailing.objects.filter(is_active=True).exclude(status='completed')
+        else:
+            # updated_at ставится при сохранении, а видна строка после фиксации транзакции, поэтому
+            # долгая транзакция фиксирует время раньше отметки. Окно перед отметкой читается
+            # повторно, уже известные версии пропускаются
+            overlap = timedelta(seconds=settings.MAILING_SCHEDULER_OVERLAP_SECONDS)
+            mailings = Mailing.objects.filter(updated_at__gte=self.watermark - overlap)
+
+        changed = 0
+        for row in mailings.values('id', 'start_time', 'end_time', 'is_active', 'status', 'updated_at'):
+            if self.versions.get(row['id']) == row['updated_at']:
+                continue
+            self.watermark = max(self.watermark or row['updated_at'], row['updated_at'])
+            if self.schedule(row, now):
+                changed += 1
+        if self.watermark is None:
+            self.watermark = now
+        return changed
+
+    def schedule(self, row, now):
+        """Постановка событий рассылки, прежние события этой рассылки устаревают; False — нечего ставить"""
+        if not row['is_active'] or row['status'] == 'completed':
+            # Без версии прежние события рассылки тоже пропускаются
+            return self.versions.pop(row['id'], None) is not None
+        self.versions[row['id']] = row['updated_at']
+        if row['end_time'] >= now:
+            self._push(row['start_time'], 'start', row)
+        self._push(row['end_time'], 'end', row)
+        return True
+
+    def _push(self, when, kind, row):
+        heapq.heappush(self.queue, Event(when, next(self._seq), kind, row['id'], row['updated_at']))
+
+    def pop_due(self, now):
+        """События, время которых наступило; устаревшие события пропускаются"""
+        due = []
+        while self.queue and self.queue[0].when <= now:
+            event = heapq.heappop(self.queue)
+            if self.versions.get(event.mailing_id) == event.version:
+                due.append(event)
+                # Окончание — последнее событие рассылки, в том числе удаленной: версия больше не нужна
+                if event.kind == 'end':
+                    del self.versions[event.mailing_id]
+        return due
+
+    def seconds_until_next(self, now, limit):
+        """Сколько ждать до ближайшего события, но не дольше limit"""
+        if not self.queue:
+            return limit
+        return min(limit, max((self.queue[0].when - now).total_seconds(), 0))
@@ -0,0 +1,98 @@
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Client, Message
+
+# Таблицы FTS5 из миграции 0019_search_external_content и их колонки в порядке выдачи:
+# сначала записи, где все слова нашлись в Ф.И.О. или теме, затем остальные совпадения.
+# rowid строки — (id владельца << 32) + id записи, строки владельца идут подряд
+INDEXES = {
+    Client: (
+        ('mailing_client_name_search', ('full_name',)),
+        ('mailing_client_search', ('full_name', 'email', 'comment')),
+    ),
+    Message: (
+        ('mailing_message_subject_search', ('subject',)),
+        ('mailing_message_search', ('subject', 'body')),
+    ),
+}
+OWNER_SHIFT = 32
+# Слово запроса: без пробелов и кавычек, хотя бы одна буква или цифра
+TERM = re.compile(r'[^\s"]*\w[^\s"]*')
+
+
+def build_query(text):
+    """Запрос FTS5: все слова text, последнее — как начало слова"""
+    # Каждое слово — фраза в кавычках, поэтому операторы FTS5 в тексте (AND, NEAR, *)
+    # ищутся как обычные слова. Начало слова только у последнего: его обычно дописывают
+    terms = TERM.findall(text)
+    if not terms:
+        return None
+    return ' AND '.join(f'"{term}"' for term in terms) + '*'
+
+
+def _search(model, owner, text, cursor, limit):
+    """Страница записей владельца, подходящих под text, и курсор следующей"""
+    # Без bm25: для idf он читает список строк слова целиком, по всем владельцам, и на
+    # миллионе клиентов частое слово ранжируется сотни миллисекунд. Шаг — таблица шага
+    # в диапазоне rowid владельца, новые первыми, поэтому страница читает из индекса свои
+    # строки. Совпадения прошлого шага исключаются проверкой строки в его таблице: фильтр
+    # колонки и NOT в запросе FTS5 за диапазон выходят. Курсор — шаг и id последней записи.
+    # Владелец проверяется и по самой записи: диапазон rowid зависит от курсора из запроса
+    query = build_query(text)
+    if query is None:
+        return [], None
+    steps = INDEXES[model]
+    start, before = 0, None
+    if cursor:
+        step, pk = cursor.split('|')
+        start, before = int(step), int(pk)
+        if not 0 <= start < len(steps):
+            raise ValueError(cursor)
+    source = model._meta.db_table
+    first = owner.pk << OWNER_SHIFT
+    page = []
+    for index in range(start, len(steps)):
+        table = steps[index][0]
+        last = first + before - 1 if index == start and before else first + (1 << OWNER_SHIFT) - 1
+        exclude = ''.join(
+            f'AND NOT EXISTS (SELECT 1 FROM {earlier} WHERE {earlier} MATCH %s AND {earlier}.rowid = {table}.rowid) '
+            for earlier, _ in steps[:index]
+        )
+        rows = model.objects.raw(
+            f'SELECT {source}.* FROM {table} JOIN {source} ON {source}.id = {table}.rowid - %s '
+            f'WHERE {table} MATCH %s AND {table}.rowid BETWEEN %s AND %s AND {source}.owner_id = %s {exclude}'
+            f'ORDER BY {table}.rowid DESC LIMIT %s',
+            [first, query, first, last, owner.pk, *[query] * index, limit + 1 - len(page)],
+        )
+        page += [(index, row) for row in rows]
+        if len(page) > limit:
+            index, row = page[limit - 1]
+            return [row for _, row in page[:limit]], f'{index}|{row.pk}'
+    return [row for _, row in page], None
+
+
+def find_clients(owner, text, cursor=None, limit=None):
+    """Страница клиентов владельца по Ф.И.О., email и комментарию и курсор следующей"""
+    return _search(Client, owner, text, cursor, limit or settings.SEARCH_PAGE_SIZE)
+
+
+def find_messages(owner, text, cursor=None, limit=None):
+    """Страница сообщений владельца по теме и тексту и курсор следующей"""
+    return _search(Message, owner, text, cursor, limit or settings.SEARCH_PAGE_SIZE)
+
+
+def rebuild():
+    """Пересборка поисковых таблиц из таблиц клиентов и сообщений; возвращает число строк каждой"""
+    # Текст таблицы не хранят: 'rebuild' читает его заново из представлений миграции
+    counts = {}
+    with transaction.atomic(), connection.cursor() as cursor:
+        for model, steps in INDEXES.items():
+            for table, _ in steps:
+                cursor.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+                cursor.execute(f"INSERT INTO {table}({table}) VALUES ('optimize')")
+                cursor.execute(f'SELECT count(*) FROM {model._meta.db_table}')
+                counts[table] = cursor.fetchone()[0]
+    return counts
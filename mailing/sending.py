@@ -0,0 +1,195 @@
+import smtplib
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+
+from . import outbox
+from .metrics import get_sink
+from .mime import MessageEncoder
+from .personalization import compile_message
+from .retries import is_permanent
+
+# Ошибки, после которых соединение считается разорванным и открывается заново
+DISCONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError)
+
+
+def batched(items, size):
+    """Разбивает поток на списки длиной не больше size"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@dataclass
+class SendResult:
+    """Результат отправки одного письма"""
+    email: str
+    success: bool
+    response: str
+    # Ошибка, после которой письмо не отправляется повторно
+    permanent: bool = False
+
+
+class BatchSender:
+    """Отправка писем пачками через одно переиспользуемое SMTP-соединение"""
+
+    def __init__(self, batch_size=None, connection=None, max_reconnects=3, throttle=None):
+        self.batch_size = batch_size or settings.MAILING_BATCH_SIZE
+        self.connection = connection or get_connection(fail_silently=False)
+        self.max_reconnects = max_reconnects
+        self.throttle = throttle
+        self.reconnects = 0
+        self.latencies = []
+        self.metrics = get_sink()
+
+    def __enter__(self):
+        return self.open()
+
+    def open(self):
+        """Открытие соединения, повторный вызов на открытом соединении ничего не делает"""
+        self.connection.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Закрытие соединения без выброса ошибок от уже упавшего сервера"""
+        try:
+            self.connection.close()
+        except smtplib.SMTPException:
+            pass
+
+    def reconnect(self):
+        """Повторное открытие соединения после обрыва связи"""
+        self.close()
+        self.connection.open()
+        self.reconnects += 1
+
+    def _send_one(self, message):
+        retries = 0
+        while True:
+            try:
+                self.connection.send_messages([message])
+                return
+            except DISCONNECT_ERRORS:
+                if retries >= self.max_reconnects:
+                    raise
+                retries += 1
+                self.reconnect()
+
+    def send_message(self, message):
+        """Отправка одного письма с замером задержки"""
+        email = ', '.join(message.to)
+        started = time.perf_counter()
+        try:
+            self._send_one(message)
+        except Exception as e:
+            result = SendResult(email, False, str(e), is_permanent(e))
+        else:
+            result = SendResult(email, True, 'Письмо успешно отправлено')
+        latency = time.perf_counter() - started
+        self.latencies.append(latency)
+        self.metrics.observe('mailing_smtp_seconds', latency)
+        return result
+
+    def send_batch(self, messages, heartbeat=None):
+        """Отправка одной пачки писем, ошибка одного письма не прерывает пачку"""
+        # heartbeat(секунд ожидания) вызывается перед каждым письмом: им продлевается аренда пачки
+        if self.throttle is None:
+            schedule = ((None, index) for index in range(len(messages)))
+        else:
+            # С ограничением по доменам письма уходят в порядке их очереди, результаты — в порядке пачки
+            schedule = self.throttle.schedule(messages)
+        results = [None] * len(messages)
+        for at, index in schedule:
+            delay = 0 if at is None else max(at - time.monotonic(), 0)
+            if heartbeat is not None:
+                heartbeat(delay)
+            if delay:
+                time.sleep(delay)
+            results[index] = self.send_message(messages[index])
+        return results
+
+    def send(self, messages):
+        """Разбивает поток писем на пачки по batch_size и отдает результаты каждой пачки"""
+        for batch in batched(messages, self.batch_size):
+            yield self.send_batch(batch)
+
+
+def render(encoder, client):
+    """Письмо получателю или SendResult с постоянной ошибкой, если письмо не собирается"""
+    # BadHeaderError и ошибки адреса — ValueError: письмо не соберется и при повторе
+    try:
+        return encoder.for_client(client)
+    except ValueError as e:
+        return SendResult(client.email, False, f'Письмо не собрано: {e}', permanent=True)
+
+
+def deliver_mailing(mailing, sender, writer, stop=None):
+    """Отправка рассылки через очередь доставки, возвращает число успехов и ошибок"""
+    # Получатели ставятся в очередь, затем захватываются пачками, поэтому
+    # несколько процессов могут отправлять одну рассылку параллельно.
+    # Очередь — журнал доставки: после перезапуска отправляются только строки,
+    # не отмеченные как отправленные. stop (threading.Event) останавливает
+    # отправку после текущей пачки.
+    metrics = get_sink()
+    started = time.perf_counter()
+    with metrics.timer('mailing_enqueue_seconds'):
+        outbox.enqueue(mailing)
+    # Текст разбирается один раз, для каждого получателя только подстановка значений;
+    # письмо без подстановок кодируется в MIME один раз на всю рассылку
+    encoder = MessageEncoder(compile_message(mailing.message))
+    sent_count = 0
+    error_count = 0
+
+    while stop is None or not stop.is_set():
+        with metrics.timer('mailing_recipients_load_seconds'):
+            deliveries = outbox.claim(mailing, limit=sender.batch_size)
+        if not deliveries:
+            break
+
+        with metrics.timer('mailing_render_seconds'):
+            rendered = [render(encoder, delivery.client) for delivery in deliveries]
+        # Несобранные письма сразу получают результат, остальные уходят одной пачкой
+        messages = [item for item in rendered if not isinstance(item, SendResult)]
+        lease = outbox.Lease(deliveries)
+        sent = iter(sender.send_batch(messages, heartbeat=lease.keep) if messages else [])
+        results = [item if isinstance(item, SendResult) else next(sent) for item in rendered]
+
+        # Попытки и отметки в очереди фиксируются вместе: это контрольная точка пачки.
+        # Попытки пишутся только по строкам, аренду которых не перехватил другой процесс
+        with metrics.timer('mailing_db_write_seconds'), transaction.atomic():
+            completed = outbox.complete(deliveries, results, mailing.end_time)
+            for delivery, result in zip(deliveries, results):
+                if delivery.id not in completed:
+                    continue
+                if result.success:
+                    writer.add(
+                        mailing=mailing, client=delivery.client, status='success', server_response=result.response
+                    )
+                    sent_count += 1
+                else:
+                    writer.add(
+                        mailing=mailing,
+                        client=delivery.client,
+                        status='failure',
+                        server_response=f'{result.email}: {result.response}',
+                    )
+                    error_count += 1
+            writer.flush()
+
+    if metrics.enabled:
+        metrics.increment('mailing_messages_total', sent_count, mailing=mailing.id, status='success')
+        metrics.increment('mailing_messages_total', error_count, mailing=mailing.id, status='failure')
+        elapsed = time.perf_counter() - started
+        metrics.set('mailing_messages_per_second', (sent_count + error_count) / elapsed, mailing=mailing.id)
+    return sent_count, error_count
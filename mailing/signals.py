@@ -0,0 +1,72 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import outbox
+from .cache import bump
+from .models import Client, Delivery, Mailing, Message, Segment
+
+RESOURCES = {Client: 'client', Message: 'message', Mailing: 'mailing', Segment: 'segment'}
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+@receiver(post_save, sender=Mailing)
+@receiver(post_delete, sender=Mailing)
+@receiver(post_save, sender=Segment)
+@receiver(post_delete, sender=Segment)
+def bump_owner_version(sender, instance, **kwargs):
+    """Изменение строки делает устаревшим кеш ее владельца"""
+    bump(instance.owner_id, RESOURCES[sender])
+
+
+@receiver(m2m_changed, sender=Mailing.recipients.through)
+def bump_recipients_version(sender, instance, action, **kwargs):
+    if action.startswith('post_') and isinstance(instance, Mailing):
+        bump(instance.owner_id, 'mailing')
+
+
+@receiver(m2m_changed, sender=Segment.clients.through)
+def bump_segment_version(sender, instance, action, **kwargs):
+    if action.startswith('post_') and isinstance(instance, Segment):
+        bump(instance.owner_id, 'segment')
+
+
+@receiver(m2m_changed, sender=Mailing.recipients.through)
+def drop_removed_recipients(sender, instance, action, reverse, pk_set, **kwargs):
+    """Убранные из рассылки получатели снимаются с очереди, если письмо им еще не ушло"""
+    # Клиенты сегмента рассылки остаются в очереди: отметка сегмента уже за ними,
+    # и заново их в очередь не поставит никто
+    if action not in ('post_remove', 'post_clear'):
+        return
+    waiting = Delivery.objects.filter(status__in=('pending', 'retry'))
+    if reverse:
+        waiting = waiting.filter(client=instance)
+        if pk_set is not None:
+            waiting = waiting.filter(mailing_id__in=pk_set)
+        mailings = Mailing.objects.filter(pk__in=waiting.values('mailing_id'), segment__isnull=False)
+        in_segment = [
+            mailing.pk for mailing in mailings.select_related('segment')
+            if mailing.segment.get_clients().filter(pk=instance.pk).exists()
+        ]
+        waiting = waiting.exclude(mailing_id__in=in_segment)
+    else:
+        waiting = waiting.filter(mailing=instance)
+        if pk_set is not None:
+            waiting = waiting.filter(client_id__in=pk_set)
+        if instance.segment_id is not None:
+            waiting = waiting.exclude(client_id__in=instance.segment.get_clients().values('pk'))
+    waiting.delete()
+
+
+@receiver(pre_save, sender=Mailing)
+def reset_segment_queue(sender, instance, update_fields=None, **kwargs):
+    """При смене сегмента очередь сегмента заполняется заново, ожидающие клиенты старого снимаются"""
+    if instance.pk is None or (update_fields is not None and 'segment' not in update_fields):
+        return
+    previous = Mailing.objects.filter(pk=instance.pk).values_list('segment_id', flat=True).first()
+    if previous == instance.segment_id:
+        return
+    instance.segment_enqueued_until = 0
+    outbox.drop_segment(instance)
@@ -0,0 +1,141 @@
+import asyncio
+import threading
+from dataclasses import dataclass, field
+
+
+@dataclass
+class ReceivedMessage:
+    """Письмо, принятое локальным SMTP-сервером"""
+    mail_from: str
+    rcpt_to: list = field(default_factory=list)
+    data: bytes = b''
+
+
+class SMTPSink:
+    """Локальный SMTP-сервер для офлайн-проверки отправки, работает в отдельном потоке"""
+
+    def __init__(self, host='127.0.0.1', port=0, delay=0, reject=(), drop_every=0):
+        self.host = host
+        self.port = port
+        self.delay = delay  # Искусственная задержка ответа, имитирует сетевую задержку
+        self.reject = {email.lower() for email in reject}  # Адреса, которые сервер отклоняет
+        self.drop_every = drop_every  # Разрыв соединения после каждых N принятых в нем писем
+        self.messages = []
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='smtp-sink', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+    def serve_forever(self):
+        """Запуск в текущем потоке до прерывания"""
+        self._run()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle, self.host, self.port)
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            self._loop.run_until_complete(self._server.wait_closed())
+            self._loop.close()
+
+    async def _reply(self, writer, line):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        writer.write(line.encode() + b'\r\n')
+        await writer.drain()
+
+    async def _handle(self, reader, writer):
+        envelope = None
+        accepted = 0
+        await self._reply(writer, '220 smtp-sink ESMTP')
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command, _, argument = line.decode('utf-8', 'replace').strip().partition(' ')
+                command = command.upper()
+
+                if command == 'EHLO':
+                    await self._reply(writer, '250-smtp-sink\r\n250 8BITMIME')
+                elif command == 'HELO':
+                    await self._reply(writer, '250 smtp-sink')
+                elif command == 'MAIL':
+                    envelope = ReceivedMessage(mail_from=_address(argument))
+                    await self._reply(writer, '250 OK')
+                elif command == 'RCPT':
+                    address = _address(argument)
+                    if envelope is None:
+                        await self._reply(writer, '503 Bad sequence of commands')
+                    elif address.lower() in self.reject:
+                        await self._reply(writer, f'550 Mailbox unavailable: {address}')
+                    else:
+                        envelope.rcpt_to.append(address)
+                        await self._reply(writer, '250 OK')
+                elif command == 'DATA':
+                    if envelope is None or not envelope.rcpt_to:
+                        await self._reply(writer, '503 Bad sequence of commands')
+                        continue
+                    await self._reply(writer, '354 End data with <CR><LF>.<CR><LF>')
+                    envelope.data = await _read_data(reader)
+                    self.messages.append(envelope)
+                    envelope = None
+                    await self._reply(writer, '250 OK queued')
+                    accepted += 1
+                    if self.drop_every and accepted % self.drop_every == 0:
+                        break
+                elif command == 'RSET':
+                    envelope = None
+                    await self._reply(writer, '250 OK')
+                elif command == 'NOOP':
+                    await self._reply(writer, '250 OK')
+                elif command == 'QUIT':
+                    await self._reply(writer, '221 Bye')
+                    break
+                else:
+                    await self._reply(writer, '502 Command not implemented')
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+def _address(argument):
+    """Адрес из аргумента MAIL FROM:<...> / RCPT TO:<...>"""
+    _, _, value = argument.partition(':')
+    return value.strip().split(' ')[0].strip('<>')
+
+
+async def _read_data(reader):
+    lines = []
+    while True:
+        line = await reader.readline()
+        if not line or line == b'.\r\n':
+            break
+        if line.startswith(b'..'):
+            line = line[1:]
+        lines.append(line)
+    return b''.join(lines)
@@ -1 +1,1146 @@
 # Tests for mailing app
+import base64
+import csv
+import gzip
+import io
+import json
+import smtplib
+import tempfile
+import threading
+from collections import Counter
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import QuerySet, RestrictedError
+from django.core.mail import EmailMessage, get_connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import User
+
+from .archive import _write_segment, archive, read_archive
+from .async_engine import AsyncDeliveryEngine
+from .attempts import AttemptWriter
+from .benchmarks.fixtures import generate_dataset
+from .cache import bump, get_versions
+from .dashboard import get_dashboard
+from .exports import export
+from .imports import import_clients
+from .management.commands import run_scheduler
+from .metrics import MemorySink
+from .pagination import decode_cursor, encode_cursor
+from .mime import MessageEncoder, PreparedMessage
+from .models import AttemptArchive, AttemptRollup, Client, Delivery, Mailing, MailingAttempt, Message, Segment
+from .personalization import CompiledMessage
+from .profiling import get_budget
+from . import rollups
+from .scheduler import MailingScheduler
+from .retries import backoff, is_permanent, next_attempt_at
+from .search import find_clients, rebuild
+from . import outbox
+from .outbox import enqueue
+from .sending import BatchSender, SendResult, deliver_mailing
+from .throttle import DomainThrottle, TokenBucket
+from .smtp_sink import SMTPSink
+from .urls import urlpatterns
+
+# Страницы, которые не проверяются: выгрузка читает базу после ответа, запуск — перенаправление,
+# журнал профилирования доступен только персоналу
+UNBUDGETED = {'client_export', 'attempt_export', 'mailing_send', 'query_log'}
+
+
+@override_settings(
+    QUERY_PROFILING=True,
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'}},
+)
+class QueryBudgetTests(TestCase):
+    """Число запросов каждой страницы на сгенерированных данных не больше ее query_budget"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Строк больше, чем запросов в любом бюджете: запрос на строку его превысит
+        cls.owner = generate_dataset(
+            2, clients_per_user=60, messages_per_user=3, mailings_per_user=12, recipients_per_mailing=20
+        )[0]
+        segment = Segment.objects.create(name='Домен 1', email_domain='domain1.example', owner=cls.owner)
+        Mailing.objects.filter(owner=cls.owner, id__in=Mailing.objects.filter(owner=cls.owner)[:6]).update(segment=segment)
+
+    def setUp(self):
+        self.client.force_login(self.owner)
+
+    def urls(self):
+        client = Client.objects.filter(owner=self.owner).first()
+        message = Message.objects.filter(owner=self.owner).first()
+        mailing = Mailing.objects.filter(owner=self.owner).exclude(status='created').first()
+        segment = Segment.objects.filter(owner=self.owner).first()
+        args = {'client': client.pk, 'message': message.pk, 'mailing': mailing.pk, 'segment': segment.pk}
+        for pattern in urlpatterns:
+            if pattern.name in UNBUDGETED:
+                continue
+            if 'pk' in pattern.pattern.converters:
+                yield pattern, reverse(f'mailing:{pattern.name}', args=[args[pattern.name.split('_')[0]]])
+            else:
+                yield pattern, reverse(f'mailing:{pattern.name}')
+
+    def test_every_page_declares_budget(self):
+        for pattern, _ in self.urls():
+            with self.subTest(pattern.name):
+                self.assertIsNotNone(get_budget(pattern.callback), f'{pattern.name}: нет query_budget')
+
+    def test_pages_within_budget(self):
+        for pattern, url in self.urls():
+            with self.subTest(pattern.name):
+                # Пустой кеш: страница строится целиком
+                cache.clear()
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(
+                    int(response['X-Query-Count']),
+                    int(response['X-Query-Budget']),
+                    f'{url}: запросов больше бюджета',
+                )
+
+
+def create_mailing(owner, emails, subject='Новости', body='Здравствуйте, {{ full_name }}!'):
+    """Идущая рассылка на новых клиентов владельца с адресами emails"""
+    now = timezone.now()
+    message = Message.objects.create(subject=subject, body=body, owner=owner)
+    mailing = Mailing.objects.create(
+        start_time=now - timedelta(hours=1),
+        end_time=now + timedelta(hours=1),
+        status='started',
+        message=message,
+        owner=owner,
+    )
+    clients = Client.objects.bulk_create(
+        Client(email=email, full_name=f'Клиент {n}', owner=owner) for n, email in enumerate(emails)
+    )
+    mailing.recipients.add(*clients)
+    return mailing
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    MAILING_DOMAIN_RATE=0,
+    MAILING_DOMAIN_RATES={},
+)
+class DeliverMailingTests(TestCase):
+    """Отправка рассылки через очередь доставки"""
+
+    def setUp(self):
+        self.owner = User.objects.create(email='owner@example.com', username='owner')
+
+    def deliver(self, mailing, sender=None):
+        with AttemptWriter() as writer:
+            return deliver_mailing(mailing, sender or BatchSender(), writer)
+
+    def test_line_breaks_in_subject_values(self):
+        mailing = create_mailing(self.owner, ['line@example.com'], subject='Здравствуйте,\r\n{{ full_name }}')
+        Client.objects.filter(email='line@example.com').update(full_name='Иван\r\nBcc: spy@example.com')
+        self.assertEqual(self.deliver(mailing), (1, 0))
+        self.assertEqual(mail.outbox[0].subject, 'Здравствуйте, Иван Bcc: spy@example.com')
+        headers = mail.outbox[0].message().as_bytes().split(b'\n\n', 1)[0]
+        self.assertNotIn(b'Bcc:', headers)
+
+    def test_async_engine_against_sink(self):
+        mailing = create_mailing(self.owner, [f'user{n}@example.com' for n in range(5)])
+        with SMTPSink(reject=['user3@example.com']) as sink:
+            engine = AsyncDeliveryEngine(
+                concurrency=2,
+                connection_factory=lambda: get_connection(
+                    'django.core.mail.backends.smtp.EmailBackend', host=sink.host, port=sink.port
+                ),
+            )
+            with engine:
+                self.assertEqual(self.deliver(mailing, engine), (4, 1))
+        self.assertEqual(len(sink.messages), 4)
+        self.assertEqual(mailing.deliveries.get(client__email='user3@example.com').status, 'failed')
+
+    def test_unrenderable_recipient_fails_alone(self):
+        mailing = create_mailing(self.owner, ['good@example.com', 'bad\r\n@example.com'])
+        self.assertEqual(self.deliver(mailing), (1, 1))
+        statuses = dict(mailing.deliveries.values_list('client__email', 'status'))
+        self.assertEqual(statuses, {'good@example.com': 'sent', 'bad\r\n@example.com': 'failed'})
+        self.assertEqual(mailing.attempts.filter(status='failure').count(), 1)
+
+
+def raw_cursor(raw):
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+@override_settings(
+    LIST_PAGE_SIZE=3,
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pagination'}},
+)
+class KeysetPaginationTests(TestCase):
+    """Постраничный список клиентов по курсорам"""
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create(email='owner@example.com', username='owner')
+        clients = Client.objects.bulk_create(
+            Client(email=f'c{n}@example.com', full_name=f'Клиент {n}', owner=self.owner) for n in range(8)
+        )
+        # Пять клиентов с одинаковым временем: страницы делятся посреди них
+        now = timezone.now()
+        for n, client in enumerate(clients):
+            Client.objects.filter(pk=client.pk).update(created_at=now - timedelta(minutes=n if n < 3 else 3))
+        self.expected = list(Client.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.client.force_login(self.owner)
+
+    def page(self, **params):
+        response = self.client.get(reverse('mailing:client_list'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['page']
+
+    def test_cursor_round_trip(self):
+        client = Client.objects.get(pk=self.expected[4])
+        self.assertEqual(decode_cursor(encode_cursor(client)), (client.created_at, client.pk))
+
+    def test_forward_and_back(self):
+        pages = [self.page()]
+        self.assertFalse(pages[0].has_previous)
+        while pages[-1].has_next:
+            pages.append(self.page(after=pages[-1].next_cursor))
+        self.assertEqual([client.pk for page in pages for client in page], self.expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 2])
+
+        back = [pages[-1]]
+        while back[-1].has_previous:
+            back.append(self.page(before=back[-1].previous_cursor))
+        self.assertEqual([[client.pk for client in page] for page in back], [
+            [client.pk for client in page] for page in reversed(pages)
+        ])
+        self.assertTrue(back[-1].has_next)
+
+    def test_malformed_cursor_gives_first_page(self):
+        first = [client.pk for client in self.page()]
+        for cursor in (
+            '!!!',
+            'a',
+            raw_cursor(b'\xff\xfe'),
+            raw_cursor(b'not a cursor'),
+            raw_cursor(b'2024-01-01T00:00:00|x'),
+            raw_cursor(b'2024-01-01T00:00:00|1|2'),
+        ):
+            for direction in ('after', 'before'):
+                with self.subTest(cursor=cursor, direction=direction):
+                    self.assertEqual([client.pk for client in self.page(**{direction: cursor})], first)
+        # Разобранный курсор с id за пределами целого в базе — обычная страница, а не ошибка
+        huge = raw_cursor(f'{timezone.now().isoformat()}|{"9" * 30}'.encode())
+        self.assertEqual([client.pk for client in self.page(after=huge)], first)
+
+
+class SegmentQueueTests(TestCase):
+    """Клиенты сегмента попадают в очередь рассылки независимо от своих id"""
+
+    def setUp(self):
+        self.owner = User.objects.create(email='owner@example.com', username='owner')
+        self.mailing = create_mailing(self.owner, [])
+        self.low = Client.objects.bulk_create(
+            Client(email=f'low{n}@b.example', full_name=f'Ранний {n}', owner=self.owner) for n in range(5)
+        )
+        self.high = Client.objects.bulk_create(
+            Client(email=f'high{n}@a.example', full_name=f'Поздний {n}', owner=self.owner) for n in range(5)
+        )
+
+    def queued(self):
+        return set(self.mailing.deliveries.values_list('client_id', flat=True))
+
+    def test_segment_change_requeues(self):
+        first = Segment.objects.create(name='A', email_domain='a.example', owner=self.owner)
+        second = Segment.objects.create(name='B', email_domain='b.example', owner=self.owner)
+        self.mailing.segment = first
+        self.mailing.save()
+        enqueue(self.mailing)
+        self.assertEqual(self.queued(), {client.pk for client in self.high})
+
+        self.mailing.segment = second
+        self.mailing.save()
+        enqueue(self.mailing)
+        self.assertEqual(self.queued(), {client.pk for client in self.low})
+
+    def test_static_segment_late_members(self):
+        segment = Segment.objects.create(name='Список', kind='static', owner=self.owner)
+        segment.clients.add(*self.high)
+        self.mailing.segment = segment
+        self.mailing.save()
+        enqueue(self.mailing)
+        segment.clients.add(self.low[0])
+        enqueue(self.mailing)
+        self.assertEqual(self.queued(), {client.pk for client in self.high} | {self.low[0].pk})
+
+    def test_dynamic_segment_late_matches(self):
+        segment = Segment.objects.create(name='VIP', comment_contains='vip', owner=self.owner)
+        Client.objects.filter(pk=self.high[0].pk).update(comment='vip')
+        self.mailing.segment = segment
+        self.mailing.save()
+        enqueue(self.mailing)
+        Client.objects.filter(pk=self.low[0].pk).update(comment='vip')
+        enqueue(self.mailing)
+        self.assertEqual(self.queued(), {self.high[0].pk, self.low[0].pk})
+
+    def test_segment_in_use_blocks_only_segment_delete(self):
+        segment = Segment.objects.create(name='A', email_domain='a.example', owner=self.owner)
+        self.mailing.segment = segment
+        self.mailing.save()
+        with self.assertRaises(RestrictedError):
+            segment.delete()
+        self.owner.delete()
+        self.assertFalse(Mailing.objects.exists())
+
+    def test_segment_change_keeps_recipients_and_sent(self):
+        segment = Segment.objects.create(name='A', email_domain='a.example', owner=self.owner)
+        self.mailing.recipients.add(self.high[0])
+        self.mailing.segment = segment
+        self.mailing.save()
+        enqueue(self.mailing)
+        Delivery.objects.filter(mailing=self.mailing, client=self.high[1]).update(status='sent')
+
+        self.mailing.segment = None
+        self.mailing.save()
+        self.assertEqual(self.queued(), {self.high[0].pk, self.high[1].pk})
+
+    def test_enqueue_slots_and_concurrent_rows(self):
+        # Строку успел поставить и отправить другой процесс: повторная вставка ее пропускает
+        outbox._insert_deliveries(self.mailing, [(self.low[0].pk, 0)])
+        Delivery.objects.filter(mailing=self.mailing).update(status='sent')
+        outbox._insert_deliveries(self.mailing, [(self.low[0].pk, 7), (self.low[1].pk, 1)])
+        self.assertEqual(
+            dict(self.mailing.deliveries.values_list('client_id', 'status')),
+            {self.low[0].pk: 'sent', self.low[1].pk: 'pending'},
+        )
+        self.mailing.deliveries.all().delete()
+
+        self.mailing.recipients.add(*self.low, *self.high)
+        self.assertEqual(enqueue(self.mailing, chunk_size=3), 10)
+        slots = {
+            email: slot for email, slot in self.mailing.deliveries.values_list('client__email', 'slot')
+        }
+        self.assertEqual(sorted(slots[f'low{n}@b.example'] for n in range(5)), list(range(5)))
+        self.assertEqual(sorted(slots[f'high{n}@a.example'] for n in range(5)), list(range(5)))
+        self.assertEqual(enqueue(self.mailing), 0)
+
+    def test_removed_recipient_stays_queued_from_segment(self):
+        segment = Segment.objects.create(name='Список', kind='static', owner=self.owner)
+        segment.clients.add(self.high[0], self.high[1])
+        self.mailing.recipients.add(self.high[0], self.low[0])
+        self.mailing.segment = segment
+        self.mailing.save()
+        enqueue(self.mailing)
+        self.mailing.recipients.remove(self.high[0], self.low[0])
+        self.assertEqual(self.queued(), {self.high[0].pk, self.high[1].pk})
+
+        self.mailing.recipients.add(self.high[1])
+        self.high[1].mailings.remove(self.mailing)
+        self.high[1].mailings.clear()
+        self.assertEqual(self.queued(), {self.high[0].pk, self.high[1].pk})
+        with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+            with AttemptWriter() as writer:
+                self.assertEqual(deliver_mailing(self.mailing, BatchSender(batch_size=10), writer), (2, 0))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['high0@a.example', 'high1@a.example'])
+
+    def test_reverse_remove_drops_recipient_outside_segment(self):
+        segment = Segment.objects.create(name='Список', kind='static', owner=self.owner)
+        self.mailing.recipients.add(self.low[0])
+        self.mailing.segment = segment
+        self.mailing.save()
+        enqueue(self.mailing)
+        self.low[0].mailings.remove(self.mailing)
+        self.assertEqual(self.queued(), set())
+
+
+class SearchTests(TestCase):
+    """Полнотекстовый поиск по клиентам владельца"""
+
+    def setUp(self):
+        self.owner = User.objects.create(email='owner@example.com', username='owner')
+        self.other = User.objects.create(email='other@example.com', username='other')
+        self.ivan = Client.objects.create(email='ivan@example.com', full_name='Иван Петров', owner=self.owner)
+        self.note = Client.objects.create(
+            email='note@example.com', full_name='Анна', comment='Брат Ивана', owner=self.owner
+        )
+        Client.objects.create(email='ivan@other.example', full_name='Иван Сидоров', owner=self.other)
+
+    def found(self, text, owner=None, cursor=None, limit=None):
+        rows, _ = find_clients(owner or self.owner, text, cursor, limit)
+        return [row.pk for row in rows]
+
+    def test_owner_scope_and_order(self):
+        # Сначала совпадения в Ф.И.О., затем в остальных колонках
+        self.assertEqual(self.found('ива'), [self.ivan.pk, self.note.pk])
+
+    def test_forged_cursor_stays_in_owner(self):
+        # id в курсоре, выводящий диапазон rowid на строки другого владельца
+        other = Client.objects.get(owner=self.other)
+        forged = f'0|{((self.other.pk - self.owner.pk) << 32) + other.pk + 1}'
+        self.assertEqual(self.found('иван', cursor=forged), [self.ivan.pk, self.note.pk])
+
+    def test_paging(self):
+        rows, cursor = find_clients(self.owner, 'ива', limit=1)
+        self.assertEqual([row.pk for row in rows], [self.ivan.pk])
+        self.assertEqual(self.found('ива', cursor=cursor, limit=1), [self.note.pk])
+
+    def test_triggers_follow_changes(self):
+        self.ivan.full_name = 'Олег Петров'
+        self.ivan.save()
+        self.note.delete()
+        self.assertEqual(self.found('иван'), [])
+        self.assertEqual(self.found('олег'), [self.ivan.pk])
+
+    def test_rebuild(self):
+        counts = rebuild()
+        self.assertEqual(counts['mailing_client_search'], 3)
+        self.assertEqual(self.found('петров'), [self.ivan.pk])
+
+
+class LeaseTests(TestCase):
+    """Захват строк очереди, истечение и продление аренды"""
+
+    def setUp(self):
+        self.owner = User.objects.create(email='owner@example.com', username='owner')
+        self.mailing = create_mailing(self.owner, [f'c{n}@example.com' for n in range(4)])
+        enqueue(self.mailing)
+
+    def expire(self):
+        Delivery.objects.filter(status='leased').update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_claim_is_exclusive_until_expiry(self):
+        first = outbox.claim(self.mailing, limit=10)
+        self.assertEqual(len(first), 4)
+        self.assertEqual(outbox.claim(self.mailing, limit=10), [])
+        self.expire()
+        second = outbox.claim(self.mailing, limit=10)
+        self.assertEqual({delivery.id for delivery in second}, {delivery.id for delivery in first})
+        self.assertNotEqual(second[0].lease_token, first[0].lease_token)
+
+    def test_complete_skips_reclaimed_rows(self):
+        first = outbox.claim(self.mailing, limit=10)
+        self.expire()
+        outbox.claim(self.mailing, limit=2)
+        results = [SendResult(delivery.client.email, True, 'OK') for delivery in first]
+        completed = outbox.complete(first, results, self.mailing.end_time)
+        self.assertEqual(len(completed), 2)
+        self.assertEqual(Delivery.objects.filter(status='leased').count(), 2)
+
+    def test_keep_renews_for_long_wait(self):
+        deliveries = outbox.claim(self.mailing, limit=10, lease_seconds=3)
+        lease = outbox.Lease(deliveries, lease_seconds=3)
+        lease.keep()
+        self.assertLess(Delivery.objects.get(pk=deliveries[0].pk).lease_expires_at, timezone.now() + timedelta(seconds=4))
+        lease.keep(ahead=60)
+        expires = Delivery.objects.get(pk=deliveries[0].pk).lease_expires_at
+        self.assertGreater(expires, timezone.now() + timedelta(seconds=60))
+
+    def test_lost_lease_writes_no_attempts(self):
+        mailing = self.mailing
+
+        class Stalled(BatchSender):
+            """Отправитель, пока шлет пачку которого ее аренду перехватывает другой процесс"""
+
+            def send_batch(self, messages, heartbeat=None):
+                Delivery.objects.filter(mailing=mailing).update(lease_expires_at=timezone.now())
+                outbox.claim(mailing, limit=len(messages))
+                return super().send_batch(messages)
+
+        with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+            with AttemptWriter() as writer:
+                self.assertEqual(deliver_mailing(mailing, Stalled(batch_size=4), writer), (0, 0))
+        self.assertFalse(mailing.attempts.exists())
+        self.assertEqual(Delivery.objects.filter(mailing=mailing, status='leased').count(), 4)
+
+
+class EngineSinkTests(SimpleTestCase):
+    """Оба движка отправки против локального SMTP-сервера"""
+
+    engines = ('sync', 'async')
+    emails = [f'user{n}@example.com' for n in range(5)]
+
+    def send(self, name, sink):
+        """Отправка писем на emails движком name, возвращает результаты и число переподключений"""
+        def connect():
+            return get_connection(
+                'django.core.mail.backends.smtp.EmailBackend', host=sink.host, port=sink.port, fail_silently=False
+            )
+
+        if name == 'sync':
+            engine = BatchSender(batch_size=10, connection=connect())
+        else:
+            engine = AsyncDeliveryEngine(concurrency=2, batch_size=10, connection_factory=connect)
+        message = PreparedMessage('Новости', 'Здравствуйте!')
+        with engine:
+            return engine.send_batch([message.for_recipient(email) for email in self.emails]), engine.reconnects
+
+    def test_success(self):
+        for name in self.engines:
+            with self.subTest(name), SMTPSink() as sink:
+                results, _ = self.send(name, sink)
+                self.assertTrue(all(result.success for result in results))
+                self.assertEqual(sorted(rcpt for message in sink.messages for rcpt in message.rcpt_to), self.emails)
+
+    def test_rejected_recipient_is_permanent(self):
+        for name in self.engines:
+            with self.subTest(name), SMTPSink(reject=['user2@example.com']) as sink:
+                results, _ = self.send(name, sink)
+                self.assertEqual([result.success for result in results], [True, True, False, True, True])
+                self.assertTrue(results[2].permanent)
+                self.assertIn('550', results[2].response)
+                self.assertEqual(len(sink.messages), 4)
+
+    def test_reconnect_after_disconnect(self):
+        for name in self.engines:
+            with self.subTest(name), SMTPSink(drop_every=2) as sink:
+                results, reconnects = self.send(name, sink)
+                self.assertTrue(all(result.success for result in results))
+                self.assertGreater(reconnects, 0)
+                self.assertEqual(len(sink.messages), 5)
+
+
+class SchedulerTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(email='owner@example.com', username='owner')
+
+    def test_late_commit_inside_overlap_is_scheduled(self):
+        now = timezone.now()
+        scheduler = MailingScheduler()
+        scheduler.refresh(now)
+        scheduler.watermark = now
+        # Транзакция зафиксирована после отметки, но updated_at поставлен до нее
+        mailing = create_mailing(self.owner, ['late@example.com'])
+        Mailing.objects.filter(pk=mailing.pk).update(status='created', updated_at=now - timedelta(seconds=10))
+        self.assertEqual(scheduler.refresh(now), 1)
+        self.assertEqual(scheduler.refresh(now), 0)
+        self.assertEqual([event.kind for event in scheduler.pop_due(now)], ['start'])
+
+    def test_versions_are_pruned(self):
+        now = timezone.now()
+        ending = create_mailing(self.owner, ['ending@example.com'])
+        completed = create_mailing(self.owner, ['completed@example.com'])
+        Mailing.objects.filter(pk=ending.pk).update(end_time=now + timedelta(seconds=1))
+        scheduler = MailingScheduler()
+        scheduler.refresh(now)
+        self.assertEqual(set(scheduler.versions), {ending.pk, completed.pk})
+
+        Mailing.objects.filter(pk=completed.pk).update(status='completed', updated_at=now + timedelta(seconds=1))
+        scheduler.refresh(now)
+        self.assertEqual(set(scheduler.versions), {ending.pk})
+        # Окончание удаленной рассылки тоже снимает ее версию
+        ending_id = ending.pk
+        ending.delete()
+        due = scheduler.pop_due(now + timedelta(seconds=2))
+        self.assertEqual([(event.kind, event.mailing_id) for event in due], [('start', ending_id), ('end', ending_id)])
+        self.assertEqual(scheduler.versions, {})
+
+
+class RunSchedulerTests(TestCase):
+    def setUp(self):
+        self.command = run_scheduler.Command(stdout=io.StringIO(), stderr=io.StringIO())
+        self.command.stop = threading.Event()
+        self.command.running = set()
+        self.command.rerun = set()
+        self.command.lock = threading.Lock()
+        self.submitted = []
+        self.command.executor = self
+
+    def submit(self, function, mailing_id):
+        self.submitted.append(mailing_id)
+
+    def test_start_during_run_is_resubmitted(self):
+        owner = User.objects.create(email='owner@example.com', username='owner')
+        # Неактивная рассылка: запуск ничего не отправляет, проверяется только повтор
+        mailing = create_mailing(owner, [])
+        Mailing.objects.filter(pk=mailing.pk).update(is_active=False)
+        self.command.submit(self, mailing.pk)
+        # Рассылку изменили во время отправки: планировщик прислал еще одно начало
+        self.command.submit(self, mailing.pk)
+        self.assertEqual(self.submitted, [mailing.pk])
+
+        with mock.patch.object(run_scheduler, 'connection'):
+            self.command.start_mailing(mailing.pk)
+            self.assertEqual(self.submitted, [mailing.pk, mailing.pk])
+            self.command.start_mailing(mailing.pk)
+        self.assertEqual(self.submitted, [mailing.pk, mailing.pk])
+        self.assertEqual(self.command.running, set())
+
+
+class MessageEncoderTests(SimpleTestCase):
+    """Тело без подстановок кодируется один раз, тема получателя вставляется в готовые заголовки"""
+
+    body = 'Текст рассылки, одинаковый для всех. ' * 200
+    clients = [
+        Client(email='ivan@example.com', full_name='Иван Иванович Иванов ' * 4),
+        Client(email='john@example.com', full_name='John'),
+    ]
+
+    @staticmethod
+    def without_unique(data):
+        return [line for line in data.split(b'\r\n') if not line.startswith((b'Date: ', b'Message-ID: '))]
+
+    def test_personal_subject_matches_full_encoding(self):
+        encoder = MessageEncoder(CompiledMessage('Новости для {{ full_name }}', self.body))
+        for client in self.clients:
+            with self.subTest(client.email):
+                message = encoder.for_client(client)
+                subject = f'Новости для {client.full_name}'
+                expected = PreparedMessage(subject, self.body).for_recipient(client.email)
+                self.assertEqual(message.subject, subject)
+                self.assertEqual(
+                    self.without_unique(message.message().as_bytes(linesep='\r\n')),
+                    self.without_unique(expected.message().as_bytes(linesep='\r\n')),
+                )
+
+    def test_body_encoded_once(self):
+        with mock.patch('mailing.mime.EmailMessage', wraps=EmailMessage) as encode:
+            encoder = MessageEncoder(CompiledMessage('Новости для {{ full_name }}', self.body))
+            for client in self.clients:
+                encoder.for_client(client)
+        self.assertEqual(encode.call_count, 1)
+
+
+class ThrottleTests(SimpleTestCase):
+    """Ограничение скорости по доменам на подменных часах"""
+
+    def setUp(self):
+        self.now = 100.0
+
+    def clock(self):
+        return self.now
+
+    def test_bucket_refill(self):
+        bucket = TokenBucket(rate=2, burst=3, now=0)
+        self.assertEqual([bucket.reserve(0) for _ in range(5)], [0, 0, 0, 0.5, 1.0])
+        # За 2 секунды набирается 4 токена, но не больше burst и за вычетом очереди
+        self.assertEqual(bucket.reserve(2), 2)
+        self.assertEqual(bucket.reserve(10), 10)
+        self.assertEqual(bucket.tokens, 2)
+
+    def test_per_domain_limit(self):
+        throttle = DomainThrottle(rate=0, burst=2, rates={'slow.example': 1}, clock=self.clock)
+        slow = [throttle.reserve('a@Slow.Example') for _ in range(4)]
+        self.assertEqual(slow, [100, 100, 101, 102])
+        # Домен без ограничения отправляет сразу, медленный домен его не задерживает
+        self.assertEqual([throttle.reserve('b@fast.example') for _ in range(3)], [100] * 3)
+        self.now = 110.0
+        self.assertEqual(throttle.reserve('c@slow.example'), 110)
+        self.assertEqual(throttle.report()[0], ('slow.example', 5, 3 / 5, 2))
+
+    def test_schedule_interleaves_domains(self):
+        throttle = DomainThrottle(rate=1, burst=1, rates={}, clock=self.clock)
+        emails = ['a@one.example', 'b@one.example', 'c@two.example', 'd@one.example']
+        messages = [PreparedMessage('Тема', 'Текст').for_recipient(email) for email in emails]
+        self.assertEqual(throttle.schedule(messages), [(100, 0), (100, 2), (101, 1), (102, 3)])
+
+
+class MetricsTests(SimpleTestCase):
+    def test_forget_drops_only_mailing_labels(self):
+        sink = MemorySink()
+        sink.increment('mailing_messages_total', 3, mailing=1, status='success')
+        sink.increment('mailing_messages_total', 2, mailing=2, status='success')
+        sink.set('mailing_messages_per_second', 10.0, mailing=1)
+        sink.observe('mailing_smtp_seconds', 0.01)
+        sink.forget(mailing=1)
+        self.assertEqual(
+            [(item['name'], item['labels']) for item in sink.as_dict()['counters']],
+            [('mailing_messages_total', {'mailing': '2', 'status': 'success'})],
+        )
+        self.assertEqual(sink.as_dict()['gauges'], [])
+        self.assertEqual(len(sink.as_dict()['histograms']), 1)
+
+
+@override_settings(
+    MAILING_RETRY_BASE_SECONDS=60,
+    MAILING_RETRY_MAX_SECONDS=600,
+    MAILING_RETRY_MAX_ATTEMPTS=3,
+    MAILING_RETRY_SHARE=0.2,
+)
+class RetryTests(TestCase):
+    """Повторы временных ошибок отправки"""
+
+    def setUp(self):
+        self.owner = User.objects.create(email='owner@example.com', username='owner')
+
+    def test_classification(self):
+        cases = [
+            (smtplib.SMTPRecipientsRefused({'a@example.com': (550, b'no such user')}), True),
+            (smtplib.SMTPRecipientsRefused({'a@example.com': (550, b''), 'b@example.com': (451, b'')}), False),
+            (smtplib.SMTPDataError(554, b'rejected'), True),
+            (smtplib.SMTPSenderRefused(451, b'try later', 'from@example.com'), False),
+            (smtplib.SMTPServerDisconnected('closed'), False),
+            (TimeoutError(), False),
+            (ValueError('bad address'), True),
+            # 5xx о соединении, а не о получателе
+            (smtplib.SMTPAuthenticationError(535, b'authentication failed'), False),
+            (smtplib.SMTPConnectError(554, b'no service'), False),
+            (smtplib.SMTPHeloError(501, b'bad helo'), False),
+            (smtplib.SMTPSenderRefused(550, b'sender denied', 'from@example.com'), False),
+            (smtplib.SMTPNotSupportedError('STARTTLS extension not supported by server'), False),
+        ]
+        for error, permanent in cases:
+            with self.subTest(error=repr(error)):
+                self.assertEqual(is_permanent(error), permanent)
+
+    def test_auth_failure_on_reconnect_is_transient(self):
+        class Flaky:
+            def open(self):
+                if self.dropped:
+                    raise smtplib.SMTPAuthenticationError(535, b'authentication failed')
+
+            def close(self):
+                pass
+
+            def send_messages(self, messages):
+                self.dropped = True
+                raise smtplib.SMTPServerDisconnected('closed')
+
+        connection = Flaky()
+        connection.dropped = False
+        sender = BatchSender(batch_size=10, connection=connection)
+        results = sender.send_batch([PreparedMessage('Тема', 'Текст').for_recipient('a@example.com')])
+        self.assertFalse(results[0].success)
+        self.assertFalse(results[0].permanent)
+        self.assertIn('535', results[0].response)
+
+    def test_backoff_bounds(self):
+        for attempts, delay in ((1, 60), (2, 120), (3, 240), (10, 600)):
+            for _ in range(20):
+                self.assertTrue(delay / 2 <= backoff(attempts) <= delay)
+
+    def test_next_attempt_limits(self):
+        now = timezone.now()
+        later = now + timedelta(days=1)
+        self.assertGreater(next_attempt_at(1, now, later), now)
+        self.assertIsNone(next_attempt_at(3, now, later))
+        # Повтор позже окончания рассылки не планируется
+        self.assertIsNone(next_attempt_at(1, now, now + timedelta(seconds=10)))
+
+    def test_complete_schedules_retries(self):
+        mailing = create_mailing(self.owner, ['ok@example.com', 'soft@example.com', 'hard@example.com'])
+        enqueue(mailing)
+        deliveries = outbox.claim(mailing, limit=10)
+        outcome = {
+            'ok@example.com': SendResult('ok@example.com', True, 'OK'),
+            'soft@example.com': SendResult('soft@example.com', False, '451', permanent=False),
+            'hard@example.com': SendResult('hard@example.com', False, '550', permanent=True),
+        }
+        outbox.complete(deliveries, [outcome[delivery.client.email] for delivery in deliveries], mailing.end_time)
+        rows = {row.client.email: row for row in mailing.deliveries.select_related('client')}
+        self.assertEqual(rows['ok@example.com'].status, 'sent')
+        self.assertEqual(rows['hard@example.com'].status, 'failed')
+        self.assertEqual(rows['soft@example.com'].status, 'retry')
+        self.assertEqual(rows['soft@example.com'].attempts, 1)
+        self.assertGreater(rows['soft@example.com'].next_attempt_at, timezone.now())
+
+    def test_retries_stop_at_max_attempts(self):
+        mailing = create_mailing(self.owner, ['soft@example.com'])
+        enqueue(mailing)
+        Delivery.objects.filter(mailing=mailing).update(attempts=2)
+        deliveries = outbox.claim(mailing, limit=10)
+        outbox.complete(deliveries, [SendResult('soft@example.com', False, '451')], mailing.end_time)
+        self.assertEqual(mailing.deliveries.get().status, 'failed')
+
+    def test_retry_share_of_batch(self):
+        mailing = create_mailing(self.owner, [f'c{n}@example.com' for n in range(20)])
+        enqueue(mailing)
+        retry_ids = list(mailing.deliveries.order_by('id').values_list('id', flat=True)[:10])
+        Delivery.objects.filter(id__in=retry_ids).update(
+            status='retry', next_attempt_at=timezone.now() - timedelta(seconds=1)
+        )
+        batch = outbox.claim(mailing, limit=10)
+        self.assertEqual(sum(delivery.id in retry_ids for delivery in batch), 2)
+        # Первых отправок осталось две: пачка добирается повторами
+        batch = outbox.claim(mailing, limit=10)
+        self.assertEqual(sum(delivery.id in retry_ids for delivery in batch), 8)
+        self.assertEqual(len(batch), 10)
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    MAILING_DOMAIN_RATE=0,
+    MAILING_DOMAIN_RATES={},
+)
+class ResumeTests(TestCase):
+    """Продолжение отправки по журналу доставки после остановки и сбоя"""
+
+    def setUp(self):
+        self.owner = User.objects.create(email='owner@example.com', username='owner')
+        self.emails = [f'c{n}@example.com' for n in range(10)]
+        self.mailing = create_mailing(self.owner, self.emails)
+
+    def run_mailing(self, sender, stop=None):
+        with AttemptWriter() as writer:
+            return deliver_mailing(self.mailing, sender, writer, stop=stop)
+
+    def sent(self):
+        return Counter(email for message in mail.outbox for email in message.to)
+
+    def test_stop_and_resume_sends_once(self):
+        stop = threading.Event()
+
+        class Stopping(BatchSender):
+            def send_batch(self, messages, heartbeat=None):
+                stop.set()
+                return super().send_batch(messages, heartbeat)
+
+        self.assertEqual(self.run_mailing(Stopping(batch_size=4), stop), (4, 0))
+        self.assertEqual(self.run_mailing(BatchSender(batch_size=4)), (6, 0))
+        self.assertEqual(self.sent(), Counter(self.emails))
+        self.assertEqual(self.mailing.attempts.count(), 10)
+
+    def test_crash_resends_one_batch(self):
+        class Crashing(BatchSender):
+            batches = 0
+
+            def send_batch(self, messages, heartbeat=None):
+                results = super().send_batch(messages, heartbeat)
+                self.batches += 1
+                if self.batches == 2:
+                    raise RuntimeError('процесс упал до записи результатов')
+                return results
+
+        with self.assertRaises(RuntimeError):
+            self.run_mailing(Crashing(batch_size=4))
+        # Аренда упавшего процесса истекает, его пачку забирает следующий запуск
+        Delivery.objects.filter(status='leased').update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.run_mailing(BatchSender(batch_size=4)), (6, 0))
+
+        sent = self.sent()
+        self.assertEqual(set(sent), set(self.emails))
+        self.assertEqual(sorted(sent.values()), [1] * 6 + [2] * 4)
+        self.assertEqual(self.mailing.attempts.count(), 10)
+
+    def test_removed_recipients_leave_queue(self):
+        enqueue(self.mailing)
+        first, second, third = Client.objects.filter(email__in=self.emails[:3]).order_by('id')
+        Delivery.objects.filter(mailing=self.mailing, client=first).update(status='sent')
+        self.mailing.recipients.remove(first, second)
+        third.mailings.remove(self.mailing)
+        queued = dict(self.mailing.deliveries.values_list('client_id', 'status'))
+        self.assertEqual(queued.get(first.pk), 'sent')
+        self.assertNotIn(second.pk, queued)
+        self.assertNotIn(third.pk, queued)
+        self.assertEqual(len(queued), 8)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'versions'}})
+class CacheVersionTests(TestCase):
+    """Версии кеша пользователя"""
+
+    def test_bump_applies_after_commit(self):
+        before = get_versions(1, 'client', 'message')
+        with self.captureOnCommitCallbacks(execute=True):
+            bump(1, 'client')
+            self.assertEqual(get_versions(1, 'client', 'message'), before)
+        after = get_versions(1, 'client', 'message')
+        self.assertNotEqual(after.split('-')[0], before.split('-')[0])
+        self.assertEqual(after.split('-')[1], before.split('-')[1])
+
+    def test_message_edit_refreshes_dashboard(self):
+        owner = User.objects.create(email='owner@example.com', username='owner')
+        mailing = create_mailing(owner, [], subject='Старая тема')
+        self.assertEqual(get_dashboard(owner)['user_mailings'][0].message.subject, 'Старая тема')
+        with self.captureOnCommitCallbacks(execute=True):
+            mailing.message.subject = 'Новая тема'
+            mailing.message.save()
+        self.assertEqual(get_dashboard(owner)['user_mailings'][0].message.subject, 'Новая тема')
+
+
+class SweepStatusesTests(TestCase):
+    """Статусы всех рассылок по времени начала и окончания"""
+
+    def setUp(self):
+        self.now = timezone.now()
+        owner = User.objects.create(email='owner@example.com', username='owner')
+        self.message = Message.objects.create(subject='Новости', body='Текст', owner=owner)
+        self.owner = owner
+
+    def mailing(self, start, end, status='created', is_active=True):
+        return Mailing.objects.create(
+            start_time=self.now + timedelta(hours=start),
+            end_time=self.now + timedelta(hours=end),
+            status=status,
+            is_active=is_active,
+            message=self.message,
+            owner=self.owner,
+        )
+
+    def status(self, mailing):
+        return Mailing.objects.values_list('status', flat=True).get(pk=mailing.pk)
+
+    def test_created_started_completed(self):
+        mailing = self.mailing(1, 3)
+        self.assertEqual(Mailing.sweep_statuses(self.now), {'created': [], 'started': [], 'completed': []})
+        self.assertEqual(self.status(mailing), 'created')
+
+        changed = Mailing.sweep_statuses(self.now + timedelta(hours=1))
+        self.assertEqual(changed['started'], [mailing.pk])
+        self.assertEqual(self.status(mailing), 'started')
+        # Повторный проход ничего не меняет
+        self.assertEqual(Mailing.sweep_statuses(self.now + timedelta(hours=2))['started'], [])
+
+        changed = Mailing.sweep_statuses(self.now + timedelta(hours=4))
+        self.assertEqual(changed['completed'], [mailing.pk])
+        self.assertEqual(self.status(mailing), 'completed')
+
+    def test_expired_and_inactive(self):
+        # Время окончания прошло до первого прохода: рассылка сразу завершается
+        expired = self.mailing(-3, -1)
+        # Неактивные рассылки меняют статус по тем же правилам, что и update_status
+        inactive = self.mailing(-1, 1, is_active=False)
+        moved_back = self.mailing(1, 2, status='started')
+        changed = Mailing.sweep_statuses(self.now)
+        self.assertEqual(changed, {'created': [moved_back.pk], 'started': [inactive.pk], 'completed': [expired.pk]})
+        self.assertEqual(
+            [self.status(mailing) for mailing in (expired, inactive, moved_back)], ['completed', 'started', 'created']
+        )
+
+    def test_command_reports_changes(self):
+        self.mailing(-3, -1)
+        out = io.StringIO()
+        call_command('update_statuses', stdout=out)
+        self.assertEqual(out.getvalue().split('\n')[:3], ['created: 0', 'started: 0', 'completed: 1'])
+
+
+class RollupTests(TestCase):
+    """Сводки попыток по часам и суткам совпадают с журналом"""
+
+    def setUp(self):
+        self.owner = User.objects.create(email='owner@example.com', username='owner')
+        self.mailings = [create_mailing(self.owner, [f'r{n}@example.com']) for n in range(2)]
+        now = timezone.now()
+        times = [now - timedelta(hours=hours) for hours in (0, 0, 1, 5, 23, 24, 49)]
+        with AttemptWriter(buffer_size=4, flush_interval=3600) as writer:
+            for n, when in enumerate(times * 2):
+                writer.add(
+                    mailing=self.mailings[n % 2],
+                    attempt_time=when,
+                    status='success' if n % 3 else 'failure',
+                    server_response='Ответ',
+                )
+
+    def expected(self):
+        counts = Counter()
+        for mailing_id, attempt_time, status in MailingAttempt.objects.values_list('mailing_id', 'attempt_time', 'status'):
+            for period in rollups.PERIODS:
+                counts[mailing_id, period, rollups.bucket_start(attempt_time, period), status] += 1
+        return counts
+
+    def actual(self):
+        counts = Counter()
+        for rollup in AttemptRollup.objects.all():
+            self.assertEqual(rollup.owner_id, self.owner.pk)
+            key = (rollup.mailing_id, rollup.period, rollup.bucket)
+            counts[(*key, 'success')] += rollup.success_count
+            counts[(*key, 'failure')] += rollup.failure_count
+        return +counts
+
+    def test_flush_matches_attempts(self):
+        self.assertEqual(MailingAttempt.objects.count(), 14)
+        self.assertEqual(self.actual(), self.expected())
+
+    def test_rebuild_is_idempotent(self):
+        before = self.actual()
+        AttemptRollup.objects.filter(period='hour').update(success_count=100)
+        rollups.rebuild(chunk_size=3)
+        self.assertEqual(self.actual(), before)
+        rollups.rebuild(chunk_size=3)
+        self.assertEqual(self.actual(), before)
+        self.assertEqual(self.actual(), self.expected())
+
+
+class ArchiveTests(TestCase):
+    """Перенос старых попыток в файлы архива"""
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.owner = User.objects.create(email='owner@example.com', username='owner')
+        self.other = User.objects.create(email='other@example.com', username='other')
+        self.mailing = create_mailing(self.owner, ['a@example.com'])
+        self.other_mailing = create_mailing(self.other, ['b@example.com'])
+        old = self.now - timedelta(days=10)
+        self.old = {
+            self.owner.pk: self.attempts(self.mailing, [old, old + timedelta(days=1), old + timedelta(days=1)]),
+            self.other.pk: self.attempts(self.other_mailing, [old, old + timedelta(hours=1)]),
+        }
+        self.recent = self.attempts(self.mailing, [self.now])
+        rollups.rebuild()
+
+    def attempts(self, mailing, times):
+        client = mailing.recipients.get()
+        created = MailingAttempt.objects.bulk_create(
+            MailingAttempt(
+                mailing=mailing,
+                client=client,
+                attempt_time=when,
+                status='success' if n % 2 == 0 else 'failure',
+                server_response=f'Ответ {n}',
+            )
+            for n, when in enumerate(times)
+        )
+        return [attempt.pk for attempt in created]
+
+    def rollup_rows(self):
+        return list(
+            AttemptRollup.objects.order_by('mailing', 'period', 'bucket')
+            .values_list('mailing_id', 'period', 'bucket', 'success_count', 'failure_count')
+        )
+
+    def archived_ids(self, owner=None):
+        return [row['id'] for row in read_archive(owner=owner, directory=self.directory)]
+
+    def test_attempts_moved_and_read_back_per_owner(self):
+        moved = archive(self.now - timedelta(days=5), chunk_size=2, directory=self.directory)
+        self.assertEqual(moved, Counter({self.owner.pk: 3, self.other.pk: 2}))
+        self.assertEqual(list(MailingAttempt.objects.values_list('id', flat=True)), self.recent)
+        for owner in (self.owner, self.other):
+            self.assertEqual(sorted(self.archived_ids(owner)), self.old[owner.pk])
+        row = next(read_archive(owner=self.other, directory=self.directory))
+        self.assertEqual(row['email'], 'b@example.com')
+        self.assertEqual(row['server_response'], 'Ответ 0')
+        self.assertEqual(row['attempt_time'], self.now - timedelta(days=10))
+
+    def test_rollups_unchanged(self):
+        before = self.rollup_rows()
+        archive(self.now - timedelta(days=5), directory=self.directory)
+        self.assertEqual(self.rollup_rows(), before)
+        rollups.rebuild()
+        self.assertEqual(self.rollup_rows(), before)
+
+    def test_rerun_after_crash_before_delete(self):
+        with mock.patch.object(QuerySet, 'delete', side_effect=RuntimeError('сбой')):
+            with self.assertRaises(RuntimeError):
+                archive(self.now - timedelta(days=5), directory=self.directory)
+        # Файлы записаны, но без строк AttemptArchive не читаются, а попытки на месте
+        self.assertTrue(list(self.directory.rglob('*.jsonl.gz')))
+        self.assertFalse(AttemptArchive.objects.exists())
+        self.assertEqual(MailingAttempt.objects.count(), 6)
+
+        archive(self.now - timedelta(days=5), directory=self.directory)
+        self.assertEqual(sorted(self.archived_ids()), sorted(self.old[self.owner.pk] + self.old[self.other.pk]))
+        self.assertEqual(list(MailingAttempt.objects.values_list('id', flat=True)), self.recent)
+
+    def test_late_attempt_is_not_deleted_unarchived(self):
+        late = self.now - timedelta(days=20)
+
+        def write_then_commit_late(directory, day, rows):
+            # Попытка с более ранним временем фиксируется после чтения пачки
+            if not MailingAttempt.objects.filter(attempt_time=late).exists():
+                self.attempts(self.mailing, [late])
+            return _write_segment(directory, day, rows)
+
+        with mock.patch('mailing.archive._write_segment', side_effect=write_then_commit_late):
+            archive(self.now - timedelta(days=5), chunk_size=10, directory=self.directory)
+        self.assertEqual(len(self.archived_ids()), 6)
+        self.assertEqual(list(MailingAttempt.objects.values_list('id', flat=True)), self.recent)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_attempt_list_total_excludes_archived(self):
+        self.client.force_login(self.owner)
+        cache.clear()
+        self.assertContains(self.client.get(reverse('mailing:attempt_list')), 'Всего: 4')
+
+        archive(self.now - timedelta(days=5), directory=self.directory)
+        # Попытка за архивные сутки, записанная после переноса, остается в журнале
+        late = self.attempts(self.mailing, [self.now - timedelta(days=10)])
+        rollups.add_attempts(MailingAttempt.objects.filter(pk__in=late).values_list('mailing_id', 'attempt_time', 'status'))
+        cache.clear()
+        response = self.client.get(reverse('mailing:attempt_list'))
+        self.assertContains(response, 'Всего: 2')
+        self.assertEqual(len(response.context['page']), 2)
+
+
+class ExportTests(TestCase):
+    """Потоковая выгрузка клиентов в CSV и JSONL"""
+
+    def setUp(self):
+        self.owner = User.objects.create(email='owner@example.com', username='owner')
+        other = User.objects.create(email='other@example.com', username='other')
+        Client.objects.create(email='other@example.com', full_name='Чужой', owner=other)
+        self.clients = Client.objects.bulk_create(
+            Client(email=f'c{n}@example.com', full_name=f'Клиент {n}', comment=f'Запятая, "кавычки"\nстрока {n}',
+                   owner=self.owner)
+            for n in range(50)
+        )
+
+    def test_csv_streams_in_chunks(self):
+        with mock.patch('mailing.exports.BUFFER_BYTES', 512):
+            chunks = list(export('clients', self.owner, 'csv'))
+        self.assertGreater(len(chunks), 1)
+        rows = list(csv.reader(io.StringIO(b''.join(chunks).decode(), newline='')))
+        self.assertEqual(rows[0], ['email', 'full_name', 'comment', 'created_at'])
+        self.assertEqual([row[0] for row in rows[1:]], [client.email for client in self.clients])
+        self.assertEqual(rows[1][2], 'Запятая, "кавычки"\nстрока 0')
+
+    def test_jsonl(self):
+        lines = b''.join(export('clients', self.owner, 'jsonl')).decode().splitlines()
+        self.assertEqual(len(lines), 50)
+        row = json.loads(lines[0])
+        self.assertEqual(row['full_name'], 'Клиент 0')
+        self.assertEqual(row['created_at'], self.clients[0].created_at.isoformat())
+
+    def test_gzip_is_valid(self):
+        plain = b''.join(export('clients', self.owner, 'jsonl'))
+        with mock.patch('mailing.exports.BUFFER_BYTES', 512):
+            compressed = b''.join(export('clients', self.owner, 'jsonl', compress=True))
+        self.assertEqual(gzip.decompress(compressed), plain)
+
+    def test_view_streams_gzip(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('mailing:client_export'), {'format': 'csv', 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('clients.csv.gz', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), b''.join(export('clients', self.owner)))
+
+    def test_command_writes_to_stdout(self):
+        out = io.BytesIO()
+        call_command('export_data', 'clients', '--owner', self.owner.email, '--format', 'jsonl', '--gzip', stdout=out)
+        self.assertEqual(gzip.decompress(out.getvalue()), b''.join(export('clients', self.owner, 'jsonl')))
+
+
+class ImportTests(TestCase):
+    """Импорт клиентов из строк файла"""
+
+    def setUp(self):
+        self.owner = User.objects.create(email='owner@example.com', username='owner')
+        self.other = User.objects.create(email='other@example.com', username='other')
+        Client.objects.create(email='mine@example.com', full_name='Свой', owner=self.owner)
+        Client.objects.create(email='theirs@example.com', full_name='Чужой', owner=self.other)
+
+    def test_counts(self):
+        rows = [
+            {'email': 'new@example.com', 'full_name': 'Новый'},
+            {'email': 'NEW@example.com ', 'full_name': 'Повтор в файле'},
+            {'email': 'mine@example.com', 'full_name': 'Уже есть'},
+            {'email': 'theirs@example.com', 'full_name': 'Занят'},
+            {'email': 'not-an-email'},
+            None,
+        ]
+        result = import_clients(self.owner, rows)
+        self.assertEqual((result.inserted, result.duplicates, result.taken, result.invalid), (1, 2, 1, 2))
+
+    def test_control_characters_removed(self):
+        rows = [{
+            'email': 'ctl@example.com',
+            'full_name': 'Иван\r\nBcc: spy@example.com\t\x00',
+            'comment': 'первая\r\nвторая\x07',
+        }]
+        import_clients(self.owner, rows)
+        client = Client.objects.get(email='ctl@example.com')
+        self.assertEqual(client.full_name, 'Иван Bcc: spy@example.com')
+        self.assertEqual(client.comment, 'первая\nвторая')
+
+
+class BenchmarkCommandTests(TestCase):
+    """Команда benchmark"""
+
+    def test_json_report_is_captured_and_repeatable(self):
+        for _ in range(2):
+            output = io.StringIO()
+            call_command('benchmark', 'attempts', '--count', '5', '--json', stdout=output)
+            report = json.loads(output.getvalue())
+            self.assertGreater(report['results']['attempts']['buffered_per_sec'], 0)
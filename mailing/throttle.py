@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+
+def email_domain(email):
+    return email.rsplit('@', 1)[-1].lower()
+
+
+class TokenBucket:
+    """Ведро токенов: rate писем в секунду, до burst писем подряд"""
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def reserve(self, now):
+        """Бронирование токена, возвращает момент, с которого письмо можно отправлять"""
+        # Токенов может стать меньше нуля: это очередь уже забронированных писем
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return now
+        return now - self.tokens / self.rate
+
+
+class DomainThrottle:
+    """Ограничение скорости отправки отдельно для каждого почтового домена"""
+
+    def __init__(self, rate=None, burst=None, rates=None, clock=time.monotonic):
+        self.rate = settings.MAILING_DOMAIN_RATE if rate is None else rate
+        self.burst = burst or settings.MAILING_DOMAIN_BURST
+        self.rates = settings.MAILING_DOMAIN_RATES if rates is None else rates
+        # Часы подменяются в тестах; моменты отправки сравниваются с time.monotonic()
+        self.clock = clock
+        self.buckets = {}
+        # Один ограничитель может быть общим для потоков планировщика
+        self._lock = threading.Lock()
+        self.sent = defaultdict(int)
+        self.waits = defaultdict(float)
+        self.max_waits = defaultdict(float)
+
+    def reserve(self, email):
+        """Момент по time.monotonic(), когда можно отправить письмо на этот адрес"""
+        domain = email_domain(email)
+        with self._lock:
+            now = self.clock()
+            self.sent[domain] += 1
+            rate = self.rates.get(domain, self.rate)
+            if not rate:
+                return now
+            bucket = self.buckets.get(domain)
+            if bucket is None:
+                bucket = self.buckets[domain] = TokenBucket(rate, self.burst, now)
+            at = bucket.reserve(now)
+            self.waits[domain] += at - now
+            self.max_waits[domain] = max(self.max_waits[domain], at - now)
+            return at
+
+    def schedule(self, messages):
+        """Порядок отправки пачки: (момент, индекс письма) по возрастанию момента"""
+        # Письма медленного домена ждут своей очереди, письма остальных доменов
+        # встают между ними
+        return sorted((self.reserve(message.to[0]), index) for index, message in enumerate(messages))
+
+    def report(self):
+        """Домены по убыванию ожидания: (домен, писем, среднее и наибольшее ожидание письма в секундах)"""
+        return sorted(
+            (
+                (domain, count, self.waits[domain] / count, self.max_waits[domain])
+                for domain, count in self.sent.items()
+            ),
+            key=lambda row: row[3],
+            reverse=True,
+        )
@@ -9,6 +9,9 @@ urlpatterns = [
     # Клиенты
     path('clients/', views.ClientListView.as_view(), name='client_list'),
     path('clients/create/', views.ClientCreateView.as_view(), name='client_create'),
+    path('clients/import/', views.ClientImportView.as_view(), name='client_import'),
+    path('clients/export/', views.export_data, {'name': 'clients'}, name='client_export'),
+    path('clients/autocomplete/', views.client_autocomplete, name='client_autocomplete'),
     path('clients/<int:pk>/', views.ClientDetailView.as_view(), name='client_detail'),
     path('clients/<int:pk>/update/', views.ClientUpdateView.as_view(), name='client_update'),
     path('clients/<int:pk>/delete/', views.ClientDeleteView.as_view(), name='client_delete'),
@@ -28,6 +31,21 @@ urlpatterns = [
     path('mailings/<int:pk>/delete/', views.MailingDeleteView.as_view(), name='mailing_delete'),
     path('mailings/<int:pk>/send/', views.send_mailing, name='mailing_send'),
     
+    # Сегменты
+    path('segments/', views.SegmentListView.as_view(), name='segment_list'),
+    path('segments/create/', views.SegmentCreateView.as_view(), name='segment_create'),
+    path('segments/<int:pk>/', views.SegmentDetailView.as_view(), name='segment_detail'),
+    path('segments/<int:pk>/update/', views.SegmentUpdateView.as_view(), name='segment_update'),
+    path('segments/<int:pk>/delete/', views.SegmentDeleteView.as_view(), name='segment_delete'),
+
     # Попытки
     path('attempts/', views.AttemptListView.as_view(), name='attempt_list'),
+    path('attempts/stats/', views.AttemptStatsView.as_view(), name='attempt_stats'),
+    path('attempts/export/', views.export_data, {'name': 'attempts'}, name='attempt_export'),
+
+    # Поиск
+    path('search/', views.SearchView.as_view(), name='search'),
+
+    # Профилирование запросов
+    path('profiling/queries/', views.query_log, name='query_log'),
 ]
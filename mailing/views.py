@@ -1,47 +1,119 @@
+import io
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse_lazy
-from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
+from django.db.models import Count, IntegerField, OuterRef, RestrictedError, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, FormView, TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.contrib.auth.decorators import login_required
-from .models import Mailing, Client, Message
-from .forms import MailingForm, ClientForm, MessageForm
+from django.contrib.auth.decorators import login_required, user_passes_test
+from .models import AttemptRollup, Mailing, MailingAttempt, Client, Message, Segment
+from .forms import MailingForm, ClientForm, ClientImportForm, MessageForm, SegmentForm
+from .cache import get_versions
+from .dashboard import get_dashboard
+from .exports import EXPORTS, FORMATS, export, filename
+from .imports import detect_format, import_clients, read_rows
+from .pagination import KeysetPage
+from .profiling import query_budget, recent
+from .search import find_clients, find_messages
+from .rollups import archived_until, mailing_totals, owner_timeline
+
+
+class FragmentCacheMixin:
+    """Ключ для {% cache %}: пользователь и версии данных, от которых зависит страница"""
+    cache_resources = ()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        user_id = self.request.user.pk
+        context['cache_timeout'] = settings.FRAGMENT_CACHE_SECONDS
+        context['cache_version'] = f'{user_id}:{get_versions(user_id, *self.cache_resources)}'
+        return context
+
+
+class KeysetPaginationMixin:
+    """Список по страницам с курсорами ?after=/?before= вместо всего queryset"""
+    keyset_field = 'created_at'
+    show_total = True
+
+    def get_total_count(self):
+        return self.object_list.count()
+
+    def get_context_data(self, **kwargs):
+        page = KeysetPage(
+            self.object_list,
+            settings.LIST_PAGE_SIZE,
+            after=self.request.GET.get('after'),
+            before=self.request.GET.get('before'),
+            field=self.keyset_field,
+        )
+        context = super().get_context_data(object_list=page, **kwargs)
+        context['page'] = page
+        if self.show_total:
+            # Общее число строк считается один раз на версию данных пользователя
+            key = f'count:{self.model._meta.label}:{context["cache_version"]}'
+            context['total_count'] = lambda: cache.get_or_set(key, self.get_total_count, settings.FRAGMENT_CACHE_SECONDS)
+        return context
+
 
 # Упрощенные классы
-class MailingListView(LoginRequiredMixin, ListView):
+class MailingListView(LoginRequiredMixin, KeysetPaginationMixin, FragmentCacheMixin, ListView):
+    query_budget = 4
     model = Mailing
+    cache_resources = ('mailing', 'message', 'client', 'segment')
     template_name = 'mailing/mailing_list.html'
     context_object_name = 'object_list'
     
     def get_queryset(self):
-        return Mailing.objects.filter(owner=self.request.user)
+        # Тема и число получателей берутся тем же запросом, а не отдельным на каждую строку
+        recipients = (
+            Mailing.recipients.through.objects.filter(mailing=OuterRef('pk'))
+            .order_by().values('mailing').annotate(count=Count('pk')).values('count')
+        )
+        return Mailing.objects.filter(owner=self.request.user).select_related('message', 'segment').annotate(
+            recipient_count=Coalesce(Subquery(recipients, output_field=IntegerField()), 0)
+        )
 
-class MailingDetailView(LoginRequiredMixin, DetailView):
+class MailingDetailView(LoginRequiredMixin, FragmentCacheMixin, DetailView):
+    query_budget = 5
     model = Mailing
+    cache_resources = ('mailing', 'message', 'client', 'attempt', 'segment')
     template_name = 'mailing/mailing_detail.html'
     context_object_name = 'mailing'
     
     def get_queryset(self):
-        return Mailing.objects.filter(owner=self.request.user)
+        return Mailing.objects.filter(owner=self.request.user).select_related('message', 'owner', 'segment')
 
-class MailingCreateView(LoginRequiredMixin, CreateView):
+class MailingFormMixin:
     model = Mailing
     form_class = MailingForm
     template_name = 'mailing/mailing_form.html'
     success_url = reverse_lazy('mailing:mailing_list')
+
+    def get_form_kwargs(self):
+        # Сообщения, сегменты и получатели в форме — только свои
+        kwargs = super().get_form_kwargs()
+        kwargs['user'] = self.request.user
+        return kwargs
+
+class MailingCreateView(LoginRequiredMixin, MailingFormMixin, CreateView):
+    query_budget = 4
     
     def form_valid(self, form):
         form.instance.owner = self.request.user
         return super().form_valid(form)
-class MailingUpdateView(LoginRequiredMixin, UpdateView):
-    model = Mailing
-    form_class = MailingForm
-    template_name = 'mailing/mailing_form.html'
-    success_url = reverse_lazy('mailing:mailing_list')
+class MailingUpdateView(LoginRequiredMixin, MailingFormMixin, UpdateView):
+    query_budget = 7
     
     def get_queryset(self):
         return Mailing.objects.filter(owner=self.request.user)
 
 class MailingDeleteView(LoginRequiredMixin, DeleteView):
+    query_budget = 3
     model = Mailing
     template_name = 'mailing/mailing_confirm_delete.html'
     success_url = reverse_lazy('mailing:mailing_list')
@@ -50,16 +122,20 @@ class MailingDeleteView(LoginRequiredMixin, DeleteView):
         return Mailing.objects.filter(owner=self.request.user)
 
 # Клиенты
-class ClientListView(LoginRequiredMixin, ListView):
+class ClientListView(LoginRequiredMixin, KeysetPaginationMixin, FragmentCacheMixin, ListView):
+    query_budget = 4
     model = Client
+    cache_resources = ('client',)
     template_name = 'mailing/client_list.html'
     context_object_name = 'object_list'
     
     def get_queryset(self):
         return Client.objects.filter(owner=self.request.user)
 
-class ClientDetailView(LoginRequiredMixin, DetailView):
+class ClientDetailView(LoginRequiredMixin, FragmentCacheMixin, DetailView):
+    query_budget = 4
     model = Client
+    cache_resources = ('client', 'mailing', 'message')
     template_name = 'mailing/client_detail.html'
     context_object_name = 'client'
     
@@ -67,6 +143,7 @@ class ClientDetailView(LoginRequiredMixin, DetailView):
         return Client.objects.filter(owner=self.request.user)
 
 class ClientCreateView(LoginRequiredMixin, CreateView):
+    query_budget = 2
     model = Client
     form_class = ClientForm
     template_name = 'mailing/client_form.html'
@@ -76,6 +153,7 @@ class ClientCreateView(LoginRequiredMixin, CreateView):
         form.instance.owner = self.request.user
         return super().form_valid(form)
 class ClientUpdateView(LoginRequiredMixin, UpdateView):
+    query_budget = 3
     model = Client
     form_class = ClientForm
     template_name = 'mailing/client_form.html'
@@ -84,7 +162,26 @@ class ClientUpdateView(LoginRequiredMixin, UpdateView):
     def get_queryset(self):
         return Client.objects.filter(owner=self.request.user)
 
+class ClientImportView(LoginRequiredMixin, FormView):
+    query_budget = 2
+    form_class = ClientImportForm
+    template_name = 'mailing/client_import.html'
+    success_url = reverse_lazy('mailing:client_list')
+
+    def form_valid(self, form):
+        upload = form.cleaned_data['file']
+        # Файл читается построчно, большой файл Django держит во временном файле, а не в памяти
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        result = import_clients(self.request.user, read_rows(stream, detect_format(upload.name)))
+        messages.success(
+            self.request,
+            f'Добавлено {result.inserted}, повторов {result.duplicates}, '
+            f'занято другими пользователями {result.taken}, некорректных {result.invalid}',
+        )
+        return super().form_valid(form)
+
 class ClientDeleteView(LoginRequiredMixin, DeleteView):
+    query_budget = 3
     model = Client
     template_name = 'mailing/client_confirm_delete.html'
     success_url = reverse_lazy('mailing:client_list')
@@ -93,22 +190,27 @@ class ClientDeleteView(LoginRequiredMixin, DeleteView):
         return Client.objects.filter(owner=self.request.user)
 
 # Сообщения
-class MessageListView(LoginRequiredMixin, ListView):
+class MessageListView(LoginRequiredMixin, KeysetPaginationMixin, FragmentCacheMixin, ListView):
+    query_budget = 4
     model = Message
+    cache_resources = ('message',)
     template_name = 'mailing/message_list.html'
     context_object_name = 'object_list'
     
     def get_queryset(self):
         return Message.objects.filter(owner=self.request.user)
 
-class MessageDetailView(LoginRequiredMixin, DetailView):
+class MessageDetailView(LoginRequiredMixin, FragmentCacheMixin, DetailView):
+    query_budget = 4
     model = Message
+    cache_resources = ('message', 'mailing')
     template_name = 'mailing/message_detail.html'
     context_object_name = 'message'
     
     def get_queryset(self):
         return Message.objects.filter(owner=self.request.user)
 class MessageCreateView(LoginRequiredMixin, CreateView):
+    query_budget = 2
     model = Message
     form_class = MessageForm
     template_name = 'mailing/message_form.html'
@@ -119,6 +221,7 @@ class MessageCreateView(LoginRequiredMixin, CreateView):
         return super().form_valid(form)
 
 class MessageUpdateView(LoginRequiredMixin, UpdateView):
+    query_budget = 3
     model = Message
     form_class = MessageForm
     template_name = 'mailing/message_form.html'
@@ -128,6 +231,7 @@ class MessageUpdateView(LoginRequiredMixin, UpdateView):
         return Message.objects.filter(owner=self.request.user)
 
 class MessageDeleteView(LoginRequiredMixin, DeleteView):
+    query_budget = 3
     model = Message
     template_name = 'mailing/message_confirm_delete.html'
     success_url = reverse_lazy('mailing:message_list')
@@ -135,42 +239,235 @@ class MessageDeleteView(LoginRequiredMixin, DeleteView):
     def get_queryset(self):
         return Message.objects.filter(owner=self.request.user)
 
+# Сегменты
+class SegmentListView(LoginRequiredMixin, KeysetPaginationMixin, FragmentCacheMixin, ListView):
+    query_budget = 4
+    model = Segment
+    cache_resources = ('segment',)
+    template_name = 'mailing/segment_list.html'
+    context_object_name = 'object_list'
+
+    def get_queryset(self):
+        return Segment.objects.filter(owner=self.request.user)
+
+class SegmentDetailView(LoginRequiredMixin, FragmentCacheMixin, DetailView):
+    query_budget = 6
+    model = Segment
+    # Условия сегмента зависят от клиентов, поэтому в ключе и их версия
+    cache_resources = ('segment', 'client', 'mailing')
+    template_name = 'mailing/segment_detail.html'
+    context_object_name = 'segment'
+    sample_size = 20
+
+    def get_queryset(self):
+        return Segment.objects.filter(owner=self.request.user)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        clients = self.object.get_clients()
+        # Запросы выполняются при промахе кеша фрагмента
+        context['client_count'] = clients.count
+        context['sample'] = lambda: clients.order_by('id')[:self.sample_size]
+        context['mailings'] = lambda: self.object.mailings.select_related('message').order_by('-id')[:self.sample_size]
+        return context
+
+class SegmentFormMixin:
+    model = Segment
+    form_class = SegmentForm
+    template_name = 'mailing/segment_form.html'
+    success_url = reverse_lazy('mailing:segment_list')
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['user'] = self.request.user
+        return kwargs
+
+class SegmentCreateView(LoginRequiredMixin, SegmentFormMixin, CreateView):
+    query_budget = 2
+
+    def form_valid(self, form):
+        form.instance.owner = self.request.user
+        return super().form_valid(form)
+
+class SegmentUpdateView(LoginRequiredMixin, SegmentFormMixin, UpdateView):
+    query_budget = 5
+
+    def get_queryset(self):
+        return Segment.objects.filter(owner=self.request.user)
+
+class SegmentDeleteView(LoginRequiredMixin, DeleteView):
+    query_budget = 3
+    model = Segment
+    template_name = 'mailing/segment_confirm_delete.html'
+    success_url = reverse_lazy('mailing:segment_list')
+
+    def get_queryset(self):
+        return Segment.objects.filter(owner=self.request.user)
+
+    def form_valid(self, form):
+        try:
+            return super().form_valid(form)
+        except RestrictedError:
+            messages.error(self.request, 'Сегмент используется в рассылках, сначала смените им сегмент')
+            return redirect('mailing:segment_detail', pk=self.object.pk)
+
 # Попытки
-class AttemptListView(LoginRequiredMixin, ListView):
+class AttemptListView(LoginRequiredMixin, KeysetPaginationMixin, FragmentCacheMixin, ListView):
+    # Два запроса общего числа — граница архива и счет журнала за архивные сутки
+    query_budget = 6
+    model = MailingAttempt
+    keyset_field = 'attempt_time'
+    cache_resources = ('attempt', 'mailing', 'message')
     template_name = 'mailing/attempt_list.html'
     context_object_name = 'object_list'
     
     def get_queryset(self):
-        return []
-# Главная страница - УПРОЩЕННАЯ ВЕРСИЯ
+        return MailingAttempt.objects.filter(mailing__owner=self.request.user).select_related('mailing__message', 'client')
+
+    def get_total_count(self):
+        # Число попыток берется из суточных сводок, журнал не пересчитывается. Сводки архивных
+        # суток считают и перенесенные попытки, поэтому за эти сутки считается сам журнал:
+        # в нем остаются только попытки, не попавшие в архив
+        rollups = AttemptRollup.objects.filter(owner=self.request.user, period='day')
+        since = archived_until()
+        live = 0
+        if since is not None:
+            rollups = rollups.filter(bucket__gte=since)
+            live = self.get_queryset().filter(attempt_time__lt=since).count()
+        totals = rollups.aggregate(success=Sum('success_count'), failure=Sum('failure_count'))
+        return (totals['success'] or 0) + (totals['failure'] or 0) + live
+
+class AttemptStatsView(LoginRequiredMixin, FragmentCacheMixin, TemplateView):
+    query_budget = 4
+    cache_resources = ('attempt', 'message')
+    template_name = 'mailing/attempt_stats.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        period = 'hour' if self.request.GET.get('period') == 'hour' else 'day'
+        count = settings.ATTEMPT_STATS_HOURS if period == 'hour' else settings.ATTEMPT_STATS_DAYS
+        user = self.request.user
+        # Только сводки; запросы выполняются при промахе кеша фрагмента
+        context['period'] = period
+        context['period_count'] = count
+        context['timeline'] = lambda: owner_timeline(user, period, count)
+        context['mailing_totals'] = lambda: mailing_totals(user)
+        return context
+# Главная страница
+@query_budget(4)
 def home(request):
     if not request.user.is_authenticated:
         return render(request, 'mailing/home.html')
-    
-    # Явно получаем данные
-    mailings = list(Mailing.objects.filter(owner=request.user))
-    clients_count = Client.objects.filter(owner=request.user).count()
-    active_count = Mailing.objects.filter(owner=request.user, status='started').count()
-    
-    # Выводим в консоль для отладки
-    print("="*50)
-    print(f"USER: {request.user.email}")
-    print(f"MAILINGS FOUND: {len(mailings)}")
-    for m in mailings:
-        print(f"  - Mailing {m.id}: {m.message.subject}, status={m.status}")
-    print(f"CLIENTS: {clients_count}")
-    print(f"ACTIVE: {active_count}")
-    print("="*50)
-    
-    context = {
-        'total_mailings': len(mailings),
-        'active_mailings': active_count,
-        'total_clients': clients_count,
-        'user_mailings': mailings,
-    }
-    
+
+    # Счетчики одним запросом и последние рассылки, с кешем на пользователя
+    context = get_dashboard(request.user)
     return render(request, 'mailing/home.html', context)
 @login_required
+def export_data(request, name):
+    """Потоковая выгрузка клиентов или попыток пользователя в CSV или JSONL, ?gzip=1 — со сжатием"""
+    fmt = request.GET.get('format', 'csv')
+    if name not in EXPORTS or fmt not in FORMATS:
+        raise Http404
+    compress = request.GET.get('gzip') == '1'
+    content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(
+        export(name, request.user, fmt, compress),
+        content_type='application/gzip' if compress else f'{content_type}; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename(name, fmt, compress)}"'
+    return response
+
+def _prefix(field, value):
+    # Начало строки ищется диапазоном [value, value + максимальный символ): так условие
+    # идет по индексу при любой базе, в отличие от LIKE
+    return Q(**{f'{field}__gte': value, f'{field}__lt': value + '\U0010ffff'})
+
+def _search_steps(query):
+    """Поиск по началу строки: (поле, начало) в порядке выдачи, сначала email, затем Ф.И.О."""
+    if not query:
+        return [('email', '')]
+    # Email хранится в нижнем регистре; Ф.И.О. сравнивается с учетом регистра,
+    # первая буква — и строчной, и заглавной
+    names = sorted({query, query[:1].upper() + query[1:]})
+    return [('email', query.lower())] + [('full_name', name) for name in names]
+
+def search_clients(owner, query, cursor=None, limit=None):
+    """Страница клиентов владельца, у которых email или Ф.И.О. начинается с query, и курсор следующей"""
+    # Каждый шаг — диапазон одного индекса, (owner, email) или (owner, full_name), в порядке
+    # этого индекса, поэтому страница читается без сортировки совпадений. Курсор — шаг,
+    # значение поля и id последнего клиента
+    limit = limit or settings.AUTOCOMPLETE_PAGE_SIZE
+    steps = _search_steps(query.strip())
+    start, after = 0, None
+    if cursor:
+        step, rest = cursor.split('|', 1)
+        value, pk = rest.rsplit('|', 1)
+        start, after = int(step), (value, int(pk))
+    page = []
+    for index in range(start, len(steps)):
+        field, prefix = steps[index]
+        clients = Client.objects.filter(_prefix(field, prefix), owner=owner)
+        # Клиенты, совпавшие на прошлых шагах, уже выданы
+        for earlier in steps[:index]:
+            clients = clients.exclude(_prefix(*earlier))
+        if index == start and after:
+            value, pk = after
+            clients = clients.filter(**{f'{field}__gte': value}).filter(
+                Q(**{f'{field}__gt': value}) | Q(**{field: value, 'id__gt': pk})
+            )
+        rows = clients.order_by(field, 'id').values_list('id', 'full_name', 'email')[:limit + 1 - len(page)]
+        page += [(index, field, row) for row in rows]
+        if len(page) > limit:
+            index, field, row = page[limit - 1]
+            value = row[1] if field == 'full_name' else row[2]
+            return [row for _, _, row in page[:limit]], f'{index}|{value}|{row[0]}'
+    return [row for _, _, row in page], None
+
+@query_budget(5)
+@login_required
+def client_autocomplete(request):
+    """Подсказки клиентов для поля выбора получателей: страница results и курсор next"""
+    try:
+        rows, cursor = search_clients(request.user, request.GET.get('q', ''), request.GET.get('after'))
+    except ValueError:
+        raise Http404
+    return JsonResponse({
+        'results': [{'id': pk, 'text': f'{full_name} ({email})'} for pk, full_name, email in rows],
+        'next': cursor,
+    })
+
+class SearchView(LoginRequiredMixin, TemplateView):
+    """Полнотекстовый поиск по клиентам и сообщениям пользователя"""
+    # Без in — первые страницы обоих разделов, с in — следующая страница одного раздела
+    query_budget = 6
+    template_name = 'mailing/search.html'
+    sections = {'clients': find_clients, 'messages': find_messages}
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        query = self.request.GET.get('q', '').strip()
+        section = self.request.GET.get('in')
+        if section is not None and section not in self.sections:
+            raise Http404
+        context.update(query=query, section=section)
+        if not query:
+            return context
+        for name, find in self.sections.items():
+            if section in (None, name):
+                try:
+                    context[f'{name}_found'], context[f'{name}_next'] = find(
+                        self.request.user, query, self.request.GET.get('after') if section else None
+                    )
+                except ValueError:
+                    raise Http404
+        return context
+
+@user_passes_test(lambda user: user.is_staff)
+def query_log(request):
+    """Журнал профилирования последних ответов процесса, новые первыми"""
+    return JsonResponse({'requests': list(reversed(recent()))}, json_dumps_params={'ensure_ascii': False})
+
+@login_required
 def send_mailing(request, pk):
     mailing = get_object_or_404(Mailing, pk=pk, owner=request.user)
     from django.contrib import messages
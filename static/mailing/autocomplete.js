@@ -0,0 +1,83 @@
+// Поле выбора клиентов: варианты подгружаются с сервера по мере ввода,
+// выбранные клиенты хранятся в исходном <select multiple> и уходят с формой
+document.addEventListener('DOMContentLoaded', function () {
+    document.querySelectorAll('select[data-autocomplete-url]').forEach(function (select) {
+        var url = select.dataset.autocompleteUrl;
+        var chips = document.createElement('div');
+        var input = document.createElement('input');
+        var list = document.createElement('div');
+        var more = document.createElement('button');
+        var next = null;
+        var timer = null;
+
+        select.hidden = true;
+        chips.className = 'mb-2';
+        input.type = 'search';
+        input.className = 'form-control';
+        input.placeholder = 'Начните вводить email или имя';
+        list.className = 'list-group';
+        more.type = 'button';
+        more.className = 'btn btn-sm btn-link';
+        more.textContent = 'Показать еще';
+        more.hidden = true;
+        select.after(chips, input, list, more);
+
+        function renderChips() {
+            chips.innerHTML = '';
+            Array.from(select.selectedOptions).forEach(function (option) {
+                var chip = document.createElement('span');
+                chip.className = 'badge bg-secondary me-1';
+                chip.textContent = option.textContent + ' ×';
+                chip.style.cursor = 'pointer';
+                chip.addEventListener('click', function () {
+                    option.remove();
+                    renderChips();
+                });
+                chips.append(chip);
+            });
+        }
+
+        function choose(result) {
+            if (!select.querySelector('option[value="' + result.id + '"]')) {
+                select.append(new Option(result.text, result.id, true, true));
+            }
+            renderChips();
+        }
+
+        function load(append) {
+            var params = new URLSearchParams({q: input.value});
+            if (append && next) {
+                params.set('after', next);
+            }
+            fetch(url + '?' + params, {headers: {'X-Requested-With': 'XMLHttpRequest'}})
+                .then(function (response) { return response.json(); })
+                .then(function (data) {
+                    if (!append) {
+                        list.innerHTML = '';
+                    }
+                    data.results.forEach(function (result) {
+                        var item = document.createElement('button');
+                        item.type = 'button';
+                        item.className = 'list-group-item list-group-item-action';
+                        item.textContent = result.text;
+                        item.addEventListener('click', function () { choose(result); });
+                        list.append(item);
+                    });
+                    next = data.next;
+                    more.hidden = !next;
+                });
+        }
+
+        input.addEventListener('input', function () {
+            clearTimeout(timer);
+            timer = setTimeout(function () { load(false); }, 250);
+        });
+        input.addEventListener('focus', function () {
+            if (!list.children.length) {
+                load(false);
+            }
+        });
+        more.addEventListener('click', function () { load(true); });
+        renderChips();
+    });
+});